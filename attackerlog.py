@@ -0,0 +1,142 @@
+### recorder of the attacker state: one small fixed-size record per event in a ring buffer appended in batches to a binary
+### file, the DOT snapshots of the private and the global chain are rendered afterwards only for the chosen times
+
+import os
+import argparse
+import numpy as np
+
+EVENTS_PATH = "malicious_events/attacker_events.bin" # default file of the records, relative to the working directory
+RING_SIZE = 4096 # records kept in memory before a batch is appended to the file
+
+# state of the attacker after each event: lead over the public chain, number of unreleased blocks, store indices of the
+# private and the public chain heads, and the block of the event (-1 for a mining round)
+RECORD = np.dtype([("time", "<f8"), ("kind", "u1"), ("lead", "<i4"), ("private_len", "<i4"),
+                   ("private_head", "<i8"), ("public_head", "<i8"), ("block", "<i8")])
+KINDS = ("round", "private", "release", "public") # start of a mining round, private block mined, block released, public head moved
+ROUND, PRIVATE, RELEASE, PUBLIC = range(len(KINDS))
+
+# Class keeping the records of one attacker, without a path the ring keeps only the latest RING_SIZE records
+class AttackerRecorder:
+    def __init__(self, path=EVENTS_PATH, size=RING_SIZE):
+        self.path = path
+        self.ring = np.zeros(size, dtype=RECORD)
+        self.pos = 0 # next slot of the ring
+        self.wrapped = False # the ring has overwritten old records (only without a path)
+        self.started = False # the file has been created by this recorder
+        self.flushed = 0 # records appended to the file so far
+
+    def record(self, tm, kind, lead, private_len, private_head, public_head, block=-1):
+        self.ring[self.pos] = (tm, kind, lead, private_len, private_head, public_head, block)
+        self.pos += 1
+        if self.pos == len(self.ring):
+            if self.path is None:
+                self.pos, self.wrapped = 0, True
+            else:
+                self.flush()
+
+    # records held in memory, oldest first
+    def records(self):
+        if self.wrapped:
+            return np.concatenate((self.ring[self.pos:], self.ring[:self.pos]))
+        return self.ring[:self.pos].copy()
+
+    # append the records held in memory to the file (the file is recreated by the first batch of a run)
+    def flush(self):
+        if self.path is None or not self.pos:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab" if self.started else "wb") as f:
+            self.ring[:self.pos].tofile(f)
+        self.started = True
+        self.flushed += self.pos
+        self.pos = 0
+
+    # bring the recorder back to a saved state: the records held in memory, the number of records already in the file
+    # and whether the file was created, the file is cut back to the records written before the save
+    def restore(self, records, flushed, started):
+        if len(records) > len(self.ring):
+            raise Exception(f"{len(records)} saved attacker records do not fit in a ring of {len(self.ring)}")
+        if self.path is not None and started:
+            size = flushed*RECORD.itemsize
+            if not os.path.exists(self.path) or os.path.getsize(self.path) < size:
+                raise Exception(f"{self.path} has fewer than the {flushed} attacker records of the checkpoint")
+            os.truncate(self.path, size)
+        self.started, self.flushed = started, flushed
+        self.ring[:len(records)] = records
+        self.wrapped = self.path is None and len(records) == len(self.ring)
+        self.pos = 0 if self.wrapped else len(records)
+
+    # copy the records already appended to the file into the file path (e.g. the warm-up of a branch)
+    def copy_to(self, path):
+        if self.started:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            np.fromfile(self.path, dtype=RECORD, count=self.flushed).tofile(path)
+
+    # append the next records to the file path instead, after the records written so far
+    def move_to(self, path):
+        if path is not None and path != self.path:
+            self.copy_to(path)
+        self.path = path
+
+# records of a file written by the recorder
+def read_records(path=EVENTS_PATH):
+    return np.fromfile(path, dtype=RECORD)
+
+# blocks of the private chain in a record: the last private_len blocks of the chain ending at private_head
+def private_chain(tree, rec):
+    blocks, idx = [], int(rec["private_head"])
+    for _ in range(int(rec["private_len"])):
+        blocks.append(idx)
+        idx = int(tree.parent[idx])
+    return blocks[::-1]
+
+# DOT text of the private chain in a record
+def private_dot(tree, rec):
+    blocks = private_chain(tree, rec)
+    return ("digraph unix {\nsize=\"7,5\"; \n node [color=goldenrod2, style=filled];\n" +
+            "\n".join(f'"{blocks[i]}" -> "{blocks[i+1]}";' for i in range(len(blocks)-1)) + "\n}")
+
+# DOT text of the tree known to the attacker at record pos, the blocks it releases later at the same time are left out
+def global_dot(tree, node, records, pos):
+    tm = records["time"][pos]
+    later = records[pos+1:]
+    hidden = set(later["block"][(later["kind"] == RELEASE) & (later["time"] == tm)].tolist())
+    edges = [(p, c, pt, ct) for p, c, pt, ct in tree.edges(node) if ct <= tm and c not in hidden]
+    return ("digraph unix {\nsize=\"7,5\"; \n node [color=goldenrod2, style=filled];\n" +
+            "\n".join(f'"{p}(Ta={pt:.3f};By: {tree.miner_str(p)})" -> "{c}(Ta={ct:.3f};By: {tree.miner_str(c)})";' for p, c, pt, ct in edges) + "\n}")
+
+# write the snapshots of the mining rounds at the given times (every round if times is None) into directory, with
+# the file names of the per-round snapshots of earlier versions (a later round at the same time replaces the file)
+def render(records, tree, node, directory, times=None):
+    os.makedirs(directory, exist_ok=True)
+    rounds = np.flatnonzero(records["kind"] == ROUND)
+    if times is not None:
+        # the last round at or before each chosen time
+        last = np.searchsorted(records["time"][rounds], times, side="right") - 1
+        rounds = rounds[np.unique(last[last >= 0])]
+    for pos in rounds.tolist():
+        name = str(records["time"][pos].item()) if records["time"][pos] else "0"
+        with open(os.path.join(directory, "private_chain" + name), "w") as f:
+            f.write(private_dot(tree, records[pos]))
+        with open(os.path.join(directory, "global_chain" + name), "w") as f:
+            f.write(global_dot(tree, node, records, pos))
+    return len(rounds)
+
+# function to get the input arguments
+def fetch_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", default=EVENTS_PATH) # records of the attacker
+    parser.add_argument("--trees", default=OUTPUT_PATH) # deduplicated output of the same run (main.py --outputs npz)
+    parser.add_argument("--node", type=int, default=None) # node of the attacker, the last node by default
+    parser.add_argument("--times", type=float, nargs="*", default=None) # every mining round if not given
+    parser.add_argument("--out", default="malicious_events")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from output import TreeOutput, OUTPUT_PATH # output imports peer, which imports this module
+    args = fetch_args()
+    tree = TreeOutput(args.trees)
+    node = int(tree.nodes[-1]) if args.node is None else args.node
+    count = render(read_records(args.events), tree, node, args.out, args.times)
+    print(f"{count} snapshots written to {args.out}")
@@ -0,0 +1,159 @@
+### simulator-wide storage of the block tree shared by all the peers
+
+import numpy as np
+
+INITIAL_CAPACITY = 1024 # initial number of slots in the growable arrays
+
+# grow a numpy array to at least the given size (doubling the capacity)
+def grow(arr, size, fill=0):
+    if size <= len(arr):
+        return arr
+    new_cap = max(size, 2*len(arr))
+    new_arr = np.full(new_cap, fill, dtype=arr.dtype)
+    new_arr[:len(arr)] = arr
+    return new_arr
+
+# Class storing every block of the simulation exactly once, it is also the registry of the blocks: each block gets a
+# dense index in mining order on first sighting, with hash -> index and index -> block lookups in O(1)
+class BlockStore:
+    def __init__(self):
+        self.size = 0 # number of slots in the store (the number of blocks once every slot is filled)
+        self.parent = np.full(INITIAL_CAPACITY, -1, dtype=np.int64) # index of the parent block (-1 for genesis)
+        self.height = np.zeros(INITIAL_CAPACITY, dtype=np.int64) # height of the block in the tree
+        self.blocks = [] # index to block object
+        self.hash_to_idx = {} # block hash to index
+        self.jumps = [] # jumps[k][idx] is the ancestor 2^k levels above idx (the genesis block points to itself)
+        self.reserved = None # slot of the next new block instead of the next free one (set by the parallel engine)
+
+    # add a block to the store (if not already present) and return its index, a block can also be placed at a
+    # given free slot: the parallel engine numbers the blocks by their global mining order, so the blocks of
+    # the other worker processes fill the slots later (the skipped slots are never read in the meantime)
+    def add(self, blk, idx=None):
+        known = self.hash_to_idx.get(blk.get_id())
+        if known is not None:
+            return known
+        if idx is None:
+            idx = self.size if self.reserved is None else self.reserved
+            self.reserved = None
+        self.parent = grow(self.parent, idx+1, -1)
+        self.height = grow(self.height, idx+1)
+        parent_idx = self.hash_to_idx.get(blk.prev_hash, -1)
+        self.parent[idx] = parent_idx
+        self.height[idx] = 0 if parent_idx < 0 else self.height[parent_idx] + 1
+        if idx >= len(self.blocks):
+            self.blocks.extend([None]*(idx+1-len(self.blocks)))
+        self.blocks[idx] = blk
+        self.hash_to_idx[blk.get_id()] = idx
+        self.size = max(self.size, idx+1)
+        self.add_jumps(idx, idx if parent_idx < 0 else parent_idx)
+        return idx
+
+    # fill the jump pointers of a new block, adding a level once the tree gets deep enough
+    def add_jumps(self, idx, parent_idx):
+        if not self.jumps or self.height[idx] >= 1 << len(self.jumps):
+            self.add_level()
+        ancestor = parent_idx
+        for k, level in enumerate(self.jumps):
+            if len(level) <= idx:
+                self.jumps[k] = level = grow(level, idx+1)
+            level[idx] = ancestor
+            ancestor = level[ancestor]
+
+    # add one more level of jump pointers computed from the previous level
+    def add_level(self):
+        if not self.jumps:
+            self.jumps.append(np.zeros(len(self.parent), dtype=np.int64))
+            return
+        prev = self.jumps[-1]
+        level = np.zeros(len(prev), dtype=np.int64)
+        level[:self.size-1] = prev[prev[:self.size-1]]
+        self.jumps.append(level)
+
+    # get the index of a block from its hash (None if unknown)
+    def index(self, blk_hash):
+        return self.hash_to_idx.get(blk_hash)
+
+    # get the block object from its index
+    def block(self, idx):
+        return self.blocks[idx]
+
+    # number of blocks mined so far (every block but the genesis block)
+    def num_mined(self):
+        return self.size - 1
+
+    # ancestor of a block at the given height in O(log depth)
+    def ancestor_at(self, idx, h):
+        diff = int(self.height[idx]) - h
+        k = 0
+        while diff:
+            if diff & 1:
+                idx = self.jumps[k][idx]
+            diff >>= 1
+            k += 1
+        return int(idx)
+
+    # check if a block is an ancestor of (or is) the block head_idx
+    def in_chain(self, idx, head_idx):
+        h = int(self.height[idx])
+        return h <= self.height[head_idx] and self.ancestor_at(head_idx, h) == idx
+
+    # lowest common ancestor of two blocks in O(log depth)
+    def lca(self, a, b):
+        h = min(self.height[a], self.height[b])
+        a, b = self.ancestor_at(a, h), self.ancestor_at(b, h)
+        if a == b:
+            return a
+        for level in reversed(self.jumps):
+            if level[a] != level[b]:
+                a, b = level[a], level[b]
+        return int(self.jumps[0][a])
+
+    # indices of the blocks after ancestor up to idx (inclusive) in chain order
+    def path(self, ancestor, idx):
+        blocks = []
+        while idx != ancestor:
+            blocks.append(idx)
+            idx = self.parent[idx]
+        blocks.reverse()
+        return blocks
+
+    # get the height of a block from its hash
+    def height_of(self, blk_hash):
+        return int(self.height[self.hash_to_idx[blk_hash]])
+
+# Class storing the compact per-peer view of the shared block store
+class PeerView:
+    def __init__(self, store):
+        self.store = store
+        self.known = np.zeros(INITIAL_CAPACITY // 8, dtype=np.uint8) # bitset of the blocks known to the peer
+        self.arrival = np.full(INITIAL_CAPACITY, np.nan) # arrival time of the blocks at the peer
+        self.order = np.zeros(INITIAL_CAPACITY, dtype=np.int64) # indices of the known blocks in arrival order
+        self.count = 0 # number of known blocks
+
+    # check if the peer knows the block with the given index
+    def knows(self, idx):
+        byte = idx >> 3
+        return byte < len(self.known) and bool(self.known[byte] & (1 << (idx & 7)))
+
+    # check if the peer knows the block with the given hash
+    def knows_hash(self, blk_hash):
+        idx = self.store.index(blk_hash)
+        return idx is not None and self.knows(idx)
+
+    # mark a block as known to the peer with its arrival time
+    def add(self, idx, tm):
+        self.known = grow(self.known, (idx >> 3) + 1)
+        self.arrival = grow(self.arrival, idx+1, np.nan)
+        self.order = grow(self.order, self.count+1)
+        self.known[idx >> 3] |= 1 << (idx & 7)
+        self.arrival[idx] = tm
+        self.order[self.count] = idx
+        self.count += 1
+
+    # arrival time of a block at the peer
+    def time_of(self, idx):
+        return self.arrival[idx]
+
+    # indices of the known blocks in the order the peer received them
+    def known_blocks(self):
+        return self.order[:self.count]
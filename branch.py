@@ -0,0 +1,134 @@
+### branching of a warmed-up simulation into children that continue with different attackers
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from checkpoint import save_checkpoint, load_checkpoint
+from attackerlog import EVENTS_PATH
+
+BRANCH_DIR = "branch_{index}" # output directory of each branch (the attacker writes its event file there)
+
+# default result of a finished branch
+def summary(sim):
+    return sim.summary()
+
+# run the simulation once up to time at, then continue it once per variant {"malicious_type": t, "malicious_power": p}
+# and return result(sim) of every branch in variant order. The branches share the warmed-up state copy-on-write
+# through os.fork, without fork they are resumed from a checkpoint built by factory() (needs the mining scheduler)
+def run_branches(sim, at, variants, result=summary, workdir=BRANCH_DIR, factory=None, max_children=None):
+    sim.start_processes()
+    sim.env.run(until=at)
+    if hasattr(os, "fork"):
+        return fork_branches(sim, variants, result, workdir, max_children or os.cpu_count() or 1)
+    if factory is None:
+        raise Exception("Branching without os.fork needs a factory building the simulator")
+    return checkpoint_branches(sim, variants, result, workdir, factory)
+
+# file of the attacker events of a branch, it starts with the events of the warm-up
+def branch_events(workdir, index):
+    return os.path.join(workdir.format(index=index), EVENTS_PATH)
+
+# continue the simulation with the attacker of the variant, its events go to the directory of the branch
+def run_variant(sim, index, variant, workdir):
+    sim.set_events_path(branch_events(workdir, index))
+    sim.set_attacker(variant.get("malicious_type"), variant.get("malicious_power"))
+    sim.run()
+
+# one child process per branch, at most max_children at a time, results come back as json through a pipe
+def fork_branches(sim, variants, result, workdir, max_children):
+    results = [None]*len(variants)
+    running = {} # pid of the child to (index of the variant, read end of its pipe)
+    for index, variant in enumerate(variants):
+        if len(running) >= max_children:
+            collect_branch(running, results)
+        sim.log.flush() # the child would write the buffered records a second time
+        sys.stdout.flush()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 0
+            try:
+                run_variant(sim, index, variant, workdir)
+                payload = json.dumps(result(sim))
+            except BaseException as e:
+                payload, status = json.dumps({"error": repr(e)}), 1
+            with os.fdopen(write_fd, "w") as f:
+                f.write(payload)
+            sim.log.flush()
+            sys.stdout.flush()
+            os._exit(status)
+        os.close(write_fd)
+        running[pid] = (index, read_fd)
+    while running:
+        collect_branch(running, results)
+    return results
+
+# wait for the oldest running branch and store its result
+def collect_branch(running, results):
+    pid = next(iter(running))
+    index, read_fd = running.pop(pid)
+    with os.fdopen(read_fd) as f:
+        payload = json.loads(f.read()) # read before waiting so that a large result cannot block the child
+    _, status = os.waitpid(pid, 0)
+    if status != 0:
+        raise Exception(f"Branch {index} failed: {payload.get('error') if isinstance(payload, dict) else status}")
+    results[index] = payload
+
+# branches resumed one after the other from a checkpoint of the warmed-up simulation
+def checkpoint_branches(sim, variants, result, workdir, factory):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "warmup.npz")
+        save_checkpoint(sim, path)
+        for index, variant in enumerate(variants):
+            events = branch_events(workdir, index)
+            sim.peer_list[-1].recorder.copy_to(events) # the checkpoint continues the events already in the file
+            child = factory()
+            child.set_events_path(events)
+            # the attacker is set before the restore, so the restored processes start with the new hashing power
+            child.set_attacker(variant.get("malicious_type"), variant.get("malicious_power"))
+            load_checkpoint(child, path)
+            child.run()
+            results.append(result(child))
+    return results
+
+# function to get the input arguments
+def fetch_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--z0", type=float, default=0.5)
+    parser.add_argument("--z1", type=float, default=0.5)
+    parser.add_argument("--n", type=int, default=10)
+    parser.add_argument("--simtime", type=int, default=10000)
+    parser.add_argument("--at", type=float, required=True) # end of the shared warm-up
+    parser.add_argument("--malicious_type", type=int, nargs="+", choices=[0, 1], default=[0, 1]) # 0 selfish, 1 stubborn
+    parser.add_argument("--malicious_power", type=float, nargs="+", default=[0.3])
+    parser.add_argument("--zeta", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=73)
+    parser.add_argument("--topology", choices=["regular", "ws", "geo", "degree"], default="regular")
+    parser.add_argument("--mining", choices=["process", "scheduler"], default="scheduler")
+    parser.add_argument("--out", default="branch_results.jsonl") # one line per variant
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import peer
+    from graph import Graph
+    from simulator import Simulator
+    args = fetch_args()
+    peer.TOTAL_NODES = args.n
+    variants = [{"malicious_type": t, "malicious_power": p} for t in args.malicious_type for p in args.malicious_power]
+
+    # the warm-up runs with the first variant, every branch then switches to its own attacker
+    def factory():
+        grph = Graph(args)
+        grph.create_graph(add_malicious=True, zeta=args.zeta)
+        return Simulator(args, grph, add_malicious=True, malicious_power=variants[0]["malicious_power"], mining=args.mining,
+                         seed=args.seed, malicious_type=variants[0]["malicious_type"])
+
+    results = run_branches(factory(), args.at, variants, factory=factory)
+    with open(args.out, "w") as f:
+        for variant, res in zip(variants, results):
+            f.write(json.dumps({"variant": variant, "result": res}, sort_keys=True) + "\n")
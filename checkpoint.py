@@ -0,0 +1,257 @@
+### compact binary checkpoints of a running simulation, every piece of state is flattened into numpy arrays of one .npz file
+
+import os
+import json
+import itertools
+from collections import OrderedDict, deque
+import numpy as np
+from simpy.events import Event
+from engine import Hop, CallbackEngine, schedule_at
+from blockstore import PeerView
+from mempool import Mempool
+import ledger
+import peer
+
+CHECKPOINT_VERSION = 3 # format of the checkpoint files
+
+# concatenate lists into one array and the offsets of each list
+def pack_lists(lists, dtype=np.int64):
+    offsets = np.zeros(len(lists)+1, dtype=np.int64)
+    np.cumsum([len(elem) for elem in lists], out=offsets[1:])
+    values = np.fromiter(itertools.chain.from_iterable(lists), dtype=dtype, count=int(offsets[-1]))
+    return values, offsets
+
+# split an array packed by pack_lists back into python lists
+def unpack_lists(values, offsets):
+    values = values.tolist()
+    return [values[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1)]
+
+# Class numbering the transaction objects so that every object is stored (and restored) exactly once
+class TxnTable:
+    def __init__(self):
+        self.rows = {} # serial of the transaction to its row
+        self.txns = [] # row to transaction
+
+    # row of a transaction, added on first use
+    def row(self, txn):
+        row = self.rows.get(txn.serial)
+        if row is None:
+            row = self.rows[txn.serial] = len(self.txns)
+            self.txns.append(txn)
+        return row
+
+    # rows of a list of transactions
+    def rows_of(self, txns):
+        return [self.row(txn) for txn in txns]
+
+# write the state of the simulator at the current simulated time to path
+def save_checkpoint(sim, path):
+    if not isinstance(sim.engine, CallbackEngine) or sim.mining_scheduler is None:
+        raise Exception("Checkpoints need the callback engine and the mining scheduler")
+    env, store, peers = sim.env, sim.store, sim.peer_list
+    txns = TxnTable()
+    arrays = {}
+
+    meta = {"version": CHECKPOINT_VERSION, "now": env.now, "nodes": len(peers), "edges": len(sim.graph.edgelist),
+            "seed": sim.streams.seed, "next_serial": sim.serials.next_serial}
+
+    # block store, the global block hashes are exactly the store hashes in store order so they are not written
+    blocks = store.blocks
+    arrays["blk_parent"] = store.parent[:store.size]
+    arrays["blk_tm"] = np.array([blk.tm for blk in blocks], dtype=float)
+    arrays["blk_gen_by"] = np.array([-1 if blk.gen_by is None else blk.gen_by for blk in blocks], dtype=np.int64)
+    arrays["blk_digest"] = np.frombuffer(b"".join(bytes.fromhex(blk.get_id()) for blk in blocks), dtype=np.uint8).reshape(-1, 32)
+    arrays["blk_txns"], arrays["blk_txn_offsets"] = pack_lists([txns.rows_of(blk.block_txn_list) for blk in blocks])
+
+    # chain state, views, pools, gossip filters and balance snapshots of the peers
+    arrays["amounts"] = np.stack([elem.amount_list for elem in peers])
+    arrays["chain"] = np.array([[store.index(elem.chain_head), elem.chain_height, elem.num_self_blocks, elem.total_num_in_main,
+                                 elem.num_blks_mined] for elem in peers], dtype=np.int64)
+    arrays["view"], arrays["view_offsets"] = pack_lists([elem.view.known_blocks() for elem in peers])
+    arrays["view_tm"] = np.concatenate([elem.view.arrival[elem.view.known_blocks()] for elem in peers])
+    arrays["gen"], arrays["gen_offsets"] = pack_lists([[store.index(h) for h in elem.gen_block_hashes] for elem in peers])
+    arrays["txn_list"], arrays["txn_list_offsets"] = pack_lists([txns.rows_of(elem.txn_list) for elem in peers])
+    arrays["pool"], arrays["pool_offsets"] = pack_lists([txns.rows_of(elem.mempool.values()) for elem in peers])
+    arrays["pool_tm"], _ = pack_lists([[elem.mempool.time_of(txn.get_id()) for txn in elem.mempool.values()] for elem in peers], float)
+    arrays["pool_counts"] = np.array([[elem.mempool.evicted, elem.mempool.expired] for elem in peers], dtype=np.int64)
+    for kind in ("txns", "blks"):
+        filters = [getattr(elem, "sent_" + kind) for elem in peers]
+        arrays[f"sent_{kind}_ids"], arrays[f"sent_{kind}_offsets"] = pack_lists([list(f.announced) for f in filters], np.uint64)
+        arrays[f"sent_{kind}_masks"], _ = pack_lists([list(f.announced.values()) for f in filters], np.uint64)
+        arrays[f"sent_{kind}_first"], arrays[f"sent_{kind}_first_offsets"] = pack_lists([[i for _, i in f.first_sent] for f in filters], np.uint64)
+        arrays[f"sent_{kind}_first_tm"], _ = pack_lists([[tm for tm, _ in f.first_sent] for f in filters], float)
+        arrays[f"sent_{kind}_counts"] = np.array([[f.sent, f.suppressed, f.pruned] for f in filters], dtype=np.int64)
+    arrays["cache"], arrays["cache_offsets"] = pack_lists([list(elem.state_cache.states) for elem in peers])
+    states = [state for elem in peers for state in elem.state_cache.states.values()]
+    arrays["cache_states"] = np.stack(states) if states else np.zeros((0, len(peers)))
+    arrays["cache_counts"] = np.array([[elem.state_cache.hits, elem.state_cache.misses] for elem in peers], dtype=np.int64)
+    if sim.add_malicious:
+        adv = peers[-1]
+        meta["attacker"] = {"private_chain": [store.index(blk.get_id()) for blk in adv.private_block_chain],
+                            "private_chain_head": store.index(adv.private_chain_head),
+                            "chain_length_diff": adv.chain_length_diff, "height_increased": adv.height_increased,
+                            "events_started": adv.recorder.started, "events_flushed": adv.recorder.flushed}
+        arrays["attacker_events"] = adv.recorder.records() # records not yet appended to the file
+
+    # random streams with the unused part of their buffers
+    meta["streams"] = []
+    exp_bufs, uni_bufs = [], []
+    for (purpose, index), stream in sim.streams.streams.items():
+        meta["streams"].append({"purpose": purpose, "index": int(index), "state": stream.rng.bit_generator.state,
+                                "exp_size": stream.exp_size, "uni_size": stream.uni_size})
+        exp_bufs.append(stream.exp_buf[stream.exp_pos:])
+        uni_bufs.append(stream.uni_buf[stream.uni_pos:])
+    arrays["exp_buf"], arrays["exp_buf_offsets"] = pack_lists(exp_bufs, float)
+    arrays["uni_buf"], arrays["uni_buf_offsets"] = pack_lists(uni_bufs, float)
+
+    # transaction source and mining race
+    source = sim.txn_source
+    meta["txn_created"] = source.created
+    arrays["txn_gaps"] = np.array(source.gaps[source.pos:], dtype=float)
+    arrays["txn_senders"] = np.array(source.senders[source.pos:], dtype=np.int64)
+    arrays["txn_receivers"] = np.array(source.receivers[source.pos:], dtype=np.int64)
+    arrays["txn_amounts"] = np.array(source.amounts[source.pos:], dtype=float)
+    arrays["blocks_won"] = sim.mining_scheduler.blocks_won
+
+    # pending events in queue order: messages in flight and the wakeups of the two processes
+    hops = []
+    for rank, (tm, priority, _, event) in enumerate(sorted(env._queue, key=lambda entry: entry[:3])):
+        if not event.callbacks:
+            continue # nothing happens when it is processed, e.g. the end marker left behind by env.run(until)
+        if isinstance(event, Hop):
+            assert event.callbacks == [event.arrive], "message delay not drawn yet"
+            row = store.index(event.msg.get_id()) if event.is_block else txns.row(event.msg)
+            hops.append((tm, priority, rank, event.s, event.r.node, event.size, event.is_block, row))
+        elif event is sim.mining_scheduler.wakeup:
+            meta["mining_wakeup"] = (tm, priority, rank)
+        elif event is source.wakeup:
+            meta["txn_wakeup"] = (tm, priority, rank)
+        else:
+            raise Exception(f"Cannot checkpoint the pending event {event}")
+    arrays["hop_tm"] = np.array([hop[0] for hop in hops], dtype=float)
+    arrays["hop_info"] = np.array([hop[1:] for hop in hops], dtype=np.int64).reshape(-1, 7)
+
+    # the transaction table is filled last, once every reference to a transaction has been numbered
+    arrays["txn_sender"] = np.array([-1 if txn.sender is None else txn.sender for txn in txns.txns], dtype=np.int64)
+    arrays["txn_receiver"] = np.array([txn.receiver for txn in txns.txns], dtype=np.int64)
+    arrays["txn_amount"] = np.array([txn.amount for txn in txns.txns], dtype=float)
+    arrays["txn_serial"] = np.array([txn.serial for txn in txns.txns], dtype=np.int64)
+
+    # write to a temporary file first so that a crash never leaves a truncated checkpoint behind
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), **arrays)
+    os.replace(tmp, path)
+
+# bring a freshly built (not started) simulator of the same configuration to the state saved in path, then start its processes
+def load_checkpoint(sim, path):
+    with np.load(path) as data:
+        arrays = {key: data[key] for key in data.files}
+    meta = json.loads(arrays["meta"].tobytes())
+    env, store, peers = sim.env, sim.store, sim.peer_list
+    if meta["version"] != CHECKPOINT_VERSION:
+        raise Exception(f"Unsupported checkpoint version {meta['version']}")
+    if (meta["nodes"], meta["edges"], meta["seed"]) != (len(peers), len(sim.graph.edgelist), sim.streams.seed):
+        raise Exception("Checkpoint was taken with a different network or seed")
+    if not isinstance(sim.engine, CallbackEngine) or sim.mining != "scheduler":
+        raise Exception("Checkpoints need the callback engine and the mining scheduler")
+    if meta["now"] > env.now:
+        env.run(until=meta["now"]) # nothing is scheduled yet, so this only moves the clock
+    sim.serials.next_serial = meta["next_serial"]
+
+    # transactions, one object per transaction shared by every holder like in the original run
+    txns = [peer.Transaction(None if s < 0 else s, r, a, serial) for s, r, a, serial in zip(arrays["txn_sender"].tolist(),
+            arrays["txn_receiver"].tolist(), arrays["txn_amount"].tolist(), arrays["txn_serial"].tolist())]
+
+    # blocks in store order, parents always come before their children
+    blk_txns = unpack_lists(arrays["blk_txns"], arrays["blk_txn_offsets"])
+    digests = arrays["blk_digest"]
+    if bytes(digests[0]).hex() != sim.genesis_block.get_id():
+        raise Exception("Checkpoint has a different genesis block")
+    for i, (parent, tm, gen_by) in enumerate(zip(arrays["blk_parent"].tolist(), arrays["blk_tm"].tolist(), arrays["blk_gen_by"].tolist())):
+        if i == 0:
+            continue
+        blk = peer.Block(store.block(parent).get_id(), env)
+        blk.tm = tm
+        blk.block_txn_list = [txns[j] for j in blk_txns[i]]
+        blk.deltas = ledger.txn_deltas(blk.block_txn_list)
+        blk.block_size = 1 + sum(txn.sender is not None for txn in blk.block_txn_list)
+        blk.set_gen_by(None if gen_by < 0 else gen_by)
+        if blk.seal() != bytes(digests[i]).hex():
+            raise Exception(f"Block {i} of the checkpoint does not hash to its saved id")
+        store.add(blk)
+
+    # peers
+    views = unpack_lists(arrays["view"], arrays["view_offsets"])
+    view_tms = unpack_lists(arrays["view_tm"], arrays["view_offsets"])
+    gens = unpack_lists(arrays["gen"], arrays["gen_offsets"])
+    txn_lists = unpack_lists(arrays["txn_list"], arrays["txn_list_offsets"])
+    pools = unpack_lists(arrays["pool"], arrays["pool_offsets"])
+    pool_tms = unpack_lists(arrays["pool_tm"], arrays["pool_offsets"])
+    caches = unpack_lists(arrays["cache"], arrays["cache_offsets"])
+    states = iter(arrays["cache_states"])
+    filters = {}
+    for kind in ("txns", "blks"):
+        filters[kind] = (unpack_lists(arrays[f"sent_{kind}_ids"], arrays[f"sent_{kind}_offsets"]),
+                         unpack_lists(arrays[f"sent_{kind}_masks"], arrays[f"sent_{kind}_offsets"]),
+                         unpack_lists(arrays[f"sent_{kind}_first"], arrays[f"sent_{kind}_first_offsets"]),
+                         unpack_lists(arrays[f"sent_{kind}_first_tm"], arrays[f"sent_{kind}_first_offsets"]),
+                         arrays[f"sent_{kind}_counts"].tolist())
+    for i, elem in enumerate(peers):
+        elem.amount_list[:] = arrays["amounts"][i]
+        head, elem.chain_height, elem.num_self_blocks, elem.total_num_in_main, elem.num_blks_mined = arrays["chain"][i].tolist()
+        elem.chain_head = store.block(head).get_id()
+        elem.view = PeerView(store)
+        for idx, tm in zip(views[i], view_tms[i]):
+            elem.view.add(idx, tm)
+        elem.gen_block_hashes = [store.block(idx).get_id() for idx in gens[i]]
+        elem.txn_list = [txns[j] for j in txn_lists[i]]
+        elem.mempool = Mempool(elem.mempool.capacity, elem.mempool.expiry)
+        for j, tm in zip(pools[i], pool_tms[i]):
+            elem.mempool.add(txns[j], tm)
+        elem.mempool.evicted, elem.mempool.expired = arrays["pool_counts"][i].tolist()
+        for kind, (ids, masks, first, first_tm, counts) in filters.items():
+            fltr = getattr(elem, "sent_" + kind)
+            fltr.announced = dict(zip(ids[i], masks[i]))
+            fltr.first_sent = deque(zip(first_tm[i], first[i]))
+            fltr.sent, fltr.suppressed, fltr.pruned = counts[i]
+        elem.state_cache.states = OrderedDict((idx, next(states).copy()) for idx in caches[i])
+        elem.state_cache.hits, elem.state_cache.misses = arrays["cache_counts"][i].tolist()
+    if sim.add_malicious:
+        adv, state = peers[-1], meta["attacker"]
+        adv.private_block_chain = [store.block(idx) for idx in state["private_chain"]]
+        adv.private_chain_head = store.block(state["private_chain_head"]).get_id()
+        adv.chain_length_diff = state["chain_length_diff"]
+        adv.height_increased = state["height_increased"]
+        adv.recorder.restore(arrays["attacker_events"], state["events_flushed"], state["events_started"])
+
+    # random streams, restored in place since the peers and the delays hold references to them
+    exp_bufs = unpack_lists(arrays["exp_buf"], arrays["exp_buf_offsets"])
+    uni_bufs = unpack_lists(arrays["uni_buf"], arrays["uni_buf_offsets"])
+    for entry, exp_buf, uni_buf in zip(meta["streams"], exp_bufs, uni_bufs):
+        stream = sim.streams.stream(entry["purpose"], entry["index"])
+        stream.rng.bit_generator.state = entry["state"]
+        stream.exp_buf, stream.exp_pos, stream.exp_size = exp_buf, 0, entry["exp_size"]
+        stream.uni_buf, stream.uni_pos, stream.uni_size = uni_buf, 0, entry["uni_size"]
+
+    # pending events pushed back in their original queue order
+    pending = []
+    for tm, (priority, rank, s, r, size, is_block, row) in zip(arrays["hop_tm"].tolist(), arrays["hop_info"].tolist()):
+        hop = Hop(sim.engine, s, peers[r], size, bool(is_block), store.block(row) if is_block else txns[row], in_flight=True)
+        pending.append((rank, tm, priority, hop))
+    wakeups = {}
+    for name in ("mining_wakeup", "txn_wakeup"):
+        tm, priority, rank = meta[name]
+        wakeups[name] = Event(env)
+        wakeups[name]._ok, wakeups[name]._value = True, None
+        pending.append((rank, tm, priority, wakeups[name]))
+    for _, tm, priority, event in sorted(pending, key=lambda entry: entry[0]):
+        schedule_at(env, event, tm, priority)
+
+    sim.start_processes(wakeups["mining_wakeup"], wakeups["txn_wakeup"])
+    source = sim.txn_source
+    source.created = meta["txn_created"]
+    source.gaps, source.senders = arrays["txn_gaps"].tolist(), arrays["txn_senders"].tolist()
+    source.receivers, source.amounts = arrays["txn_receivers"].tolist(), arrays["txn_amounts"].tolist()
+    source.pos = 0
+    sim.mining_scheduler.blocks_won[:] = arrays["blocks_won"]
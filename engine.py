@@ -0,0 +1,155 @@
+### engines delivering the messages between the peers after the network delay
+
+from heapq import heappush, heappop
+import numpy as np
+from simpy.events import Event, NORMAL, URGENT
+
+# hand a message from node s to the peer r that it reached
+def arrive(s, r, is_block, msg):
+    if is_block:
+        r.block_arrived(s, msg)
+    else:
+        r.receive_txn(s, msg)
+
+# Class delivering every hop with its own simpy process (one generator per message)
+class ProcessEngine:
+    def __init__(self, env, delay):
+        self.env = env
+        self.delay = delay
+
+    # deliver a block from node s to peer r, r.block_arrived(s, blk) is called on arrival
+    def deliver_block(self, s, r, size, blk):
+        self.env.process(self.hop(s, r, size, True, blk))
+
+    # deliver a transaction from node s to peer r, r.receive_txn(s, txn) is called on arrival
+    def deliver_txn(self, s, r, size, txn):
+        self.env.process(self.hop(s, r, size, False, txn))
+
+    # process waiting for the network delay of one hop
+    def hop(self, s, r, size, is_block, msg):
+        yield self.env.timeout(self.delay.get_delay(s, r.node, size))
+        arrive(s, r, is_block, msg)
+
+# Class delivering every hop with plain callbacks on the simpy event queue
+class CallbackEngine:
+    def __init__(self, env, delay):
+        self.env = env
+        self.delay = delay
+
+    # deliver a block from node s to peer r, r.block_arrived(s, blk) is called on arrival
+    def deliver_block(self, s, r, size, blk):
+        Hop(self, s, r, size, True, blk)
+
+    # deliver a transaction from node s to peer r, r.receive_txn(s, txn) is called on arrival
+    def deliver_txn(self, s, r, size, txn):
+        Hop(self, s, r, size, False, txn)
+
+# one message in flight, a single event object reused for both steps of the hop
+class Hop(Event):
+    def __init__(self, engine, s, r, size, is_block, msg, in_flight=False):
+        self.env = engine.env
+        self.engine = engine
+        self.s, self.r, self.size, self.is_block, self.msg = s, r, size, is_block, msg
+        self._ok = True
+        self._value = None
+        if in_flight:
+            # restored from a checkpoint after the delay was drawn, the caller schedules the arrival
+            self.callbacks = [self.arrive]
+            return
+        # the delay is drawn from an urgent event at the current time, the same point
+        # where a new process would start, so the random draws keep the same order
+        self.callbacks = [self.start]
+        self.env.schedule(self, URGENT)
+
+    # draw the network delay and schedule the arrival
+    def start(self, _):
+        self.callbacks = [self.arrive]
+        self.env.schedule(self, NORMAL, self.engine.delay.get_delay(self.s, self.r.node, self.size))
+
+    # the message reached the receiver
+    def arrive(self, _):
+        arrive(self.s, self.r, self.is_block, self.msg)
+
+# schedule an already triggered event at an exact time through the public api: now + (tm - now) can round off tm, so
+# the delay is nudged onto tm and when no delay lands on it a timeout relays the event from the float just below tm
+def schedule_at(env, event, tm, priority):
+    delay = tm - env.now
+    while delay > 0 and env.now + delay > tm:
+        delay = float(np.nextafter(delay, -np.inf))
+    if env.now + delay < tm and env.now + float(np.nextafter(delay, np.inf)) == tm:
+        delay = float(np.nextafter(delay, np.inf))
+    if env.now + delay == tm:
+        env.schedule(event, priority, delay)
+    else:
+        env.timeout(delay).callbacks.append(lambda _: schedule_at(env, event, tm, priority))
+
+# Class delivering the transactions like the callback engine and the blocks by first arrival: the delays of all the
+# links are sampled at once per block and the block spreads like Dijkstra's algorithm run by the event queue, every
+# node gets one arrival event (from the earliest neighbour that relayed the block to it) instead of one per link
+class FloodEngine:
+    def __init__(self, env, delay):
+        self.env = env
+        self.delay = delay
+        self.floods = {} # short id of the block to its flood in progress
+
+    # deliver a block from node s to peer r through the flood of the block
+    def deliver_block(self, s, r, size, blk):
+        flood = self.floods.get(blk.short_id)
+        if flood is None:
+            flood = self.floods[blk.short_id] = Flood(self, blk, size)
+            flood.accepted.add(s) # the node starting the flood already has the block
+        flood.relax(s, r)
+
+    # deliver a transaction from node s to peer r like the callback engine
+    def deliver_txn(self, s, r, size, txn):
+        Hop(self, s, r, size, False, txn)
+
+# one block spreading over the network, a node that relays the block relaxes the links to its neighbours
+class Flood:
+    def __init__(self, engine, blk, size):
+        self.engine = engine
+        self.env = engine.env
+        self.blk = blk
+        self.delays = engine.delay.sample_links(size) # delay of every directed link for this block
+        self.candidates = {} # receiver node to the heap of (arrival time, order, sender, receiver peer)
+        self.pending = {} # receiver node to its scheduled arrival event
+        self.accepted = set() # nodes that accepted the block, later copies to them are skipped
+        self.order = 0 # tie breaker of the candidates
+
+    # the block is sent from node s to peer r
+    def relax(self, s, r):
+        if r.node in self.accepted:
+            return
+        tm = self.env.now + self.delays[self.engine.delay.edge(s, r.node)]
+        heap = self.candidates.setdefault(r.node, [])
+        heappush(heap, (tm, self.order, s, r))
+        self.order += 1
+        event = self.pending.get(r.node)
+        if event is None or tm < event.tm:
+            self.schedule(r.node)
+
+    # schedule the earliest candidate arrival of the node, replacing its pending one
+    def schedule(self, node):
+        event = Event(self.env)
+        event._ok, event._value = True, None
+        event.tm = self.candidates[node][0][0]
+        event.callbacks.append(lambda ev: self.arrive(node, ev))
+        self.pending[node] = event
+        schedule_at(self.env, event, event.tm, NORMAL)
+
+    # the earliest copy reaches the node, a rejected copy (e.g. its parent is still unknown) is followed by the next one
+    def arrive(self, node, event):
+        if self.pending.get(node) is not event:
+            return # replaced by an earlier arrival
+        del self.pending[node]
+        _, _, s, r = heappop(self.candidates[node])
+        r.block_arrived(s, self.blk)
+        if r.view.knows_hash(self.blk.get_id()):
+            self.accepted.add(node)
+            del self.candidates[node]
+        elif self.candidates[node]:
+            self.schedule(node)
+        if not self.pending:
+            del self.engine.floods[self.blk.short_id]
+
+ENGINES = {"process": ProcessEngine, "callback": CallbackEngine, "flood": FloodEngine}
@@ -0,0 +1,176 @@
+### leveled event log of the simulation with one level per category, records are buffered and only formatted when written
+# a call site checks log.on[event] before building the fields, so a disabled event costs one list lookup and one branch
+
+import sys
+import json
+import struct
+import numpy as np
+
+OFF, INFO, DEBUG = 0, 1, 2
+LEVELS = {"off": OFF, "info": INFO, "debug": DEBUG}
+CATEGORIES = ("net", "txn", "block", "fork", "mining", "attacker")
+LOG_BUFFER = 4096 # records kept in memory before they are written
+BINARY_MAGIC = b"BSIMLOG1"
+
+# kinds of the fields: i integer, f float, h block or transaction id (hex digest), l list of integers,
+# a list of floats, H list of ids
+FIELD_STRUCTS = {"i": struct.Struct("<q"), "f": struct.Struct("<d")}
+COUNT_STRUCT = struct.Struct("<I")
+RECORD_STRUCT = struct.Struct("<Hd") # event code and time
+
+# catalog of the events: name, category, level, names and kinds of the fields, text format of the fields
+EVENTS = [
+    ("peers", "net", INFO, (("node", "i"), ("peers", "l")), "Node {0} has peer list {1}"),
+    ("txn_created", "txn", DEBUG, (("txn", "h"), ("sender", "i"), ("receiver", "i"), ("amount", "f")), "Transaction {0} created: ID {1} pays ID {2} {3:.4f} coins"),
+    ("txn_recv", "txn", DEBUG, (("txn", "h"), ("sender", "i"), ("node", "i")), "Transaction {0} from {1} received by {2}"),
+    ("txn_sent", "txn", DEBUG, (("txn", "h"), ("receiver", "i"), ("node", "i")), "Sent transaction {0} to {1} by {2}"),
+    ("txn_skip", "txn", DEBUG, (("txn", "h"), ("receiver", "i"), ("node", "i")), "Skipping txn {0} to node {1} by {2}"),
+    ("blk_recv", "block", DEBUG, (("blk", "h"), ("sender", "i"), ("node", "i")), "Block {0} from {1} received by {2}"),
+    ("blk_invalid", "block", INFO, (("blk", "h"), ("node", "i")), "Invalid transaction in block {0} received by {1}"),
+    ("blk_orphan", "block", INFO, (("blk", "h"), ("node", "i")), "No parent for block {0} received by {1}"),
+    ("blk_sent", "block", DEBUG, (("blk", "h"), ("receiver", "i"), ("node", "i")), "Sent block {0} to {1} by {2}"),
+    ("blk_skip", "block", DEBUG, (("blk", "h"), ("receiver", "i"), ("node", "i")), "Skipping block {0} to node {1} by {2}"),
+    ("balances", "block", DEBUG, (("node", "i"), ("amounts", "a")), "Amount list for node {0} is {1}"),
+    ("fork", "fork", INFO, (("node", "i"), ("blk", "h"), ("height", "i")), "Node {0} resolving fork onto block {1} at height {2}"),
+    ("mined", "mining", INFO, (("blk", "h"), ("node", "i"), ("txns", "H"), ("money", "f")), "Block {0} mined by {1} with transactions {2}; money left {3}"),
+    ("interrupted", "mining", DEBUG, (("node", "i"),), "Mining of node {0} interrupted"),
+    ("adv_round", "attacker", DEBUG, (("node", "i"), ("lead", "i")), "Malicious node {0} mining with a lead of {1}"),
+    ("adv_private", "attacker", INFO, (("blk", "h"), ("node", "i"), ("lead", "i"), ("txns", "H")), "Private block {0} mined by {1}; lead {2}; transactions {3}"),
+    ("adv_release", "attacker", INFO, (("blk", "h"), ("node", "i"), ("lead", "i")), "Releasing private block {0} by {1}; lead {2}"),
+    ("adv_lead", "attacker", DEBUG, (("node", "i"), ("lead", "i")), "Lead of malicious node {0} decreased to {1}"),
+]
+
+# event codes, used at the call sites as log.on[PEERS], log.emit(PEERS, ...)
+(PEERS, TXN_CREATED, TXN_RECV, TXN_SENT, TXN_SKIP, BLK_RECV, BLK_INVALID, BLK_ORPHAN, BLK_SENT, BLK_SKIP, BALANCES,
+ FORK, MINED, INTERRUPTED, ADV_ROUND, ADV_PRIVATE, ADV_RELEASE, ADV_LEAD) = range(len(EVENTS))
+
+# parse "info" or "txn=debug,block=off" (a bare level applies to every category) into {category: level}
+def parse_levels(spec, default=OFF):
+    levels = dict.fromkeys(CATEGORIES, default)
+    for item in filter(None, spec.split(",")):
+        name, _, level = item.rpartition("=")
+        if level not in LEVELS:
+            raise Exception(f"Unknown log level {level}")
+        if name and name not in levels:
+            raise Exception(f"Unknown log category {name}")
+        for cat in ([name] if name else CATEGORIES):
+            levels[cat] = LEVELS[level]
+    return levels
+
+# Class writing the records as text lines
+class TextWriter:
+    def __init__(self, f):
+        self.f = f # file, None for the current sys.stdout
+
+    def write(self, records):
+        f = self.f or sys.stdout
+        f.write("".join(f"[{tm}] {EVENTS[code][4].format(*fields)}\n" for code, tm, fields in records))
+        f.flush()
+
+# Class writing the records as one json object per line
+class JsonWriter(TextWriter):
+    def write(self, records):
+        f = self.f or sys.stdout
+        f.write("".join(json.dumps(dict(zip([name for name, _ in EVENTS[code][3]], fields), event=EVENTS[code][0], time=tm)) + "\n"
+                        for code, tm, fields in records))
+        f.flush()
+
+# Class writing the records in a compact binary format: a header with the json catalog of the events, then per record
+# the event code, the time and the packed fields (ids as 32 raw bytes, lists as a count and the items)
+class BinaryWriter:
+    def __init__(self, f):
+        self.f = f
+        catalog = json.dumps([[name, cat, fields] for name, cat, _, fields, _ in EVENTS]).encode()
+        f.write(BINARY_MAGIC + COUNT_STRUCT.pack(len(catalog)) + catalog)
+
+    def write(self, records):
+        out = bytearray()
+        for code, tm, fields in records:
+            out += RECORD_STRUCT.pack(code, tm)
+            for (_, kind), value in zip(EVENTS[code][3], fields):
+                if kind == "h":
+                    out += bytes.fromhex(value)
+                elif kind == "H":
+                    out += COUNT_STRUCT.pack(len(value)) + b"".join(bytes.fromhex(v) for v in value)
+                elif kind in "la":
+                    out += COUNT_STRUCT.pack(len(value)) + np.asarray(value, dtype=np.int64 if kind == "l" else np.float64).tobytes()
+                else:
+                    out += FIELD_STRUCTS[kind].pack(value)
+        self.f.write(out)
+        self.f.flush()
+
+WRITERS = {"text": (TextWriter, "w"), "jsonl": (JsonWriter, "w"), "binary": (BinaryWriter, "wb")}
+
+# read a binary log back as (event name, time, {field: value}) tuples
+def read_binary(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise Exception(f"{path} is not a binary event log")
+    pos = len(BINARY_MAGIC)
+    (size,) = COUNT_STRUCT.unpack_from(data, pos)
+    catalog = json.loads(data[pos+4:pos+4+size])
+    pos += 4 + size
+    while pos < len(data):
+        code, tm = RECORD_STRUCT.unpack_from(data, pos)
+        pos += RECORD_STRUCT.size
+        name, _, fields = catalog[code]
+        values = {}
+        for field, kind in fields:
+            if kind == "h":
+                values[field], pos = data[pos:pos+32].hex(), pos + 32
+            elif kind in FIELD_STRUCTS:
+                (values[field],), pos = FIELD_STRUCTS[kind].unpack_from(data, pos), pos + 8
+            else:
+                (count,) = COUNT_STRUCT.unpack_from(data, pos)
+                pos += 4
+                if kind == "H":
+                    values[field] = [data[pos+32*i:pos+32*(i+1)].hex() for i in range(count)]
+                    pos += 32*count
+                else:
+                    values[field] = np.frombuffer(data, np.int64 if kind == "l" else np.float64, count, pos).tolist()
+                    pos += 8*count
+        yield name, tm, values
+
+# Class holding the levels and the buffer of the records, every simulation has its own log
+class EventLog:
+    def __init__(self, spec="info", path=None, fmt="text"):
+        self.on = [False]*len(EVENTS) # per event code, whether it is recorded
+        self.records = []
+        self.writer = TextWriter(None)
+        self.file = None
+        self.configure(spec, path, fmt)
+
+    # set the levels of the categories and the destination of the records (stdout as text when path is None)
+    def configure(self, spec, path=None, fmt="text"):
+        self.close()
+        levels = parse_levels(spec)
+        self.on = [level <= levels[cat] for _, cat, level, _, _ in EVENTS]
+        if path is None:
+            if fmt == "binary":
+                raise Exception("The binary event log needs a file")
+            self.writer = WRITERS[fmt][0](None)
+        else:
+            cls, mode = WRITERS[fmt]
+            self.file = open(path, mode)
+            self.writer = cls(self.file)
+
+    # buffer one record, the fields must not change afterwards (copy mutable state into a list)
+    def emit(self, code, tm, *fields):
+        self.records.append((code, tm, fields))
+        if len(self.records) >= LOG_BUFFER:
+            self.flush()
+
+    # write the buffered records
+    def flush(self):
+        if self.records:
+            records, self.records = self.records, []
+            self.writer.write(records)
+
+    # write the buffered records and close the file of the log
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.writer = TextWriter(None)
@@ -0,0 +1,169 @@
+### append-only columnar trace of the simulation events and its replay: one raw binary file per column, read back
+### through memory-mapped numpy arrays, the block trees of the peers are rebuilt from the trace without running simpy
+
+import os
+import json
+import argparse
+import numpy as np
+
+TRACE_BUFFER = 65536 # records kept in memory before they are appended to the column files
+TRACE_META = "trace.json"
+
+# columns of a record: kind of the event, time, node where it happened, block index in the store or transaction
+# serial, the other node or block of the event, and a value
+COLUMNS = (("kind", np.uint8), ("time", np.float64), ("node", np.int32), ("item", np.int64), ("other", np.int64), ("value", np.float64))
+
+# kinds of the events and the meaning of their columns
+KINDS = {
+    "txn": "node created the transaction item paying value coins to other",
+    "mined": "node mined the block item on top of other with value transactions",
+    "private": "attacker node mined the private block item on top of other with value transactions",
+    "release": "attacker node released the private block item on top of other with a lead of value",
+    "received": "node got the block item from other, value is 1 if it was added to the tree of the node",
+    "reorg": "node switched its chain head from block other to block item, abandoning value blocks",
+}
+TXN, MINED, PRIVATE, RELEASE, RECEIVED, REORG = range(len(KINDS))
+
+# Class appending the records to the column files of a trace directory (disabled until opened)
+class TraceWriter:
+    def __init__(self):
+        self.on = False # whether the records are kept, checked by the callers before record()
+        self.path = None
+        self.files = []
+        self.buffer = []
+        self.length = 0
+
+    # start a new trace in the directory path
+    def open(self, path):
+        self.close()
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.files = [open(os.path.join(path, name + ".bin"), "wb") for name, _ in COLUMNS]
+        self.length = 0
+        self.on = True
+        self.write_meta()
+
+    def record(self, kind, tm, node, item, other, value):
+        self.buffer.append((kind, tm, node, item, other, value))
+        if len(self.buffer) >= TRACE_BUFFER:
+            self.flush()
+
+    # append the buffered records column by column
+    def flush(self):
+        if not self.buffer:
+            return
+        columns = list(zip(*self.buffer))
+        for f, (_, dtype), values in zip(self.files, COLUMNS, columns):
+            np.asarray(values, dtype=dtype).tofile(f)
+            f.flush()
+        self.length += len(self.buffer)
+        self.buffer = []
+        self.write_meta()
+
+    # description of the columns and number of complete records
+    def write_meta(self):
+        meta = {"columns": [[name, np.dtype(dtype).str] for name, dtype in COLUMNS], "kinds": list(KINDS), "length": self.length}
+        tmp = os.path.join(self.path, TRACE_META + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, TRACE_META))
+
+    def close(self):
+        if not self.on:
+            return
+        self.flush()
+        for f in self.files:
+            f.close()
+        self.files = []
+        self.on = False
+
+# Class reading a trace directory, the columns are memory-mapped arrays of the records
+class Trace:
+    def __init__(self, path):
+        with open(os.path.join(path, TRACE_META)) as f:
+            meta = json.load(f)
+        self.length = meta["length"]
+        for name, dtype in meta["columns"]:
+            column = np.memmap(os.path.join(path, name + ".bin"), dtype=dtype, mode="r") if self.length else np.zeros(0, dtype)
+            setattr(self, name, column[:self.length])
+        self.build_blocks()
+
+    def __len__(self):
+        return self.length
+
+    # parent, height and miner of every block index from the mined and private records (block 0 is the genesis)
+    def build_blocks(self):
+        made = np.flatnonzero((self.kind == MINED) | (self.kind == PRIVATE))
+        size = int(self.item[made].max()) + 1 if len(made) else 1
+        self.parent = np.full(size, -1, dtype=np.int64)
+        self.miner = np.full(size, -1, dtype=np.int64)
+        self.parent[self.item[made]] = self.other[made]
+        self.miner[self.item[made]] = self.node[made]
+        self.height = np.zeros(size, dtype=np.int64)
+        for idx in np.sort(self.item[made]): # blocks are numbered in mining order, parents come first
+            self.height[idx] = self.height[self.parent[idx]] + 1
+
+    # positions of the records of a kind (and node) up to time tm
+    def select(self, kind, node=None, tm=None):
+        mask = self.kind == kind
+        if node is not None:
+            mask &= self.node == node
+        if tm is not None:
+            mask &= self.time <= tm
+        return np.flatnonzero(mask)
+
+    # blocks added to the tree of a node up to time tm in arrival order, with their arrival times (genesis first)
+    def arrivals(self, node, tm=np.inf):
+        added = (self.node == node) & (self.time <= tm) & ((self.kind == MINED) | (self.kind == RELEASE) |
+                                                          ((self.kind == RECEIVED) & (self.value == 1)))
+        pos = np.flatnonzero(added)
+        return np.concatenate(([0], self.item[pos])), np.concatenate(([0.0], self.time[pos]))
+
+    # edges (parent index, child index) of the block tree of a node at time tm in arrival order
+    def tree(self, node, tm=np.inf):
+        blocks, _ = self.arrivals(node, tm)
+        return list(zip(self.parent[blocks[1:]].tolist(), blocks[1:].tolist()))
+
+    # chain head of a node at time tm: a mined block becomes the head, a received one when it extends the head or
+    # is higher than it, a released private block does not move the head of the attacker
+    def head(self, node, tm=np.inf):
+        pos = np.flatnonzero((self.node == node) & (self.time <= tm) & ((self.kind == MINED) |
+                                                                        ((self.kind == RECEIVED) & (self.value == 1))))
+        head = 0
+        for kind, idx in zip(self.kind[pos].tolist(), self.item[pos].tolist()):
+            if kind == MINED or self.parent[idx] == head or self.height[idx] > self.height[head]:
+                head = idx
+        return head
+
+    # blocks of the chain ending at the block idx, from the genesis
+    def chain(self, idx):
+        blocks = []
+        while idx >= 0:
+            blocks.append(idx)
+            idx = self.parent[idx]
+        return blocks[::-1]
+
+    # number of records of every kind
+    def counts(self):
+        return dict(zip(KINDS, np.bincount(self.kind, minlength=len(KINDS)).tolist()))
+
+# function to get the input arguments
+def fetch_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path") # trace directory
+    parser.add_argument("--node", type=int, default=None) # print the block tree of this node
+    parser.add_argument("--time", type=float, default=np.inf) # time of the tree
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = fetch_args()
+    trace = Trace(args.path)
+    print(f"{len(trace)} records: {trace.counts()}")
+    if args.node is not None:
+        blocks, times = trace.arrivals(args.node, args.time)
+        arrival = dict(zip(blocks.tolist(), times.tolist()))
+        head = trace.head(args.node, args.time)
+        print(f"node {args.node} at time {args.time}: {len(blocks)} blocks, head {head} at height {trace.height[head]}")
+        print("\n".join(f"{p}(Ta={arrival[p]:.3f};By: {trace.miner[p]}) -> {c}(Ta={arrival[c]:.3f};By: {trace.miner[c]})"
+                        for p, c in trace.tree(args.node, args.time)))
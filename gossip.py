@@ -0,0 +1,42 @@
+### duplicate suppression for relaying transactions and blocks to the neighbours
+
+from collections import deque
+
+GOSSIP_WINDOW = 30000 # time after which a relayed item is forgotten (much longer than any flood takes)
+
+# Class remembering which neighbours an item was already announced to
+class GossipFilter:
+    def __init__(self, neighbours, window=GOSSIP_WINDOW):
+        self.slot = {node: i for i, node in enumerate(neighbours)} # bit position of each neighbour
+        self.window = window # pruning window
+        self.announced = {} # integer id of the item to the bitset of neighbours it was sent to
+        self.first_sent = deque() # (time, id) of the items in the order they were first relayed
+        self.sent = 0 # number of announcements made
+        self.suppressed = 0 # number of duplicate announcements skipped
+        self.pruned = 0 # number of items forgotten after the window
+
+    # mark the item as announced to the neighbour, returns False if it was already announced
+    def announce(self, item_id, node, now):
+        self.prune(now)
+        bit = 1 << self.slot[node]
+        mask = self.announced.get(item_id)
+        if mask is None:
+            self.first_sent.append((now, item_id))
+            mask = 0
+        elif mask & bit:
+            self.suppressed += 1
+            return False
+        self.announced[item_id] = mask | bit
+        self.sent += 1
+        return True
+
+    # forget the items first relayed more than a window ago
+    def prune(self, now):
+        first_sent = self.first_sent
+        while first_sent and now - first_sent[0][0] > self.window:
+            self.announced.pop(first_sent.popleft()[1], None)
+            self.pruned += 1
+
+    # number of items currently remembered
+    def __len__(self):
+        return len(self.announced)
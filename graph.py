@@ -1,16 +1,11 @@
-### in this we use the python igraph library for creating the network topology of the nodes
+### network topology of the nodes, built by the generators in topology.py (igraph is only used by the "degree" generator)
 
-import igraph as ig
-import matplotlib.pyplot as plt
 import random 
+import numpy as np
+import topology
 
-# initialize all the seeds and configs
+# initialize all the configs
 MAX_TRY = 100
-random.seed(73)
-
-ig.config["plotting.backend"] = "matplotlib"
-ig.config["plotting.layout"] = "fruchterman_reingold"
-ig.config["plotting.palette"] = "rainbow"
 
 # class to generate the network graph
 class Graph:
@@ -19,21 +14,55 @@ class Graph:
         self.z0 = args.z0
         self.z1 = args.z1
         self.n = args.n
+        self.kind = getattr(args, "topology", "regular") # generator of the topology, "degree" for the igraph degree sequence
+        self.rng = np.random.default_rng(getattr(args, "seed", 73)) # generator of the topology and node types
+        self.py_rng = random.Random(getattr(args, "seed", 73)) # python generator of the igraph degree sequence generator
         self.graph = None
         self.edgelist = []
         self.highcpu_nodes = []
         self.lowcpu_nodes = []
         self.slow_nodes= []
         self.fast_nodes = []
+        self.malicious_neighbours = [] # neighbours of the malicious node, if any
+
+    # function to create the graph, the plotting graph is only built when asked for
+    def create_graph(self, add_malicious=False, zeta=0, plot=False):
+        if self.kind == "degree":
+            self.create_degree_sequence_graph()
+        else:
+            self.edgelist = [tuple(elem) for elem in topology.generate(self.n, self.kind, self.rng).tolist()]
+
+        # initialize slow and fast nodes and low and high CPU nodes randomly wrt the given parameters
+        nodes = np.arange(self.n)
+        lowcpu = self.rng.random(self.n) < self.z1
+        slow = self.rng.random(self.n) < self.z0
+        self.lowcpu_nodes, self.highcpu_nodes = nodes[lowcpu].tolist(), nodes[~lowcpu].tolist()
+        self.slow_nodes, self.fast_nodes = nodes[slow].tolist(), nodes[~slow].tolist()
+
+        # add the malicious nodes to the graph incase required
+        if add_malicious:
+            neigh_m = self.rng.choice(self.fast_nodes, zeta, replace=False).tolist() # select zeta nodes from the fast nodes
+            self.malicious_neighbours = neigh_m
+            self.fast_nodes.append(self.n) # add the malicious node to the fast nodes
+            self.highcpu_nodes.append(self.n) # add the malicious node to the high CPU nodes
+            for elem in neigh_m: # add the edges between the malicious node and the selected nodes
+                self.edgelist.append([self.n, elem])
+
+        if not plot:
+            return None
+        import plotting # igraph is only loaded when the plotting graph is asked for
+        return plotting.topology_graph(self.n, self.edgelist, add_malicious)
 
-    # function to create the graph
-    def create_graph(self, add_malicious=False, zeta=0):
+    # function to create the graph with the igraph degree sequence generator (slow, for small networks)
+    def create_degree_sequence_graph(self):
+        import igraph as ig
+        ig.set_random_number_generator(self.py_rng) # make igraph draw from the seeded python generator
         connected = False
         curr_try = 0
         valid = False
         # resolve self loops and ensure each node has 4 to 8 neighbours
         while not connected and curr_try < MAX_TRY and not valid:
-            degree_list = [random.randint(5, 9) for _ in range(self.n)] # list of degrees of each node randomly initialized
+            degree_list = [self.py_rng.randint(5, 9) for _ in range(self.n)] # list of degrees of each node randomly initialized
             try:
                 # use the ig function to generate a graph with the degree list
                 self.graph = ig.GraphBase.Degree_Sequence(degree_list,method="simple")
@@ -58,36 +87,6 @@ class Graph:
         # save the edgelist of the graph to be used in our peer file
         self.edgelist = list(set([elem for elem in self.graph.get_edgelist() if elem[0]!=elem[1]]))
         #print(self.edgelist)
-        # initialize slow and fast nodes and low and high CPU nodes randomly wrt the given parameters
-        for i in range(self.n):
-            if random.random() < self.z1:
-                self.lowcpu_nodes.append(i)
-            else:
-                self.highcpu_nodes.append(i)
-
-            if random.random() < self.z0:
-                self.slow_nodes.append(i)
-            else:
-                self.fast_nodes.append(i)
-
-        # add the malicious nodes to the graph incase required
-        if add_malicious:
-            self.fast_nodes.append(self.n) # add the malicious node to the fast nodes
-            self.highcpu_nodes.append(self.n) # add the malicious node to the high CPU nodes
-            neigh_m = random.sample(self.fast_nodes[:-1], zeta) # select zeta nodes from the fast nodes
-            print("Malicious neigh: ", neigh_m) 
-            for elem in neigh_m: # add the edges between the malicious node and the selected nodes
-                self.edgelist.append([self.n, elem])
-
-        # set all the parameters of the graph to display
-        p_graph = ig.Graph(self.n + 1 if add_malicious else self.n, self.edgelist)
-        p_graph.vs["label"] = range(self.n + 1 if add_malicious else self.n)
-        p_graph.vs["color"] = "blue" if not add_malicious else ["blue" if i < self.n else "red" for i in range(self.n+1)]
-        p_graph.vs["size"] = 0.6
-        p_graph.es["color"] = "black"
-        p_graph.es["width"] = 1
-
-        return p_graph
 
 
 class Dict2Class(object):
@@ -0,0 +1,66 @@
+### sparse balance changes of the blocks applied over the balances of a peer
+
+from collections import OrderedDict
+
+STATE_CACHE_SIZE = 32 # number of balance snapshots kept by each peer
+
+# add the balance changes of one transaction into the sparse deltas {account: change}
+def add_txn_delta(deltas, txn):
+    if txn.sender is not None:
+        deltas[txn.sender] = deltas.get(txn.sender, 0) - txn.amount
+    deltas[txn.receiver] = deltas.get(txn.receiver, 0) + txn.amount
+
+# compute the sparse deltas of a list of transactions
+def txn_deltas(txn_list):
+    deltas = {}
+    for txn in txn_list:
+        add_txn_delta(deltas, txn)
+    return deltas
+
+# ids of the transactions confirmed by a sequence of sealed blocks
+def confirmed_ids(blocks):
+    return set().union(*(blk.txn_ids for blk in blocks))
+
+# check that the transactions can be applied in order over the balances, only the touched accounts are read
+def is_valid(balances, txn_list):
+    overlay = {} # balances of the touched accounts after the transactions processed so far
+    for txn in txn_list:
+        if txn.sender is not None:
+            overlay[txn.sender] = overlay.get(txn.sender, balances[txn.sender]) - txn.amount
+        overlay[txn.receiver] = overlay.get(txn.receiver, balances[txn.receiver]) + txn.amount
+        if txn.sender is not None and overlay[txn.sender] < 0:
+            return False
+    return True
+
+# apply (sign=1) or revert (sign=-1) the deltas of a block on the balances
+def apply_deltas(balances, deltas, sign=1):
+    for account, change in deltas.items():
+        balances[account] += sign*change
+
+# Class keeping LRU evicted balance snapshots of recent chain tips and fork points
+class StateCache:
+    def __init__(self, capacity=STATE_CACHE_SIZE):
+        self.capacity = capacity # maximum number of snapshots
+        self.states = OrderedDict() # block index to the balances at that block
+        self.hits = 0 # number of lookups served from a snapshot
+        self.misses = 0 # number of lookups that found no snapshot
+
+    # store a copy of the balances at the block idx
+    def put(self, idx, balances):
+        if idx in self.states:
+            self.states.move_to_end(idx)
+            return
+        self.states[idx] = balances.copy()
+        if len(self.states) > self.capacity:
+            self.states.popitem(last=False)
+
+    # find the first candidate block with a snapshot, returns (position in candidates, balances) or (None, None)
+    def lookup(self, candidates):
+        for pos, idx in enumerate(candidates):
+            state = self.states.get(idx)
+            if state is not None:
+                self.states.move_to_end(idx)
+                self.hits += 1
+                return pos, state
+        self.misses += 1
+        return None, None
@@ -1,18 +1,17 @@
-DEBUG = True
-if not DEBUG:
-    print = lambda *x : x
-
 # import all the required libraries
 import argparse
+import numpy as np
 from graph import Graph
 from simulator import Simulator
+from eventlog import EventLog, WRITERS
+from eventtrace import TraceWriter
 import peer
-import igraph as ig
 
 # constants to initialise the malicious nodes
 ZETA = 3 # number of malicious nodes' neighbours
 ADD_MALICIOUS = True # add malicious nodes or not
 MALICIOUS_POWER = 0.3
+LOG_LEVELS = "info" # level of every category of the event log, e.g. "info" or "info,txn=debug,block=off"
 
 # function to get the input arguments 
 def fetch_args():
@@ -21,8 +20,25 @@ def fetch_args():
     parser.add_argument("--z1", type=float, default=0.5) 
     parser.add_argument("--n", type=int, default=10)
     parser.add_argument("--simtime", type=int, default=10000)
+    parser.add_argument("--engine", choices=["process", "callback", "flood"], default="callback") # message delivery engine
+    parser.add_argument("--topology", choices=["regular", "ws", "geo", "degree"], default="regular") # generator of the network topology
+    parser.add_argument("--plot", action="store_true") # draw the topology (in a separate worker after the simulation)
+    parser.add_argument("--seed", type=int, default=73) # seed of the random streams of the simulation
+    parser.add_argument("--checkpoint_every", type=float, default=None) # simulated time between two checkpoints (needs the scheduler)
+    parser.add_argument("--checkpoint", default="checkpoint_{time}.npz") # file of the checkpoints
+    parser.add_argument("--resume", default=None) # checkpoint to continue from
+    parser.add_argument("--mining", choices=["process", "scheduler"], default="process") # per-node mining processes or one network-wide race
+    parser.add_argument("--workers", type=int, default=1) # worker processes of the parallel engine (same results as --mining scheduler)
+    parser.add_argument("--log", default=LOG_LEVELS) # levels of the event log categories (net, txn, block, fork, mining, attacker)
+    parser.add_argument("--log_format", choices=list(WRITERS), default="text") # format of the event log records
+    parser.add_argument("--log_file", default=None) # file of the event log (stdout if not given)
+    parser.add_argument("--outputs", choices=["text", "npz", "both"], default="text") # per-peer text files and/or one deduplicated .npz
+    parser.add_argument("--trace", default=None) # directory of the binary event trace for replay (not written if not given)
     
     args = parser.parse_args()
+    # the checkpoints only hold the state of the callback engine and of the mining scheduler
+    if (args.checkpoint_every or args.resume) and args.workers <= 1 and (args.engine != "callback" or args.mining != "scheduler"):
+        parser.error("--checkpoint_every and --resume need --engine callback and --mining scheduler")
     return args
 
 
@@ -30,21 +46,49 @@ if __name__ == "__main__":
     # initialize all the declared arguments
     args = fetch_args()
     peer.TOTAL_NODES = args.n
+    log = EventLog(args.log, args.log_file, args.log_format)
+    trace = TraceWriter()
+    if args.trace:
+        trace.open(args.trace)
 
     # create the connected graph of the topology of the nodes
     grph = Graph(args)
-    g = grph.create_graph(add_malicious=ADD_MALICIOUS, zeta=ZETA)
-    g.write_svg("graph.svg")
-    ig.plot(g, "graph.png")
+    grph.create_graph(add_malicious=ADD_MALICIOUS, zeta=ZETA)
 
     print("Fast Nodes", grph.fast_nodes)
     print("Slow Nodes", grph.slow_nodes)
     print("HighCPU Nodes", grph.highcpu_nodes)
     print("LowCPU Nodes", grph.lowcpu_nodes)
+    if ADD_MALICIOUS:
+        print("Malicious neigh: ", grph.malicious_neighbours)
 
     # start the simulator and then print the output of all the peers
-    sim = Simulator(args, grph, add_malicious=ADD_MALICIOUS, malicious_power=MALICIOUS_POWER)
-    sim.start_simulation()
-    sim.print_all_peer_output()
-    sim.print_all_peer_graphs()
+    if args.workers > 1:
+        if args.checkpoint_every or args.resume or args.trace:
+            raise Exception("Checkpoints and traces are not supported by the parallel engine")
+        from parallel import ParallelSimulator
+        sim = ParallelSimulator(args, grph, args.workers, add_malicious=ADD_MALICIOUS, malicious_power=MALICIOUS_POWER, seed=args.seed, log=log)
+        sim.start_simulation()
+    else:
+        sim = Simulator(args, grph, add_malicious=ADD_MALICIOUS, malicious_power=MALICIOUS_POWER, engine=args.engine, mining=args.mining, seed=args.seed, log=log, trace=trace)
+        checkpoint_times = np.arange(args.checkpoint_every, args.simtime, args.checkpoint_every).tolist() if args.checkpoint_every else ()
+        if args.resume:
+            sim.resume(args.resume, checkpoint_times, args.checkpoint)
+        else:
+            sim.start_simulation(checkpoint_times, args.checkpoint)
+    log.close()
+    trace.close()
+    if args.plot:
+        import plotting # matplotlib and igraph are only imported when plotting
+        plot_worker = plotting.start_plot_worker(args.n, grph.edgelist, ADD_MALICIOUS)
+    print("Gossip stats", sim.gossip_stats())
+    if args.outputs != "npz":
+        sim.print_all_peer_output()
+        sim.print_all_peer_graphs()
+    if args.outputs != "text":
+        sim.write_outputs()
+    if args.workers > 1:
+        sim.close()
+    if args.plot:
+        plot_worker.join()
 
@@ -0,0 +1,100 @@
+### bounded transaction pool of a peer with a per-sender index for building the block templates
+
+from collections import OrderedDict
+
+MEMPOOL_SIZE = 5000 # maximum number of transactions in the pool, the oldest are evicted first
+MEMPOOL_EXPIRY = 600000 # time after which a transaction that is still in the pool is dropped
+
+# Class keeping the unconfirmed transactions of a peer in arrival order, indexed by sender
+class Mempool:
+    def __init__(self, capacity=MEMPOOL_SIZE, expiry=MEMPOOL_EXPIRY):
+        self.capacity = capacity
+        self.expiry = expiry
+        self.txns = OrderedDict() # transaction id to transaction, in arrival order
+        self.entry = {} # transaction id to (arrival order, arrival time)
+        self.by_sender = {} # sender to the OrderedDict {id: transaction} of its transactions in arrival order
+        self.min_amount = {} # sender to the smallest amount among its transactions
+        self.seq = 0 # arrival order of the next transaction
+        self.evicted = 0 # number of transactions dropped because the pool was full
+        self.expired = 0 # number of transactions dropped because they were too old
+
+    def __len__(self):
+        return len(self.txns)
+
+    def __contains__(self, txn_id):
+        return txn_id in self.txns
+
+    # transactions in arrival order
+    def values(self):
+        return self.txns.values()
+
+    # arrival time of a transaction of the pool
+    def time_of(self, txn_id):
+        return self.entry[txn_id][1]
+
+    # add a transaction at the end of the pool (a transaction already in the pool keeps its place)
+    def add(self, txn, now):
+        txn_id = txn.get_id()
+        if txn_id in self.txns:
+            return
+        self.txns[txn_id] = txn
+        self.entry[txn_id] = (self.seq, now)
+        self.seq += 1
+        self.by_sender.setdefault(txn.sender, OrderedDict())[txn_id] = txn
+        self.min_amount[txn.sender] = min(self.min_amount.get(txn.sender, txn.amount), txn.amount)
+        while self.txns:
+            oldest = next(iter(self.txns))
+            if now - self.entry[oldest][1] > self.expiry:
+                self.expired += 1
+            elif len(self.txns) > self.capacity:
+                self.evicted += 1
+            else:
+                break
+            self.remove(oldest)
+
+    # remove a transaction if it is in the pool
+    def remove(self, txn_id):
+        txn = self.txns.pop(txn_id, None)
+        if txn is None:
+            return
+        del self.entry[txn_id]
+        pending = self.by_sender[txn.sender]
+        del pending[txn_id]
+        if not pending:
+            del self.by_sender[txn.sender]
+            del self.min_amount[txn.sender]
+        elif txn.amount == self.min_amount[txn.sender]:
+            self.min_amount[txn.sender] = min(elem.amount for elem in pending.values())
+
+    # remove the transactions of a set of ids that are in the pool
+    def remove_ids(self, txn_ids):
+        for txn_id in txn_ids & self.txns.keys():
+            self.remove(txn_id)
+
+    # the transactions a template takes from the pool: scanning the pool in arrival order, the first `limit` ones that are
+    # not in exclude and that the sender can afford over the balances plus the changes of the transactions taken before
+    # (the same picks as Block.add_txn over the whole pool), only the senders that can afford a transaction are visited
+    def select(self, balances, limit, exclude=()):
+        picked = []
+        deltas = {}
+        after = -1 # arrival order of the last pick, the scan never goes back
+        while len(picked) < limit:
+            best, best_seq = None, None
+            for sender, pending in self.by_sender.items():
+                budget = balances[sender] + deltas.get(sender, 0)
+                if budget < self.min_amount[sender]:
+                    continue
+                for txn_id, txn in pending.items():
+                    seq = self.entry[txn_id][0]
+                    if best is not None and seq >= best_seq:
+                        break
+                    if seq > after and txn.amount <= budget and txn_id not in exclude:
+                        best, best_seq = txn, seq
+                        break
+            if best is None:
+                break
+            picked.append(best)
+            deltas[best.sender] = deltas.get(best.sender, 0) - best.amount
+            deltas[best.receiver] = deltas.get(best.receiver, 0) + best.amount
+            after = best_seq
+        return picked
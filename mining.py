@@ -0,0 +1,43 @@
+### single mining race for the whole network instead of one interruptible process per node
+
+import numpy as np
+
+# Class drawing the next block of the network from the total hashing power
+class MiningScheduler:
+    def __init__(self, env, peers, avg_inter_arrival, stream):
+        self.env = env
+        self.stream = stream # random stream of the race
+        self.peers = peers
+        self.avg_inter_arrival = avg_inter_arrival
+        self.update_power()
+        self.blocks_won = np.zeros(len(peers), dtype=np.int64) # number of races won by each node
+        self.wakeup = None # pending event ending the current race
+
+    # read the hashing power of the peers, the winner of a race is picked with the shares at the time it ends
+    def update_power(self):
+        power = np.array([elem.fraction_hashing_power for elem in self.peers], dtype=float)
+        # the minimum of independent exponential clocks is exponential with the total rate, and the
+        # node whose clock fires first is picked in proportion to its rate (memoryless property)
+        self.mean = self.avg_inter_arrival/power.sum() # mean time between two blocks of the network
+        self.cum_share = np.cumsum(power)/power.sum() # cumulative share of the hashing power
+
+    # process running the race, a resumed race first waits for the restored wakeup event
+    def run(self, wakeup=None):
+        if wakeup is not None:
+            self.wakeup = wakeup
+            yield wakeup
+            self.win()
+        while True:
+            self.wakeup = self.env.timeout(self.stream.exponential(self.mean))
+            yield self.wakeup
+            self.win()
+
+    # pick the winner of the race, only the winner builds a block template
+    def win(self):
+        winner = self.draw_winner()
+        self.blocks_won[winner] += 1
+        self.peers[winner].win_block()
+
+    # node whose clock fires first, drawn in proportion to the hashing power
+    def draw_winner(self):
+        return min(int(np.searchsorted(self.cum_share, self.stream.random(), side="right")), len(self.peers)-1)
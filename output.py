@@ -0,0 +1,103 @@
+### deduplicated output of the block trees of the peers: the block DAG shared by all the peers is written once, next to a
+### peer x block matrix of arrival times, in one .npz file. The per-peer text and DOT files are produced from it on demand
+
+import os
+import argparse
+import numpy as np
+from peer import time_str
+
+OUTPUT_PATH = "peer_trees.npz" # default file of the deduplicated output
+
+# arrival state of one peer: (node, indices of the known blocks in arrival order, their arrival times, index of the
+# chain head, number of own blocks in the main chain, number of blocks mined), the genesis block is not counted as mined
+def peer_row(elem):
+    known = elem.view.known_blocks()
+    head = elem.store.index(elem.chain_head)
+    return elem.node, known.copy(), elem.view.arrival[known], head, int(elem.blocks_in_chain(elem.chain_head)), len(elem.gen_block_hashes)
+
+# arrays of the deduplicated output: the DAG from the store, one row of the arrival matrix per peer (NaN for unknown)
+# and the arrival order of the blocks of every peer (order[order_offsets[i]:order_offsets[i+1]] for the peer of row i)
+def tree_arrays(store, rows):
+    size = store.size
+    lengths = np.array([len(row[1]) for row in rows], dtype=np.int64)
+    order_offsets = np.zeros(len(rows)+1, dtype=np.int64)
+    np.cumsum(lengths, out=order_offsets[1:])
+    order = np.concatenate([row[1] for row in rows]).astype(np.int32) if rows else np.zeros(0, dtype=np.int32)
+    # one scatter of all the arrival times: row of every known block, its index, its time
+    arrival = np.full((len(rows), size), np.nan)
+    if rows:
+        arrival[np.repeat(np.arange(len(rows)), lengths), order] = np.concatenate([row[2] for row in rows])
+    blocks = store.blocks[:size]
+    return {
+        "parent": store.parent[:size].copy(),
+        "height": store.height[:size].copy(),
+        "miner": np.array([-1 if blk.gen_by is None else blk.gen_by for blk in blocks], dtype=np.int64),
+        "created": np.array([blk.tm for blk in blocks], dtype=np.float64),
+        "digest": np.frombuffer(b"".join(bytes.fromhex(blk.get_id()) for blk in blocks), dtype=np.uint8).reshape(size, 32),
+        "nodes": np.array([row[0] for row in rows], dtype=np.int64),
+        "arrival": arrival,
+        "order": order,
+        "order_offsets": order_offsets,
+        "head": np.array([row[3] for row in rows], dtype=np.int64),
+        "self_in_main": np.array([row[4] for row in rows], dtype=np.int64),
+        "mined": np.array([row[5] for row in rows], dtype=np.int64),
+    }
+
+# write the deduplicated output of the peers
+def write_trees(store, rows, path=OUTPUT_PATH):
+    np.savez(path, **tree_arrays(store, rows))
+
+# Class reading a deduplicated output and producing the files of single peers
+class TreeOutput:
+    def __init__(self, path):
+        with np.load(path) as data:
+            for name in data.files:
+                setattr(self, name, data[name])
+        self.row_of = {node: pos for pos, node in enumerate(self.nodes.tolist())}
+
+    # edges (parent, child, arrival of the parent, arrival of the child) of the tree of a node in arrival order
+    def edges(self, node):
+        pos = self.row_of[node]
+        times = self.arrival[pos]
+        known = self.order[self.order_offsets[pos]+1:self.order_offsets[pos+1]] # the genesis block has no edge
+        parents = self.parent[known]
+        return zip(parents.tolist(), known.tolist(), times[parents].tolist(), times[known].tolist())
+
+    # DOT graph of the tree of a node, the blocks are labelled with their index
+    def dot(self, node):
+        lines = [f'"{p}(Ta={pt:.3f};By: {self.miner_str(p)})" -> "{c}(Ta={ct:.3f};By: {self.miner_str(c)})";' for p, c, pt, ct in self.edges(node)]
+        return "digraph unix {\nsize=\"7,5\"; \n node [color=goldenrod2, style=filled];\n" + "\n".join(lines) + "\n}"
+
+    # text tree of a node with the block hashes and the share of its own blocks in its main chain
+    def tree(self, node):
+        pos = self.row_of[node]
+        height = int(self.height[self.head[pos]])
+        own, mined = int(self.self_in_main[pos]) + 1, int(self.mined[pos]) + 1 # the genesis block counts for every peer
+        edges = "\n".join(f'"{self.digest[p].tobytes().hex()}({time_str(pt)})" -> "{self.digest[c].tobytes().hex()}({time_str(ct)})";' for p, c, pt, ct in self.edges(node))
+        return (f"{edges}\n{own}/{height+1} blocks in main chain(={own/(height+1)})\n"
+                f"{own}/{mined} (blks in main)/(total gen by this peer) (={own/mined})\n")
+
+    def miner_str(self, idx):
+        return "None" if self.miner[idx] < 0 else str(self.miner[idx])
+
+    # write the files of the given nodes (all by default), kind is "dot" or "tree"
+    def write_files(self, directory, kind="dot", nodes=None):
+        os.makedirs(directory, exist_ok=True)
+        render = self.dot if kind == "dot" else self.tree
+        for node in (self.nodes.tolist() if nodes is None else nodes):
+            with open(os.path.join(directory, f"peer_{node}.{kind}"), "w") as f:
+                f.write(render(node))
+
+# function to get the input arguments
+def fetch_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default=OUTPUT_PATH) # deduplicated output of a run
+    parser.add_argument("--kind", choices=["dot", "tree"], default="dot")
+    parser.add_argument("--nodes", type=int, nargs="*", default=None) # all the peers if not given
+    parser.add_argument("--out", default="peer_files")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = fetch_args()
+    TreeOutput(args.path).write_files(args.out, args.kind, args.nodes)
@@ -0,0 +1,384 @@
+### conservative parallel execution of the simulation: the peers are split into parts with few links between them and
+### every part runs only its own peers in its own worker process. Every hop takes at least the latency of its link, so an
+### event at a node reaches another part no sooner than the shortest latency path from the node out of its part. The
+### workers advance together up to the earliest such time over all the pending events and only exchange the messages
+### and the newly mined blocks at the window boundaries. The mining race and the transaction source do not depend on
+### the state of the network, so the coordinator draws them up front and hands every worker the events of its nodes.
+
+import sys
+import traceback
+import multiprocessing
+import numpy as np
+from simpy.events import Event, NORMAL
+import peer
+import ledger
+from engine import CallbackEngine, Hop, schedule_at
+from mining import MiningScheduler
+from transactions import TransactionSource
+from partition import partition, cut_size, cut_distances
+from simulator import Simulator, EXPO_MEAN
+from eventlog import EventLog
+from output import peer_row, write_trees, OUTPUT_PATH
+from attackerlog import EVENTS_PATH
+
+WIN, TXN = 0, 1 # kinds of the scheduled events
+
+# plain tuple of a transaction that can be sent to another process
+def txn_record(txn):
+    return (txn.sender, txn.receiver, txn.amount, txn.serial)
+
+# transaction of a record, one object per serial in every process
+def txn_from(record, txns):
+    txn = txns.get(record[3])
+    if txn is None:
+        txn = txns[record[3]] = peer.Transaction(*record)
+    return txn
+
+# plain tuple of a block and its slot in the store
+def block_record(blk, idx):
+    return (idx, blk.prev_hash, blk.tm, blk.gen_by, [txn_record(txn) for txn in blk.block_txn_list], blk.get_id())
+
+# block rebuilt from a record, checked against its original id
+def block_from(record, env, txns):
+    idx, prev_hash, tm, gen_by, txn_records, blk_id = record
+    blk = peer.Block(prev_hash, env)
+    blk.tm = tm
+    blk.block_txn_list = [txn_from(elem, txns) for elem in txn_records]
+    blk.deltas = ledger.txn_deltas(blk.block_txn_list)
+    blk.block_size = 1 + sum(txn.sender is not None for txn in blk.block_txn_list)
+    blk.set_gen_by(gen_by)
+    if blk.seal() != blk_id:
+        raise Exception(f"Block {idx} does not hash to its id after the transfer")
+    return blk
+
+# event already triggered, calling fn when it is processed
+def call_event(env, fn):
+    event = Event(env)
+    event._ok, event._value = True, None
+    event.callbacks.append(lambda _: fn())
+    return event
+
+# Class delivering the hops inside the part like the callback engine, the hops leaving the part are
+# collected with their arrival time once their delay is drawn
+class PartitionEngine(CallbackEngine):
+    def __init__(self, env, delay, store, local, reach):
+        super().__init__(env, delay)
+        self.store = store
+        self.local = local # mask of the nodes of this part
+        self.reach = reach.tolist() # shortest latency from every node to another part
+        self.txns = {} # serial to transaction object
+        self.outbox = [] # (arrival time, sender, receiver, size, is block, block slot or transaction record)
+        self.arrivals, self.bounds = [], [] # arrival time and earliest time to reach another part of the new hops inside the part
+        self.pending = np.zeros((2, 0)) # the same for the hops of the earlier windows that had not arrived
+
+    # deliver a block from node s to peer r, inside the part or to another part
+    def deliver_block(self, s, r, size, blk):
+        (LocalHop if self.local[r.node] else RemoteHop)(self, s, r, size, True, blk)
+
+    # deliver a transaction from node s to peer r, inside the part or to another part
+    def deliver_txn(self, s, r, size, txn):
+        (LocalHop if self.local[r.node] else RemoteHop)(self, s, r, size, False, txn)
+
+    # a hop inside the part arrives at node r at time tm
+    def track(self, tm, r):
+        self.arrivals.append(tm)
+        self.bounds.append(tm + self.reach[r])
+
+    # earliest time a message caused by the hops still in flight inside the part can reach another part, the hops
+    # arriving before now have been delivered and are forgotten
+    def horizon(self, now):
+        hops = np.concatenate((self.pending, np.array((self.arrivals, self.bounds))), axis=1)
+        self.pending = hops[:, hops[0] >= now]
+        self.arrivals, self.bounds = [], []
+        return float(self.pending[1].min()) if self.pending.shape[1] else np.inf
+
+    # hop to another part with its arrival time
+    def send_remote(self, hop, tm):
+        if hop.is_block:
+            payload = self.store.index(hop.msg.get_id())
+        else:
+            self.txns.setdefault(hop.msg.serial, hop.msg)
+            payload = txn_record(hop.msg)
+        self.outbox.append((tm, hop.s, hop.r.node, hop.size, hop.is_block, payload))
+
+# hop inside the part, its arrival time bounds the next window
+class LocalHop(Hop):
+    def start(self, _):
+        delay = self.engine.delay.get_delay(self.s, self.r.node, self.size)
+        self.callbacks = [self.arrive]
+        self.env.schedule(self, NORMAL, delay)
+        self.engine.track(self.env.now + delay, self.r.node)
+
+# hop leaving the part, the delay is drawn at the same point as for a local hop so the draws of the sender keep their order
+class RemoteHop(Hop):
+    def start(self, _):
+        self.engine.send_remote(self, self.env.now + self.engine.delay.get_delay(self.s, self.r.node, self.size))
+
+# Class running the peers of one part inside a worker process, the nodes of the other parts are stubs
+class PartitionWorker:
+    def __init__(self, args, graph, part, index, options, log, reach):
+        self.nodes = np.flatnonzero(part == index).tolist() # nodes of this part
+        self.sim = Simulator(args, graph, mining="scheduler", log=log, nodes=self.nodes, **options)
+        self.env, self.store, self.peers = self.sim.env, self.sim.store, self.sim.peer_list
+        self.engine = PartitionEngine(self.env, self.sim.delay, self.store, part == index, reach)
+        self.sim.engine = self.engine
+        for node in self.nodes:
+            self.peers[node].set_engine(self.engine)
+        self.mined = [] # slots of the blocks mined in this part during the current window
+
+    # the node wins the race, its block goes to the slot of its global mining order
+    def win(self, node, serial, idx):
+        self.sim.serials.next_serial = serial # serials follow the global creation order
+        self.store.reserved = idx
+        self.peers[node].win_block()
+        assert self.store.reserved is None and self.store.index(self.peers[node].gen_block_hashes[-1]) == idx
+        self.mined.append(idx)
+
+    # the node creates a transaction
+    def txn(self, node, serial, receiver, amount):
+        self.sim.serials.next_serial = serial
+        self.peers[node].generate_txn(receiver, amount)
+
+    # run one window: add the blocks of the other parts, schedule the arriving hops and the events of the window
+    def window(self, until, blocks, hops, events):
+        for record in blocks:
+            blk = block_from(record, self.env, self.engine.txns)
+            self.store.add(blk, record[0])
+        for tm, s, r, size, is_block, payload in hops:
+            msg = self.store.block(payload) if is_block else txn_from(payload, self.engine.txns)
+            schedule_at(self.env, Hop(self.engine, s, self.peers[r], size, is_block, msg, in_flight=True), tm, NORMAL)
+            self.engine.track(tm, r)
+        for tm, kind, node, serial, a, b in events:
+            fn = (lambda node=node, serial=serial, a=a: self.win(node, serial, a)) if kind == WIN else \
+                 (lambda node=node, serial=serial, a=a, b=b: self.txn(node, serial, a, b))
+            schedule_at(self.env, call_event(self.env, fn), tm, NORMAL)
+        self.env.run(until=until)
+        for idx in self.mined:
+            self.engine.txns.update((txn.serial, txn) for txn in self.store.block(idx).block_txn_list)
+        outbox, mined = self.engine.outbox, [block_record(self.store.block(idx), idx) for idx in self.mined]
+        self.engine.outbox, self.mined = [], []
+        return outbox, mined, self.engine.horizon(until)
+
+    # write the remaining records of the attacker if it is in this part
+    def flush_events(self):
+        adv = self.peers[-1]
+        if self.sim.add_malicious and adv.node in self.nodes:
+            adv.recorder.flush()
+
+    # chain state of the nodes of this part and their gossip counters
+    def state(self):
+        local = [self.peers[node] for node in self.nodes]
+        heads = {elem.node: (elem.chain_head, elem.chain_height) for elem in local}
+        gen = {elem.node: elem.gen_block_hashes for elem in local}
+        return {"heads": heads, "gen": gen, "gossip": self.sim.gossip_stats(local)}
+
+    # output files of the nodes of this part
+    def print_all_peer_output(self):
+        for node in self.nodes:
+            self.peers[node].print_tree(f"./peer_outputs/peer_{node}.txt")
+
+    def print_all_peer_graphs(self):
+        for node in self.nodes:
+            self.peers[node].graph_print(f"./peer_graphs/peer_{node}.txt")
+
+    # arrival state of the nodes of this part for the deduplicated output
+    def peer_rows(self):
+        return [peer_row(self.peers[node]) for node in self.nodes]
+
+# main loop of a worker process, every request is (method name, arguments) and gets (ok, result) back
+def worker_main(conn, args, graph, part, index, options, log, reach):
+    try:
+        worker = PartitionWorker(args, graph, part, index, options, log, reach)
+        conn.send((True, None))
+        while True:
+            name, params = conn.recv()
+            if name == "stop":
+                break
+            result = getattr(worker, name)(*params)
+            sys.stdout.flush()
+            conn.send((True, result))
+    except BaseException:
+        conn.send((False, traceback.format_exc()))
+    finally:
+        log.flush()
+        sys.stdout.flush()
+        conn.close()
+
+# Class running the simulation on several worker processes, with the same results as the sequential simulator using
+# the callback engine and the mining scheduler for the same seed
+class ParallelSimulator:
+    def __init__(self, args, graph, workers, add_malicious=False, malicious_power=0.3, seed=73, malicious_type=peer.MALICIOUS_TYPE, log=None, events_path=EVENTS_PATH):
+        self.args = args
+        self.log = log if log is not None else EventLog() # shared with the workers, which write to the same destination
+        self.graph = graph
+        self.simtime = args.simtime
+        self.workers = workers
+        self.options = {"add_malicious": add_malicious, "malicious_power": malicious_power, "seed": seed, "malicious_type": malicious_type,
+                        "events_path": events_path} # the worker running the attacker writes its events
+        # the coordinator keeps the full block store and draws the network-wide races, all its peers are stubs
+        self.sim = Simulator(args, graph, mining="scheduler", log=self.log, nodes=(), **self.options)
+        self.store = self.sim.store
+        self.txns = {}
+        nodes = len(self.sim.peer_list)
+        self.part = partition(nodes, graph.edgelist, workers)
+        self.cut = cut_size(graph.edgelist, self.part)
+        delay = self.sim.delay
+        self.reach = cut_distances(delay.indptr, delay.indices, delay.rho, self.part) # lower bound of the delay to another part
+        self.windows = 0 # number of windows run
+        self.conns, self.procs = [], []
+
+    # mining wins (time, winner) and transactions (time, sender, receiver, amount) before the end of the simulation,
+    # drawn in the same order as the mining scheduler and the transaction source of a sequential run
+    def draw_schedule(self):
+        env, peers, streams = self.sim.env, self.sim.peer_list, self.sim.streams
+        scheduler = MiningScheduler(env, peers, peer.AVG_INTER_ARRIVAL, streams.stream("mining"))
+        wins, tm = [], 0.0
+        while True:
+            tm = tm + scheduler.stream.exponential(scheduler.mean)
+            if tm >= self.simtime:
+                break
+            wins.append((tm, scheduler.draw_winner()))
+        source = TransactionSource(env, peers, EXPO_MEAN, peer.MAX_COIN, streams.stream("txn").rng)
+        txns, tm = [], 0.0
+        while True:
+            if source.pos == len(source.gaps):
+                source.gaps, source.senders, source.receivers, source.amounts = source.draw_batch()
+                source.pos = 0
+            pos = source.pos
+            source.pos += 1
+            tm = tm + source.gaps[pos]
+            if tm >= self.simtime:
+                break
+            txns.append((tm, source.senders[pos], source.receivers[pos], source.amounts[pos]))
+        return wins, txns
+
+    # events of every worker as (time, kind, node, serial, a, b), the serials of the transactions (one coinbase per
+    # win) and the slots of the blocks (one per win, after the genesis block) follow the global time order. With them,
+    # the earliest time the events from each position on can reach another part (inf after the last one)
+    def schedule_events(self, wins, txns):
+        events = [(tm, WIN, node, 0, idx+1, None) for idx, (tm, node) in enumerate(wins)]
+        events += [(tm, TXN, node, 0, receiver, amount) for tm, node, receiver, amount in txns]
+        events.sort(key=lambda event: event[0])
+        events = [(tm, kind, node, serial, a, b) for serial, (tm, kind, node, _, a, b) in enumerate(events)]
+        per_worker = [[] for _ in range(self.workers)]
+        for event in events:
+            per_worker[self.part[event[2]]].append(event)
+        bounds = []
+        for evs in per_worker:
+            reach = np.array([tm + self.reach[node] for tm, _, node, _, _, _ in evs] + [np.inf])
+            bounds.append(np.minimum.accumulate(reach[::-1])[::-1].tolist())
+        return per_worker, bounds
+
+    # send a request to every worker (params_of(index) gives the arguments) and gather the results
+    def call(self, name, params_of=lambda index: ()):
+        for index, conn in enumerate(self.conns):
+            conn.send((name, params_of(index)))
+        return [self.receive(conn) for conn in self.conns]
+
+    # result of a worker, its traceback is raised if it failed
+    def receive(self, conn):
+        ok, result = conn.recv()
+        if not ok:
+            self.close()
+            raise Exception(f"Worker failed:\n{result}")
+        return result
+
+    # start the workers and run the simulation window by window
+    def start_simulation(self):
+        ctx = multiprocessing.get_context("fork") # the workers inherit the graph without pickling it
+        self.log.flush() # the workers would write the buffered records a second time
+        sys.stdout.flush()
+        for index in range(self.workers):
+            parent_conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(target=worker_main, args=(child_conn, self.args, self.graph, self.part, index, self.options, self.log, self.reach))
+            proc.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.procs.append(proc)
+        for conn in self.conns:
+            self.receive(conn)
+
+        events, bounds = self.schedule_events(*self.draw_schedule())
+        pos = [0]*self.workers
+        blocks = [[] for _ in range(self.workers)] # blocks to add in every worker before its next window
+        hops = [[] for _ in range(self.workers)] # hops arriving in every worker
+        horizons = [np.inf]*self.workers # earliest time the hops in flight inside every worker reach another part
+        start = 0
+        while start < self.simtime:
+            # nothing can cross the cut before the earliest reach of the hops in flight, the hops arriving and the
+            # events not yet run, so every worker runs up to that time independently
+            until = min([self.simtime] + horizons + [bound[p] for bound, p in zip(bounds, pos)] +
+                        [tm + self.reach[r] for evs in hops for tm, _, r, _, _, _ in evs])
+            window_events = []
+            for index, evs in enumerate(events):
+                end = pos[index]
+                while end < len(evs) and evs[end][0] < until:
+                    end += 1
+                window_events.append(evs[pos[index]:end])
+                pos[index] = end
+            results = self.call("window", lambda index: (until, blocks[index], hops[index], window_events[index]))
+            self.windows += 1
+            horizons = [horizon for _, _, horizon in results]
+            blocks = [[] for _ in range(self.workers)]
+            hops = [[] for _ in range(self.workers)]
+            mined = sorted((record for _, records, _ in results for record in records), key=lambda record: record[0])
+            for index, (outbox, records, _) in enumerate(results):
+                for hop in outbox:
+                    hops[self.part[hop[2]]].append(hop)
+                for other in range(self.workers):
+                    if other != index:
+                        blocks[other].extend(records)
+            for index in range(self.workers):
+                blocks[index].sort(key=lambda record: record[0]) # parents before children
+                hops[index].sort(key=lambda hop: hop[0])
+            for record in mined:
+                self.store.add(block_from(record, self.sim.env, self.txns), record[0])
+            start = until
+        self.call("flush_events")
+
+    # gossip counters summed over the workers
+    def gossip_stats(self, states=None):
+        states = states or self.call("state")
+        return {key: sum(state["gossip"][key] for state in states) for key in states[0]["gossip"]}
+
+    # summary metrics of the run, the same as Simulator.summary
+    def summary(self):
+        states = self.call("state")
+        heads = {node: head for state in states for node, head in state["heads"].items()}
+        gen = {node: hashes for state in states for node, hashes in state["gen"].items()}
+        chain_head, chain_height = heads[0]
+        summary = {"blocks_mined": self.store.num_mined(), "main_chain_length": int(chain_height)}
+        summary["mpu_overall"] = chain_height/max(1, self.store.num_mined())
+        if self.options["add_malicious"]:
+            adv_blocks = gen[len(self.sim.peer_list)-1]
+            head_idx = self.store.index(chain_head)
+            adv_in_main = sum(self.store.in_chain(self.store.index(blk_hash), head_idx) for blk_hash in adv_blocks)
+            summary["adversary_mined"] = len(adv_blocks)
+            summary["adversary_in_main"] = adv_in_main
+            summary["mpu_adv"] = adv_in_main/max(1, len(adv_blocks))
+            summary["adversary_share"] = adv_in_main/max(1, chain_height)
+        summary.update(self.gossip_stats(states))
+        return summary
+
+    # every worker writes the files of its own peers
+    def print_all_peer_output(self):
+        self.call("print_all_peer_output")
+
+    def print_all_peer_graphs(self):
+        self.call("print_all_peer_graphs")
+
+    # the coordinator store holds every block, the rows come from the workers
+    def write_outputs(self, path=OUTPUT_PATH):
+        rows = sorted((row for rows in self.call("peer_rows") for row in rows), key=lambda row: row[0])
+        write_trees(self.store, rows, path)
+
+    # stop the workers
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(("stop", ()))
+            except OSError:
+                pass
+        for proc in self.procs:
+            proc.join()
+        self.conns, self.procs = [], []
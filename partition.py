@@ -0,0 +1,90 @@
+### partitioning of the peers into balanced parts with few edges between them (for the parallel engine)
+
+import numpy as np
+
+REFINE_PASSES = 8 # passes of boundary refinement
+IMBALANCE = 1.03 # a part can hold up to this factor times the average number of nodes
+
+# CSR adjacency (indptr, indices) of an undirected edge list
+def adjacency(n, edges):
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    src = np.concatenate((edges[:, 0], edges[:, 1]))
+    dst = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n+1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order]
+
+# breadth first order of all the nodes (every component in turn)
+def bfs_order(n, indptr, indices):
+    seen = np.zeros(n, dtype=bool)
+    order = []
+    for root in range(n):
+        if seen[root]:
+            continue
+        seen[root] = True
+        frontier = np.array([root])
+        while len(frontier):
+            order.append(frontier)
+            nbrs = np.concatenate([indices[indptr[i]:indptr[i+1]] for i in frontier])
+            nbrs = np.unique(nbrs[~seen[nbrs]])
+            seen[nbrs] = True
+            frontier = nbrs
+    return np.concatenate(order)
+
+# part of every node: contiguous chunks of a BFS order, then greedy moves of the boundary nodes
+# to the part that holds most of their neighbours while the parts stay balanced
+def partition(n, edges, parts, passes=REFINE_PASSES):
+    part = np.zeros(n, dtype=np.int64)
+    if parts <= 1:
+        return part
+    indptr, indices = adjacency(n, edges)
+    part[bfs_order(n, indptr, indices)] = np.arange(n)*parts//n
+    sizes = np.bincount(part, minlength=parts)
+    cap = int(np.ceil(IMBALANCE*n/parts))
+
+    # number of neighbours of every node in every part
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    counts = np.zeros((n, parts), dtype=np.int64)
+    np.add.at(counts, (src, part[indices]), 1)
+    for _ in range(passes):
+        gain = counts.max(axis=1) - counts[np.arange(n), part]
+        moved = 0
+        for node in np.flatnonzero(gain > 0)[np.argsort(-gain[gain > 0], kind="stable")]:
+            old = part[node]
+            row = counts[node]
+            new = int(np.argmax(row))
+            if row[new] <= row[old] or sizes[new] >= cap:
+                continue
+            part[node] = new
+            sizes[old] -= 1
+            sizes[new] += 1
+            nbrs = indices[indptr[node]:indptr[node+1]]
+            np.subtract.at(counts[:, old], nbrs, 1)
+            np.add.at(counts[:, new], nbrs, 1)
+            moved += 1
+        if not moved:
+            break
+    return part
+
+# number of edges between different parts
+def cut_size(edges, part):
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    return int((part[edges[:, 0]] != part[edges[:, 1]]).sum())
+
+# smallest total latency from every node to a link leaving its part, along the directed CSR links (indptr, indices)
+# with the latencies weight: an event at a node cannot reach another part sooner (inf for a node with no such path)
+def cut_distances(indptr, indices, weight, part):
+    n = len(indptr)-1
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    cross = part[src] != part[indices]
+    dist = np.full(n, np.inf)
+    np.minimum.at(dist, src[cross], weight[cross])
+    inner_src, inner_dst, inner_weight = src[~cross], indices[~cross], weight[~cross]
+    for _ in range(n):
+        new = dist.copy()
+        np.minimum.at(new, inner_src, inner_weight + dist[inner_dst])
+        if np.array_equal(new, dist):
+            break
+        dist = new
+    return dist
@@ -1,18 +1,21 @@
 ### we have used simpy library to simulate the discrete-event simulator
 
+import abc
 import numpy as np
-import random
 import hashlib
-import time
+import struct
 import simpy
-import os
+from blockstore import PeerView
+from gossip import GossipFilter
+from mempool import Mempool
+import eventlog
+import eventtrace
+from attackerlog import AttackerRecorder
+import attackerlog
+import ledger
 
 MALICIOUS_TYPE = 1 # 0 for selfish miner and 1 for stub miner 
 
-# set the seed to use
-np.random.seed(73)
-random.seed(73)
-
 # initialize all the parameters
 LOW_RHO = 10     # Lower bound to propagration delay
 HIGH_RHO = 500   # Upper bound to propagration delay
@@ -23,84 +26,152 @@ AVG_INTER_ARRIVAL = 500   # average interarrival time for blocks
 MAX_TRANSACTION = 2  # max number of transactions in a block
 TOTAL_NODES = None # will be updated in main.py
 
-# set to convert the hashes into unique ids
-GLOBAL_BLOCK_HASHES = set()
-TOTAL_BLOCKS_MINED = 0
+# canonical byte layouts used for hashing (sender, receiver, amount, serial) and block timestamps
+TXN_STRUCT = struct.Struct("<qqdQ")
+BLK_TIME_STRUCT = struct.Struct("<d")
+
+# convert a sha256 digest into the hex id and the integer short id used as a dict key
+def digest_to_ids(digest):
+    return digest.hex(), int.from_bytes(digest[:8], "little")
+
+# format an arrival time the way simpy reports it (the genesis block arrives at the integer time 0)
+def time_str(tm):
+    return "0" if tm == 0 else str(float(tm))
+
+# Class numbering the transactions of one simulation in creation order, makes the ids reproducible across runs
+class TxnSerials:
+    def __init__(self, start=0):
+        self.next_serial = start # serial of the next transaction
+
+    def take(self):
+        self.next_serial += 1
+        return self.next_serial - 1
 
 # Class storing data of one transaction
 class Transaction:
-    def __init__(self, sender, receiver, amount):
+    def __init__(self, sender, receiver, amount, serial):
         self.sender = sender    # sender id
         self.receiver = receiver # receiver id
         self.amount = amount   # amount of coins
-        self.time = time.time() # time of transaction
+        self.serial = serial # serial number of the transaction (replaces the wall clock time)
+        # the id is computed once at creation and frozen
+        self.digest = hashlib.sha256(self.serialize()).digest()
+        self.id, self.short_id = digest_to_ids(self.digest)
         
     def __str__(self):
         return f"TxnID: ID {self.sender} pays ID {self.receiver} {self.amount:.4f} coins"
 
-    # taking hash of the transaction string + timestamp to get the unique transaction id
+    # canonical byte serialization of the transaction, coinbase sender is encoded as -1
+    def serialize(self):
+        return TXN_STRUCT.pack(-1 if self.sender is None else self.sender, self.receiver, self.amount, self.serial)
+
+    # the unique transaction id is the hash of the canonical serialization
     def get_id(self):
-        return hashlib.sha256((str(self.__str__()) + str(self.time)).encode()).hexdigest()
+        return self.id
 
 # Class for simulating network delays
 class Delays:
-    def __init__(self, total_nodes, fast_nodes):
-        # intialise the network delay paramters as given in doc
-        self.rho = np.random.randint(LOW_RHO, HIGH_RHO, (total_nodes, total_nodes))
+    def __init__(self, total_nodes, fast_nodes, edgelist, streams):
+        self.streams = streams # random streams of the simulation
+        self.delay_streams = [None]*total_nodes # queuing delay stream of each sender, created on first use
+
+        # messages only travel along the edges, so the parameters are kept per directed edge in CSR
+        # arrays (the edges of node i are indices[indptr[i]:indptr[i+1]], sorted by receiver)
+        edges = np.asarray(edgelist, dtype=np.int64).reshape(-1, 2)
+        src = np.concatenate((edges[:, 0], edges[:, 1]))
+        dst = np.concatenate((edges[:, 1], edges[:, 0]))
+        keys = np.unique(src*total_nodes + dst) # sorted by sender then receiver, without duplicates
+        src, dst = keys//total_nodes, keys%total_nodes
+        self.indptr = np.zeros(total_nodes+1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=total_nodes), out=self.indptr[1:])
+        self.indices = dst
 
-        # initialise all link speeds to 5 and later increase for fast pairs
-        self.link_speed = np.ones(shape=(total_nodes, total_nodes))*5
+        # intialise the network delay paramters as given in doc
+        self.rho = streams.stream("rho").rng.integers(LOW_RHO, HIGH_RHO, len(keys))
 
-        # get the pairs who have atleast one fast node
-        self.fast_pair = [(i,j) for i in fast_nodes for j in fast_nodes]
-        
-        # set the fast links to have link speed 100
-        for elem in self.fast_pair:
-            self.link_speed[elem] = 100
+        # links between two fast nodes have link speed 100, all the others 5
+        is_fast = np.zeros(total_nodes, dtype=bool)
+        is_fast[np.asarray(fast_nodes, dtype=np.int64)] = True
+        self.link_speed = np.where(is_fast[src] & is_fast[dst], 100.0, 5.0)
         self.inv_link_speed = 1/self.link_speed
 
         #calculate the d mean factor
         self.d_mean = QUEUE_DELAY_FACTOR/self.link_speed
 
+    # position of the directed edge from sender to receiver in the CSR arrays
+    def edge(self, sender, receiver):
+        lo, hi = self.indptr[sender], self.indptr[sender+1]
+        pos = lo + int(np.searchsorted(self.indices[lo:hi], receiver))
+        assert pos < hi and self.indices[pos] == receiver, "no link between the nodes"
+        return pos
+
     # calculate and return the delay
     def get_delay(self, sender, receiver, data_size):
-        return (self.rho[sender, receiver] + np.random.exponential(self.d_mean[sender, receiver]) 
-        + data_size*self.inv_link_speed[sender, receiver])
+        stream = self.delay_streams[sender]
+        if stream is None:
+            stream = self.delay_streams[sender] = self.streams.stream("delay", sender)
+        e = self.edge(sender, receiver)
+        return (self.rho[e] + stream.exponential(self.d_mean[e]) 
+        + data_size*self.inv_link_speed[e])
+
+    # delays of every directed link for one message, drawn at once (in the order of the CSR arrays)
+    def sample_links(self, data_size):
+        stream = self.streams.stream("links")
+        return (self.rho + stream.rng.exponential(self.d_mean) + data_size*self.inv_link_speed).tolist()
     
 # Class for storing block and validating transactions
 class Block:
-    def __init__(self, prev_hash, env, total_nodes=TOTAL_NODES):
+    def __init__(self, prev_hash, env, balances=None):
         self.prev_hash = prev_hash # hash of the previous block
         self.block_size = 1 # size of the block
         self.block_txn_list = [] # maintain the transaction list of the block
-        self.total_nodes = total_nodes # total number of nodes in the network
-        self.amount_list = np.zeros(self.total_nodes) # maintain the coin balances of all nodes
+        self.balances = balances # coin balances of the parent state, only read while the block is being built
+        self.deltas = {} # sparse balance changes {account: change} caused by the block
         self.tm = env.now # time of creation of the block
         self.gen_by = None # id of the node which generated the block
+        self.id = None # hex id of the block, set when the block is sealed
+        self.short_id = None # integer id of the block, set when the block is sealed
+        self.txn_ids = None # ids of the transactions confirmed by the block, set when the block is sealed
 
     # function to add and process the incoming transaction in the block
     def add_txn(self, txn):
+        # a sealed block cannot be modified anymore
+        if self.id is not None:
+            return False
         if self.block_size <= MAX_BLOCK_SIZE:
             # deal with coinbase transactions
             if txn.sender is None:
-                self.amount_list[txn.receiver] += txn.amount 
+                ledger.add_txn_delta(self.deltas, txn)
                 self.block_txn_list.append(txn)
                 return True
             # discard invalid transactions
-            if self.amount_list[txn.sender] < txn.amount:
+            if self.balances[txn.sender] + self.deltas.get(txn.sender, 0) < txn.amount:
                 return False
             # deal with normal transactions
-            self.amount_list[txn.sender] -= txn.amount
-            self.amount_list[txn.receiver] += txn.amount
+            ledger.add_txn_delta(self.deltas, txn)
             self.block_txn_list.append(txn)
             self.block_size += 1
             return True
         else:
             return False
 
-    # get the id of the block which is the hash of prevhash + txnlist + timestamp
+    # canonical byte serialization of the block: prevhash + timestamp + ids of the txns
+    def serialize(self):
+        return b"".join([self.prev_hash.encode(), BLK_TIME_STRUCT.pack(self.tm)] + [txn.digest for txn in self.block_txn_list])
+
+    # freeze the contents of the block and compute its id once
+    def seal(self):
+        if self.id is None:
+            self.id, self.short_id = digest_to_ids(hashlib.sha256(self.serialize()).digest())
+            self.txn_ids = frozenset(txn.get_id() for txn in self.block_txn_list)
+            self.balances = None # the block keeps only its deltas
+        return self.id
+
+    # get the id of the block which is the hash of the canonical serialization (seals the block if needed)
     def get_id(self):
-        return hashlib.sha256((str(self.prev_hash)+str(self.block_txn_list)+str(self.tm)).encode()).hexdigest()
+        if self.id is None:
+            return self.seal()
+        return self.id
 
     # get the generation of the block
     def set_gen_by(self, g):
@@ -108,789 +179,491 @@ class Block:
 
 # class to deal with all the functions of the nodes
 class Peer:
-    def __init__(self, node, mean, total_nodes, env, delay, genesis_block):
+    def __init__(self, node, mean, total_nodes, env, delay, genesis_block, store):
         # initialise all the parameters and variables
         self.node = node # node id
         self.mean = mean # mean interarrival time of txn
         self.total_nodes = total_nodes # total number of nodes
         self.env = env # environment
         self.delay = delay # delay object
+        self.engine = None # message delivery engine, set by the simulator
+        self.log = None # event log of the simulation, set by the simulator
+        self.trace = None # event trace of the simulation, set by the simulator
+        self.serials = None # serial numbers of the transactions of the simulation, set by the simulator
+        self.mining_stream = None # random stream of the mining times, set by the simulator
+        self.template_stream = None # random stream of the block template sizes, set by the simulator
         self.fraction_hashing_power = None # to be set later in code 
         self.txn_list = [] # list of transactions in the node 
         self.all_txn_list = [] # list of all transactions in the node
         self.peer_list = [] # list of peers
-        self.sent_txns = [] # list of sent transactions
+        self.sent_txns = None # filter of the transactions sent to each peer, set with the peer list
         self.amount_list = np.zeros(total_nodes) # list of coin balances of all nodes
-        self.id_to_txn_dict = {} # dictionary to map transaction id to transaction object
-        self.sent_blks = [] # list of sent blocks
-        self.hash_to_block_dict = {genesis_block.get_id() : genesis_block} # dictionary to map block hash to block object
-        self.hash_to_time_dict = {genesis_block.get_id() : self.env.now} # dictionary to map block hash to time of generation
-        self.blockchain_edgelist = [] # list of edges in the blockchain
-        self.hash_to_height_dict = {genesis_block.get_id() : 0} # dictionary to map block hash to height
+        self.mempool = Mempool() # unconfirmed transactions known to the node
+        self.sent_blks = None # filter of the blocks sent to each peer, set with the peer list
+        self.store = store # block store shared by all the peers
+        self.view = PeerView(store) # blocks known to this peer along with their arrival times
+        self.view.add(store.add(genesis_block), self.env.now)
+        self.state_cache = ledger.StateCache() # balance snapshots at recent chain tips and fork points
         self.chain_head = genesis_block.get_id() # hash of the chain head
         self.chain_height = 0 # height of the chain
         self.prev_mining_block_hash = None # hash of the block mined by the node in the previous round
 
-        # start the mining process
-        self.mining_process = self.env.process(self.mine())
+        self.mining_process = None # mining process, started by the simulator
         self.num_self_blocks = 1 # number of blocks mined by the node itself
         self.total_num_in_main = 1 # total number of blocks in the main chain
         self.gen_block_hashes = []
         self.num_blks_mined = 1 # number of blocks mined by the node
-        global GLOBAL_BLOCK_HASHES # global set of block hashes
-        GLOBAL_BLOCK_HASHES.add(genesis_block.get_id()) # add the genesis block hash to the global set
 
-    # function to start the transaction generation process
-    def run(self):
-        while True:
-            coins = random.random()*MAX_COIN # random amount of coins to be sent
-            receiver = self.node
-            # make sure that the receiver is not the sender
-            while receiver == self.node:
-                receiver = random.randint(0, self.total_nodes-1)
-            txn = Transaction(self.node, receiver, coins) # create the transaction
-            self.txn_list.append(txn)
-            self.id_to_txn_dict[txn.get_id()] = txn   
-            yield self.env.timeout(np.random.exponential(self.mean)) # wait for the next transaction
-            print(txn)
-            self.send_txn(self.node, txn) # send the transaction to the peers
+    # function to create a transaction of this node, called by the transaction source of the simulator
+    def generate_txn(self, receiver, coins):
+        txn = Transaction(self.node, receiver, coins, self.serials.take()) # create the transaction
+        self.txn_list.append(txn)
+        self.mempool.add(txn, self.env.now)
+        if self.trace.on:
+            self.trace.record(eventtrace.TXN, self.env.now, self.node, txn.serial, receiver, coins)
+        if self.log.on[eventlog.TXN_CREATED]:
+            self.log.emit(eventlog.TXN_CREATED, self.env.now, txn.get_id(), self.node, receiver, coins)
+        self.send_txn(self.node, txn) # send the transaction to the peers
     
     # function to set the peer list
     def set_peer_list(self, peer_list):
         self.peer_list = peer_list
-        print(f"Node {self.node} has peer list {[elem.node for elem in self.peer_list]}")
+        self.sent_txns = GossipFilter([elem.node for elem in peer_list])
+        self.sent_blks = GossipFilter([elem.node for elem in peer_list])
+        if self.log.on[eventlog.PEERS]:
+            self.log.emit(eventlog.PEERS, self.env.now, self.node, [elem.node for elem in self.peer_list])
     
+    # function to set the engine delivering the messages
+    def set_engine(self, engine):
+        self.engine = engine
+
+    # function to set the event log, the event trace and the transaction serials of the simulation
+    def set_simulation(self, log, trace, serials):
+        self.log = log
+        self.trace = trace
+        self.serials = serials
+
+    # function to set the random streams of the node
+    def set_streams(self, streams):
+        self.mining_stream = streams.stream("mining", self.node)
+        self.template_stream = streams.stream("template", self.node)
+
     # function to set the fractional hashing power
     def set_fraction_hashing_power(self, h):
         self.fraction_hashing_power = h
 
     #function to receive the transactions from the sender
     def receive_txn(self, sender, txn):
-        self.id_to_txn_dict[txn.get_id()] = txn   
-        print(f"Transaction {txn.get_id()} from {sender} received by {self.node}; amount = {txn}; time = {self.env.now};")
+        self.mempool.add(txn, self.env.now)
+        if self.log.on[eventlog.TXN_RECV]:
+            self.log.emit(eventlog.TXN_RECV, self.env.now, txn.get_id(), sender, self.node)
         self.send_txn(sender, txn) # send the transaction to the peers
         return
 
     # function to receive the block and process all the transactions in the block
     def receive_blk(self, sender, blk):
-        print(f"Block {blk.get_id()} from {sender} received by {self.node}; time = {self.env.now};")
-        # if already received the block, return
-        if blk.get_id() in self.hash_to_block_dict:
-            return
-        
-        # process all the transaction in the block using a temporary amount list
-        tmp_amount_list = np.copy(self.amount_list)
-        for txn in blk.block_txn_list:
-            if txn.sender is None:
-                tmp_amount_list[txn.receiver] += txn.amount
-                continue
-            else:
-                tmp_amount_list[txn.sender] -= txn.amount
-                tmp_amount_list[txn.receiver] += txn.amount
-
-        # if any of the transactions are invalid, return
-        # for txn in blk.block_txn_list:
-                if tmp_amount_list[txn.sender] < 0:
-                    print("Invalid transaction")
-                    return
-
-        rewire = False # flag to check if the blockchain needs to be re-wired
-
-        # if the parent of the block is in the blockchain, add the block to the blockchain
-        if blk.prev_hash in self.hash_to_height_dict:
-            height = self.hash_to_height_dict[blk.prev_hash] + 1 # calculate height of the block
-
-            # if the parent is the chain head, it means block is getting added to the main chain, no rewire
-            if blk.prev_hash == self.chain_head:
-                self.chain_head = blk.get_id()
-                self.chain_height = height
-                rewire = False
-            
-            # if the parent is not the chain head, it means block is getting added to a side chain, rewire
-            if height > self.chain_height:
-                rewire = True
-
-            # set the block attributes
-            self.hash_to_height_dict[blk.get_id()] = height
-            self.hash_to_block_dict[blk.get_id()] = blk
-            self.hash_to_time_dict[blk.get_id()] = self.env.now
-            self.blockchain_edgelist.append((blk.prev_hash, blk.get_id()))
-        
-        else:
-            print("no parent")
+        if self.log.on[eventlog.BLK_RECV]:
+            self.log.emit(eventlog.BLK_RECV, self.env.now, blk.get_id(), sender, self.node)
+        # if already received the block or it cannot be added, return
+        if self.view.knows_hash(blk.get_id()) or not self.can_add(blk):
             return
-        
-        # deal with block getting added to the main chain
-        if not rewire:
-            for txn in blk.block_txn_list:
-                # adjust all the amounts with the transactions and remove the transaction from the transaction pool
-                if txn.sender is None:
-                    self.amount_list[txn.receiver] += txn.amount
-                    self.id_to_txn_dict.pop(txn.get_id(), None)
-                    continue
-                self.amount_list[txn.sender] -= txn.amount
-                self.amount_list[txn.receiver] += txn.amount
-                self.id_to_txn_dict.pop(txn.get_id(), None)
-        
-        # fork resolution
-        else:
-            print("Resolving fork")
-            parent_hash = None # hash of the block where fork was created 
-            curr_blk_id = self.chain_head # current block id
-            hash1 = blk.prev_hash # pointers to prev block while crawling up the chain
-            hash2 = self.chain_head # pointers to current block while crawling up the chain
-            self.chain_head = blk.get_id()
-            self.chain_height = self.hash_to_height_dict[blk.get_id()]
-
-            # crawl up the chain to find the block where fork was created
-            while parent_hash is None:
-                if hash1 == hash2:
-                    parent_hash = hash1
-                else:
-                    hash1 = self.hash_to_block_dict[hash1].prev_hash
-                    hash2 = self.hash_to_block_dict[hash2].prev_hash
-            
-            lagging_hash = None
-
-            # now reverse all the main chain txns upto the forked block
-            while curr_blk_id != parent_hash:
-                curr_blk = self.hash_to_block_dict[curr_blk_id]
-                for txn in curr_blk.block_txn_list:
-                    if txn.sender is None:
-                        self.amount_list[txn.receiver] -= txn.amount
-                        self.id_to_txn_dict[txn.get_id()] = txn
-                        continue
-                    self.amount_list[txn.sender] += txn.amount
-                    self.amount_list[txn.receiver] -= txn.amount
-                    self.id_to_txn_dict.pop(txn.get_id(), None)
-                lagging_hash = curr_blk_id
-                curr_blk_id = curr_blk.prev_hash
-            
-            # and now add all the txns in the new sub chain that is part of the main chain 
-            curr_blk_id = blk.get_id()
-            while curr_blk_id != parent_hash:
-                curr_blk = self.hash_to_block_dict[curr_blk_id]
-                for txn in curr_blk.block_txn_list:
-                    if txn.sender is None:
-                        self.amount_list[txn.receiver] += txn.amount
-                        self.id_to_txn_dict.pop(txn.get_id(), None)
-                        continue
-                    self.amount_list[txn.sender] -= txn.amount
-                    self.amount_list[txn.receiver] += txn.amount
-                    self.id_to_txn_dict.pop(txn.get_id(), None)
-                curr_blk_id = curr_blk.prev_hash
+        self.add_block(blk, sender)
 
         ### Mining for new block
-        print(f"Amount list for node {self.node} is {', '.join([f'{i}:{elem}' for i, elem in enumerate(self.amount_list)])}")
-        self.mining_process.interrupt()
+        if self.log.on[eventlog.BALANCES]:
+            self.log.emit(eventlog.BALANCES, self.env.now, self.node, self.amount_list.tolist())
+        self.restart_mining()
         self.send_block(sender, blk)
     
+    # a new block can be added once its parent is known and its transactions are valid over the balances of the parent
+    # (only the accounts in the block are checked), a block forking below the chain head is checked on its own branch
+    def can_add(self, blk):
+        # if the parent of the block is not in the blockchain, the block cannot be added
+        if not self.view.knows_hash(blk.prev_hash):
+            if self.log.on[eventlog.BLK_ORPHAN]:
+                self.log.emit(eventlog.BLK_ORPHAN, self.env.now, blk.get_id(), self.node)
+            return False
+
+        # if any of the transactions are invalid, the block cannot be added
+        balances, _ = self.balances_at(self.store.index(blk.prev_hash))
+        if not ledger.is_valid(balances, blk.block_txn_list):
+            if self.log.on[eventlog.BLK_INVALID]:
+                self.log.emit(eventlog.BLK_INVALID, self.env.now, blk.get_id(), self.node)
+            return False
+        return True
+
+    # add a valid block from sender to the view and move the chain head if the block extends the longest chain (returns True if the head moved)
+    def add_block(self, blk, sender):
+        idx = self.store.add(blk)
+        self.view.add(idx, self.env.now)
+        if self.trace.on:
+            self.trace.record(eventtrace.RECEIVED, self.env.now, self.node, idx, sender, 1)
+        return self.update_head(blk, idx)
+
+    # move the chain head onto the known block blk at index idx if it extends the longest chain (returns True if the head moved)
+    def update_head(self, blk, idx):
+        height = int(self.store.height[idx])
+
+        # if the parent is the chain head, it means block is getting added to the main chain, no rewire
+        if blk.prev_hash == self.chain_head:
+            self.connect_block(blk)
+        # if the parent is not the chain head but the side chain is now the longest, rewire
+        elif height > self.chain_height:
+            if self.log.on[eventlog.FORK]:
+                self.log.emit(eventlog.FORK, self.env.now, self.node, blk.get_id(), height)
+            self.switch_chain(idx)
+        else:
+            return False
+        self.chain_head = blk.get_id()
+        self.chain_height = height
+        return True
+
+    # fork resolution: move the balances and the transaction pool from the current chain head to the block new_idx
+    def switch_chain(self, new_idx):
+        old_idx = self.store.index(self.chain_head)
+        fork_idx = self.store.lca(old_idx, new_idx) # block where the fork was created
+        old_branch = self.store.path(fork_idx, old_idx)
+        new_branch = self.store.path(fork_idx, new_idx)
+        if self.trace.on:
+            self.trace.record(eventtrace.REORG, self.env.now, self.node, new_idx, old_idx, len(old_branch))
+
+        self.state_cache.put(old_idx, self.amount_list) # remember the abandoned tip in case the chain switches back
+        self.move_balances(self.amount_list, old_branch, fork_idx, new_branch)
+        self.state_cache.put(new_idx, self.amount_list)
+
+        # return the txns of the abandoned branch to the pool and remove the ones confirmed in the new branch, the
+        # id sets of the blocks are combined once so a txn confirmed in both branches never goes back to the pool
+        confirmed = ledger.confirmed_ids(self.store.block(idx) for idx in new_branch)
+        for idx in reversed(old_branch):
+            for txn in self.store.block(idx).block_txn_list:
+                if txn.sender is not None and txn.id not in confirmed:
+                    self.mempool.add(txn, self.env.now)
+        self.mempool.remove_ids(confirmed)
+
+    # move the balances from the tip of old_branch to the tip of new_branch, starting from the nearest cached state
+    def move_balances(self, balances, old_branch, fork_idx, new_branch):
+        pos, state = self.state_cache.lookup(new_branch[::-1] + [fork_idx])
+        if state is None:
+            # no cached state on the way, revert the old branch down to the fork point
+            for idx in reversed(old_branch):
+                ledger.apply_deltas(balances, self.store.block(idx).deltas, -1)
+            self.state_cache.put(fork_idx, balances)
+            start = 0
+        else:
+            np.copyto(balances, state)
+            start = len(new_branch) - pos
+        for idx in new_branch[start:]:
+            ledger.apply_deltas(balances, self.store.block(idx).deltas)
+
+    # balances at a block of the tree and the ids of the txns confirmed between the fork point and that block
+    def balances_at(self, idx):
+        head_idx = self.store.index(self.chain_head)
+        if idx == head_idx:
+            return self.amount_list, set()
+        fork_idx = self.store.lca(head_idx, idx)
+        new_branch = self.store.path(fork_idx, idx)
+        balances = self.amount_list.copy()
+        self.move_balances(balances, self.store.path(fork_idx, head_idx), fork_idx, new_branch)
+        return balances, ledger.confirmed_ids(self.store.block(i) for i in new_branch)
+
+    # build a candidate block on top of prev_hash from the transaction pool, skipping the txns in exclude
+    def build_template(self, prev_hash, balances, exclude=()):
+        next_block = Block(prev_hash, self.env, balances)   # initialize a new block over the given balances
+        max_txn = self.template_stream.randint(1, MAX_TRANSACTION)  # maximum number of txns in the block
+
+        # add the oldest txns of the pool that the senders can afford
+        for txn in self.mempool.select(balances, max_txn, exclude):
+            next_block.add_txn(txn)
+        next_block.add_txn(Transaction(None, self.node, 50, self.serials.take())) # add a coinbase txn to the block
+        return next_block
+
+    # apply the balance changes of a block and remove its transactions from the transaction pool
+    def connect_block(self, blk):
+        ledger.apply_deltas(self.amount_list, blk.deltas)
+        self.mempool.remove_ids(blk.txn_ids)
+
     # function to send a transaction to all peers excluding the sender and previously sent transactions
     def send_txn(self, exclude, txn):
         for peer in self.peer_list:
-            if peer.node != exclude and (peer.node, txn.get_id()) not in self.sent_txns:
-                self.env.process(self.send_txn_one(self.node, peer, txn))
-                print("Sent transaction {} to {} by {}".format(txn.get_id(), peer.node, self.node))
-                self.sent_txns.append((peer.node, txn.get_id()))
-            else:
-                print(f"Skipping txn {txn.get_id()} to node {peer.node} by {self.node}")
+            if peer.node != exclude and self.sent_txns.announce(txn.short_id, peer.node, self.env.now):
+                self.engine.deliver_txn(self.node, peer, 1, txn)
+                if self.log.on[eventlog.TXN_SENT]:
+                    self.log.emit(eventlog.TXN_SENT, self.env.now, txn.get_id(), peer.node, self.node)
+            elif self.log.on[eventlog.TXN_SKIP]:
+                self.log.emit(eventlog.TXN_SKIP, self.env.now, txn.get_id(), peer.node, self.node)
     
-    # subfunction to simulate the delay in sending a transaction
-    def send_txn_one(self, s, r, txn):
-        # print('Sending transaction')
-        yield self.env.timeout(self.delay.get_delay(s, r.node, 1))
-        r.receive_txn(s, txn)
-        return
-
     # function to send a block to all peers excluding the sender and previously sent blocks
     def send_block(self, exclude, blk):
         for peer in self.peer_list:
-            if peer.node != exclude and (peer.node, blk.get_id()) not in self.sent_blks:
-                self.env.process(self.send_block_one(self.node, peer, blk))
-                print("Sent block {} to {} by {}".format(blk.get_id(), peer.node, self.node))
-                self.sent_blks.append((peer.node, blk.get_id()))
-            else:
-                print(f"Skipping block to node {peer.node} by {self.node}")
+            if peer.node != exclude and self.sent_blks.announce(blk.short_id, peer.node, self.env.now):
+                self.engine.deliver_block(self.node, peer, blk.block_size, blk)
+                if self.log.on[eventlog.BLK_SENT]:
+                    self.log.emit(eventlog.BLK_SENT, self.env.now, blk.get_id(), peer.node, self.node)
+            elif self.log.on[eventlog.BLK_SKIP]:
+                self.log.emit(eventlog.BLK_SKIP, self.env.now, blk.get_id(), peer.node, self.node)
     
-    # subfunction to simulate the delay in sending a block
-    def send_block_one(self, s, r, blk):
-        yield self.env.timeout(self.delay.get_delay(s, r.node, blk.block_size))
-        print(f"Sent block {blk.get_id()} to {r.node} by {s}")
-        r.receive_blk(s, blk)
+    # called by the engine once a block from node s has gone through the network delay
+    def block_arrived(self, s, blk):
+        if not self.trace.on:
+            self.receive_blk(s, blk)
+            return
+        known = self.view.knows_hash(blk.get_id())
+        self.receive_blk(s, blk)
+        if known or not self.view.knows_hash(blk.get_id()): # the accepted copy is recorded by add_block
+            self.trace.record(eventtrace.RECEIVED, self.env.now, self.node, self.store.index(blk.get_id()), s, 0)
 
     # function to simulate the mining process and the PoW
     def mine(self):
-        global TOTAL_BLOCKS_MINED
-        mean = AVG_INTER_ARRIVAL/self.fraction_hashing_power # mean of the exponential distribution for interarrival of blocks 
-        
         while True:
-            next_block = Block(self.chain_head, self.env)   # initialize a new block
-            curr_num_txns = 0                              # number of txns in the block
-            max_txn = random.randint(1, MAX_TRANSACTION)  # maximum number of txns in the block
-
-            # copy the amount list to the new block
-            next_block.amount_list = self.amount_list.copy()
-
-            # add txns to the block from the pool of the node
-            for key, val in self.id_to_txn_dict.items():
-                if curr_num_txns == max_txn:
-                    break
-                ret_val = next_block.add_txn(val)
-                if ret_val:
-                    curr_num_txns += 1
-            next_block.add_txn(Transaction(None, self.node, 50)) # add a coinbase txn to the block
+            mean = AVG_INTER_ARRIVAL/self.fraction_hashing_power # mean of the exponential distribution for interarrival of blocks (read every round as it can change)
+            self.prepare_mining()
+            next_block = self.mining_template()
             try:
-                yield self.env.timeout(np.random.exponential(mean)) # wait for the next block to be mined (simulating PoW/Hashing)
+                yield self.env.timeout(self.mining_stream.exponential(mean)) # wait for the next block to be mined (simulating PoW/Hashing)
             except simpy.Interrupt:
-                print("Interrupted")
+                self.mining_interrupted()
                 continue
-            self.chain_head = next_block.get_id() # update the chain head
-            self.chain_height += 1 # update the chain height
-            next_block.set_gen_by(self.node)
-            
-            # update the dictionaries
-            self.hash_to_height_dict[next_block.get_id()] = self.chain_height
-            self.hash_to_block_dict[next_block.get_id()] = next_block
-            self.hash_to_time_dict[next_block.get_id()] = self.env.now
-            
-            self.gen_block_hashes.append(next_block.get_id()) # add the block to the list of blocks mined by the node
-            self.num_blks_mined += 1 # update the number of blocks mined
-            global GLOBAL_BLOCK_HASHES
-            GLOBAL_BLOCK_HASHES.add(next_block.get_id())
-
-            # update the amount list
-            for txn in next_block.block_txn_list:
-                if txn.sender is None:
-                    self.amount_list[txn.receiver] += txn.amount
-                    self.id_to_txn_dict.pop(txn.get_id(), None)
-                    continue
-                self.amount_list[txn.sender] -= txn.amount
-                self.amount_list[txn.receiver] += txn.amount
-                self.id_to_txn_dict.pop(txn.get_id(), None)
-            self.blockchain_edgelist.append((next_block.prev_hash, next_block.get_id())) # add the block to the blockchain edgelist
-            self.send_block(self.node, next_block) # send the block to all peers
-            TOTAL_BLOCKS_MINED += 1
-            print(f"Block {next_block.get_id()} mined by {self.node} with {len(next_block.block_txn_list)} transactions; money left  {self.amount_list[self.node]}; time {self.env.now}")
-            print(f"Txns: {[str(elem) for elem in next_block.block_txn_list]}")
+            self.block_mined(next_block)
+
+    # start mining with an own simpy process (not used when the simulator runs a mining scheduler)
+    def start_mining(self):
+        self.mining_process = self.env.process(self.mine())
+
+    # abandon the current mining round after the chain has changed
+    def restart_mining(self):
+        if self.mining_process is not None:
+            self.mining_process.interrupt()
+        else:
+            self.prepare_mining()
+
+    # called by the mining scheduler when this node wins the race, the template is only built for the winner
+    def win_block(self):
+        self.block_mined(self.mining_template())
+        self.prepare_mining()
+
+    # hook run before every mining round
+    def prepare_mining(self):
+        pass
+
+    # candidate block on the chain head
+    def mining_template(self):
+        return self.build_template(self.chain_head, self.amount_list)
+
+    def mining_interrupted(self):
+        if self.log.on[eventlog.INTERRUPTED]:
+            self.log.emit(eventlog.INTERRUPTED, self.env.now, self.node)
+
+    # a won block becomes the new chain head and is sent to all peers
+    def block_mined(self, next_block):
+        next_block.seal() # the block is final once mined
+        self.chain_head = next_block.get_id() # update the chain head
+        self.chain_height += 1 # update the chain height
+        next_block.set_gen_by(self.node)
+        
+        # add the block to the shared store and to the view of this peer
+        idx = self.store.add(next_block)
+        self.view.add(idx, self.env.now)
+        if self.trace.on:
+            self.trace.record(eventtrace.MINED, self.env.now, self.node, idx, self.store.parent[idx], len(next_block.block_txn_list))
+        
+        self.gen_block_hashes.append(next_block.get_id()) # add the block to the list of blocks mined by the node
+        self.num_blks_mined += 1 # update the number of blocks mined
+
+        # update the amount list
+        self.connect_block(next_block)
+        self.send_block(self.node, next_block) # send the block to all peers
+        if self.log.on[eventlog.MINED]:
+            self.log.emit(eventlog.MINED, self.env.now, next_block.get_id(), self.node, [txn.get_id() for txn in next_block.block_txn_list],
+                     self.amount_list[self.node])
     
     # helper function to get the number of blocks in the main chain and the blocks mined by the node itself (for analysis)
     def set_number_blocks_in_main(self):
-        curr_hash = self.chain_head
-        while curr_hash != "0":
-            if curr_hash in self.gen_block_hashes:
-                self.num_self_blocks += 1
-            curr_hash = self.hash_to_block_dict[curr_hash].prev_hash
-            self.total_num_in_main += 1
+        self.num_self_blocks += self.blocks_in_chain(self.chain_head)
+        self.total_num_in_main += self.chain_height + 1 # every block from the head down to the genesis block
+
+    # number of blocks mined by the node in the chain ending at the block head_hash
+    def blocks_in_chain(self, head_hash):
+        head_idx = self.store.index(head_hash)
+        return sum(self.is_in_main_chain(self.store.index(blk_hash), head_idx) for blk_hash in self.gen_block_hashes)
+
+    # check if a block is an ancestor of (or is) the block head_idx using the jump pointers of the store
+    def is_in_main_chain(self, idx, head_idx):
+        return self.store.in_chain(idx, head_idx)
+
+    # edges (parent index, child index) of the blockchain tree of the node in arrival order
+    def blockchain_edges(self):
+        children = self.view.known_blocks()[1:]
+        return zip(self.store.parent[children].tolist(), children.tolist())
 
     # helper function to print the blockchain tree of the nodes into a file 
     def print_tree(self, filename):
         self.set_number_blocks_in_main()
         with open(filename, 'w') as f:
-            f.write("\n".join([f'"{str(elem[0])}({self.hash_to_time_dict[elem[0]]})" -> "{str(elem[1])}({self.hash_to_time_dict[elem[1]]})";' 
-            for elem in self.blockchain_edgelist]))
+            f.write("\n".join([f'"{self.store.block(p).get_id()}({time_str(self.view.time_of(p))})" -> "{self.store.block(c).get_id()}({time_str(self.view.time_of(c))})";' 
+            for p, c in self.blockchain_edges()]))
             f.write("\n")
             f.write(f"{self.num_self_blocks}/{(self.chain_height+1)} blocks in main chain(={self.num_self_blocks/(self.chain_height+1)})\n")
             f.write(f"{self.num_self_blocks}/{self.num_blks_mined} (blks in main)/(total gen by this peer) (={self.num_self_blocks/self.num_blks_mined})\n")
 
-    # helper function to print the graph structure of the blockchain tree 
+    # helper function to print the graph structure of the blockchain tree, the blocks are labelled with their store index
     def graph_print(self, filename):
         self.set_number_blocks_in_main()
-        hash_to_idx_dict = {}
-        global GLOBAL_BLOCK_HASHES
-        for i , (hash, _) in enumerate(self.hash_to_block_dict.items()):
-            hash_to_idx_dict[hash] = list(GLOBAL_BLOCK_HASHES).index(hash)
         with open(filename, 'w') as f:
             f.write("digraph unix {\nsize=\"7,5\"; \n node [color=goldenrod2, style=filled];\n")
-            f.write("\n".join([f'"{str(hash_to_idx_dict[elem[0]])}(Ta={self.hash_to_time_dict[elem[0]]:.3f};By: {self.hash_to_block_dict[elem[0]].gen_by})" -> "{str(hash_to_idx_dict[elem[1]])}(Ta={self.hash_to_time_dict[elem[1]]:.3f};By: {self.hash_to_block_dict[elem[1]].gen_by})";' 
-            for elem in self.blockchain_edgelist]))
+            edges = [(p, c, self.store.block(p).gen_by, self.store.block(c).gen_by, self.view.time_of(p), self.view.time_of(c)) for p, c in self.blockchain_edges()]
+            f.write("\n".join([f'"{p}(Ta={pt:.3f};By: {pg})" -> "{c}(Ta={ct:.3f};By: {cg})";' 
+            for p, c, pg, cg, pt, ct in edges]))
             f.write("\n}")
 
 
-class SelfishMiner(Peer):
-    def __init__(self, node, mean, total_nodes, env, delay, genesis_block):
-        super().__init__(node, mean, total_nodes, env, delay, genesis_block)
+# Class standing for a node simulated elsewhere (by another worker of the parallel engine): it is only a neighbour
+# that messages are addressed to and a share of the hashing power
+class RemotePeer:
+    def __init__(self, node):
+        self.node = node # node id
+        self.fraction_hashing_power = None # to be set later in code
+
+    # function to set the fractional hashing power
+    def set_fraction_hashing_power(self, h):
+        self.fraction_hashing_power = h
+
+# Class with the state and the hooks shared by the attackers: the blocks they mine stay in a private chain and the
+# subclasses only decide which private blocks to release once the public chain has grown, only they can be created
+class Attacker(Peer, metaclass=abc.ABCMeta):
+    def __init__(self, node, mean, total_nodes, env, delay, genesis_block, store, events_path=attackerlog.EVENTS_PATH):
+        super().__init__(node, mean, total_nodes, env, delay, genesis_block, store)
         self.private_block_chain = []
         self.chain_length_diff = 0
         self.private_chain_head = self.chain_head
         self.height_increased = False
-        self.events = []
+        self.recorder = AttackerRecorder(events_path) # state of the attacker after each of its events (kept in memory without a path)
 
+    # a released block becomes known to the node and the public chain moves onto it once it is the longest chain
     def update_bookkeeping(self, next_block):
-        self.hash_to_height_dict[next_block.get_id()] = self.chain_height
-        self.hash_to_block_dict[next_block.get_id()] = next_block
-        self.hash_to_time_dict[next_block.get_id()] = self.env.now
-        # update the amount list
-        for txn in next_block.block_txn_list:
-            if txn.sender is None:
-                self.amount_list[txn.receiver] += txn.amount
-                self.id_to_txn_dict.pop(txn.get_id(), None)
-                continue
-            self.amount_list[txn.sender] -= txn.amount
-            self.amount_list[txn.receiver] += txn.amount
-            self.id_to_txn_dict.pop(txn.get_id(), None)
-        self.blockchain_edgelist.append((next_block.prev_hash, next_block.get_id())) # add the block to the blockchain edgelist
-    # function to simulate the selfish-mining process and the PoW
-    def mine(self):
-        global TOTAL_BLOCKS_MINED
-        mean = AVG_INTER_ARRIVAL/self.fraction_hashing_power # mean of the exponential distribution for interarrival of blocks 
-        while True:
-            print("Malicious node mining")
-            self.mark_malicious_event()
-            if len(self.private_block_chain)>0:
-                if self.height_increased:
-                    if self.chain_length_diff == 1:
-                        next_block = self.private_block_chain[0]
-                        # update the dictionaries
-                        self.update_bookkeeping(next_block=next_block)
-                        self.send_block(self.node, next_block) # send the block to all peers'
-                        print("Releasing private block:", self.chain_length_diff)
-                        print(f"Block {next_block.get_id()} mined by {self.node} with {len(next_block.block_txn_list)} transactions; money left  {self.amount_list[self.node]}; time {self.env.now}")
-                        print(f"Txns: {[str(elem) for elem in next_block.block_txn_list]}")
-                        self.private_block_chain.pop(0)
-
-                        next_block = self.private_block_chain[0]
-                        # update the amount list
-                        self.update_bookkeeping(next_block=next_block)
-                        self.send_block(self.node, next_block) # send the block to all peers'
-                        print("Releasing private block : ", self.chain_length_diff)
-                        print(f"Block {next_block.get_id()} mined by {self.node} with {len(next_block.block_txn_list)} transactions; money left  {self.amount_list[self.node]}; time {self.env.now}")
-                        print(f"Txns: {[str(elem) for elem in next_block.block_txn_list]}")
-                        self.private_block_chain.pop(0)
-                        
-                        self.chain_length_diff -= 1
-                        print("Decreasing chain length diff :", self.chain_length_diff)
-                        assert len(self.private_block_chain) == 0, "Private block chain length is non-empty"
-                    
-                    else:
-                        next_block = self.private_block_chain[0]
-                        # update the amount list
-                        self.update_bookkeeping(next_block=next_block)
-                        self.send_block(self.node, next_block) # send the block to all peers'
-                        print("Releasing private block : ", self.chain_length_diff)
-                        print(f"Block {next_block.get_id()} mined by {self.node} with {len(next_block.block_txn_list)} transactions; money left  {self.amount_list[self.node]}; time {self.env.now}")
-                        print(f"Txns: {[str(elem) for elem in next_block.block_txn_list]}")
-                        self.private_block_chain.pop(0)
-
-            self.height_increased = False
-
-            assert self.chain_length_diff == len(self.private_block_chain), "Inconsistent chain length difference"
-
-            next_block = Block(self.private_chain_head, self.env)   # initialize a new block
-            curr_num_txns = 0                             # number of txns in the block
-            max_txn = random.randint(1, MAX_TRANSACTION)  # maximum number of txns in the block
-
-            # copy the amount list to the new block
-            next_block.amount_list = self.amount_list.copy()
-
-            # add txns to the block from the pool of the node
-            for key, val in self.id_to_txn_dict.items():
-                if curr_num_txns == max_txn:
-                    break
-                ret_val = next_block.add_txn(val)
-                if ret_val:
-                    curr_num_txns += 1
-            next_block.add_txn(Transaction(None, self.node, 50)) # add a coinbase txn to the block
-            try:
-                yield self.env.timeout(np.random.exponential(mean)) # wait for the next block to be mined (simulating PoW/Hashing)
-            except simpy.Interrupt:
-                print("Malicious Interrupted")
-                continue
-            self.private_chain_head = next_block.get_id() # update the chain head
-            next_block.set_gen_by(self.node)
-            
-            self.gen_block_hashes.append(next_block.get_id()) # add the block to the list of blocks mined by the node
-            self.num_blks_mined += 1 # update the number of blocks mined
-            global GLOBAL_BLOCK_HASHES
-            GLOBAL_BLOCK_HASHES.add(next_block.get_id())
-            
-            self.private_block_chain.append(next_block)
-            TOTAL_BLOCKS_MINED += 1
-            print("Mined private block")
-            self.chain_length_diff += 1
-
-            print(f"Block {next_block.get_id()} mined by {self.node} with {len(next_block.block_txn_list)} transactions; money left  {self.amount_list[self.node]}; time {self.env.now}")
-            print(f"Txns: {[str(elem) for elem in next_block.block_txn_list]}")
-    
-    def receive_blk(self, sender, blk):
-        print(f"Block {blk.get_id()} from {sender} received by {self.node}; time = {self.env.now};")
-        
-        # if already received the block, return
-        if blk.get_id() in self.hash_to_block_dict:
-            return
-        
-        # process all the transaction in the block using a temporary amount list
-        tmp_amount_list = np.copy(self.amount_list)
-        for txn in blk.block_txn_list:
-            if txn.sender is None:
-                tmp_amount_list[txn.receiver] += txn.amount
-                continue
-            else:
-                tmp_amount_list[txn.sender] -= txn.amount
-                tmp_amount_list[txn.receiver] += txn.amount
-
-        # if any of the transactions are invalid, return
-        # for txn in blk.block_txn_list:
-                if tmp_amount_list[txn.sender] < 0:
-                    print("Invalid transaction")
-                    return
-
-        rewire = False # flag to check if the blockchain needs to be re-wired
-
-        # if the parent of the block is in the blockchain, add the block to the blockchain
-        if blk.prev_hash in self.hash_to_height_dict:
-            height = self.hash_to_height_dict[blk.prev_hash] + 1 # calculate height of the block
-
-            # if the parent is the chain head, it means block is getting added to the main chain, no rewire
-            if blk.prev_hash == self.chain_head:
-                self.chain_head = blk.get_id()
-                self.chain_height = height
-                rewire = False
-                self.height_increased = True
-
-            # if the parent is not the chain head, it means block is getting added to a side chain, rewire
-            if height > self.chain_height:
-                rewire = True
-                self.height_increased = True
-
-            # set the block attributes
-            self.hash_to_height_dict[blk.get_id()] = height
-            self.hash_to_block_dict[blk.get_id()] = blk
-            self.hash_to_time_dict[blk.get_id()] = self.env.now
-            self.blockchain_edgelist.append((blk.prev_hash, blk.get_id()))
-        
-        else:
-            print("no parent")
-            return
-        
-        # deal with block getting added to the main chain
-        if not rewire:
-            if len(self.private_block_chain) == 0:
-                for txn in blk.block_txn_list:
-                    # adjust all the amounts with the transactions and remove the transaction from the transaction pool
-                    if txn.sender is None:
-                        self.amount_list[txn.receiver] += txn.amount
-                        self.id_to_txn_dict.pop(txn.get_id(), None)
-                        continue
-                    self.amount_list[txn.sender] -= txn.amount
-                    self.amount_list[txn.receiver] += txn.amount
-                    self.id_to_txn_dict.pop(txn.get_id(), None)
-        
-        # fork resolution
-        else:
-            print("Resolving fork")
-            parent_hash = None # hash of the block where fork was created 
-            curr_blk_id = self.chain_head # current block id
-            hash1 = blk.prev_hash # pointers to prev block while crawling up the chain
-            hash2 = self.chain_head # pointers to current block while crawling up the chain
-            self.chain_head = blk.get_id()
-            self.chain_height = self.hash_to_height_dict[blk.get_id()]
-
-            # crawl up the chain to find the block where fork was created
-            while parent_hash is None:
-                if hash1 == hash2:
-                    parent_hash = hash1
-                else:
-                    hash1 = self.hash_to_block_dict[hash1].prev_hash
-                    hash2 = self.hash_to_block_dict[hash2].prev_hash
-            
-            # now reverse all the main chain txns upto the forked block
-            while curr_blk_id != parent_hash:
-                curr_blk = self.hash_to_block_dict[curr_blk_id]
-                if len(self.private_block_chain) == 0:
-                    for txn in curr_blk.block_txn_list:
-                        if txn.sender is None:
-                            self.amount_list[txn.receiver] -= txn.amount
-                            self.id_to_txn_dict[txn.get_id()] = txn
-                            continue
-                        self.amount_list[txn.sender] += txn.amount
-                        self.amount_list[txn.receiver] -= txn.amount
-                        self.id_to_txn_dict[txn.get_id()] = txn
-                    curr_blk_id = curr_blk.prev_hash
-            
-            # and now add all the txns in the new sub chain that is part of the main chain 
-            curr_blk_id = blk.get_id()
-            while curr_blk_id != parent_hash:
-                if len(self.private_block_chain) == 0:
-                    curr_blk = self.hash_to_block_dict[curr_blk_id]
-                    for txn in curr_blk.block_txn_list:
-                        if txn.sender is None:
-                            self.amount_list[txn.receiver] += txn.amount
-                            self.id_to_txn_dict.pop(txn.get_id(), None)
-                            continue
-                        self.amount_list[txn.sender] -= txn.amount
-                        self.amount_list[txn.receiver] += txn.amount
-                        self.id_to_txn_dict.pop(txn.get_id(), None)
-                    curr_blk_id = curr_blk.prev_hash
+        idx = self.store.add(next_block)
+        self.view.add(idx, self.env.now)
+        self.update_head(next_block, idx)
+        if self.trace.on:
+            self.trace.record(eventtrace.RELEASE, self.env.now, self.node, idx, self.store.parent[idx], self.chain_length_diff)
+        self.record_event(attackerlog.RELEASE, idx, pending=1) # the block leaves the private chain right after
+
+    # record the release of a private block with the current lead
+    def log_release(self, blk):
+        if self.log.on[eventlog.ADV_RELEASE]:
+            self.log.emit(eventlog.ADV_RELEASE, self.env.now, blk.get_id(), self.node, self.chain_length_diff)
+
+    # record a decrease of the lead over the public chain
+    def log_lead(self):
+        if self.log.on[eventlog.ADV_LEAD]:
+            self.log.emit(eventlog.ADV_LEAD, self.env.now, self.node, self.chain_length_diff)
+
+    # append the state after an event to the recorder, pending blocks of the private chain are counted as released
+    def record_event(self, kind, block=-1, pending=0):
+        self.recorder.record(self.env.now, kind, self.chain_length_diff, len(self.private_block_chain) - pending,
+                             self.store.index(self.private_chain_head), self.store.index(self.chain_head), block)
+
+    # send the oldest block of the private chain to all peers
+    def release_block(self):
+        next_block = self.private_block_chain[0]
+        self.update_bookkeeping(next_block=next_block)
+        self.send_block(self.node, next_block) # send the block to all peers
+        self.log_release(next_block)
+        self.private_block_chain.pop(0)
+
+    # hook run before every mining round: release private blocks once the public chain has grown
+    def prepare_mining(self):
+        if self.log.on[eventlog.ADV_ROUND]:
+            self.log.emit(eventlog.ADV_ROUND, self.env.now, self.node, self.chain_length_diff)
+        self.record_event(attackerlog.ROUND)
+        if len(self.private_block_chain)>0 and self.height_increased:
+            self.release_blocks()
 
-        ### Mining for new block
-        print(f"Amount list for node {self.node} is {', '.join([f'{i}:{elem}' for i, elem in enumerate(self.amount_list)])}")
-        
-        if self.height_increased:
-            if self.chain_length_diff > 0:
-                self.chain_length_diff -= 1
-                print("Decreasing chain length diff :", self.chain_length_diff)
-            else:
-                self.private_chain_head = self.chain_head
-        self.mining_process.interrupt()
-    
-    def find_mpu_adv(self):
-        self.set_number_blocks_in_main()
-        return self.total_num_in_main/self.num_blks_mined
-    
-    def find_mpu_overall(self):
-        self.set_number_blocks_in_main()
-        global TOTAL_BLOCKS_MINED
-        return self.chain_height/TOTAL_BLOCKS_MINED
+        self.height_increased = False
 
-    def graph_private_chain(self, filename):
-        self.set_number_blocks_in_main()
-        hash_to_idx_dict = {}
-        global GLOBAL_BLOCK_HASHES
-        for i , (hash, _) in enumerate(self.hash_to_block_dict.items()):
-            hash_to_idx_dict[hash] = list(GLOBAL_BLOCK_HASHES).index(hash)
-        with open(filename, 'w') as f:
-            f.write("digraph unix {\nsize=\"7,5\"; \n node [color=goldenrod2, style=filled];\n")
-            f.write("\n".join([f'"{hash_to_idx_dict[self.private_block_chain[i]]}" -> "{hash_to_idx_dict[self.private_block_chain[i+1]]}";' 
-            for i in range(len(self.private_block_chain)-1)]))
-            f.write("\n}")
+        assert self.chain_length_diff == len(self.private_block_chain), "Inconsistent chain length difference"
 
-    def mark_malicious_event(self):
-        self.set_number_blocks_in_main()
-        path = "malicious_events/"
-        isExist = os.path.exists(path)
-        if not isExist:
-            os.makedirs(path)
-        time = str(self.env.now)
-        filename = path+ "private_chain" + time
-        self.graph_private_chain(filename)
-        filename = path+ "global_chain" + time
-        self.graph_print(filename)
-
-class StubMiner(Peer):
-    def __init__(self, node, mean, total_nodes, env, delay, genesis_block):
-        super().__init__(node, mean, total_nodes, env, delay, genesis_block)
-        self.private_block_chain = []
-        self.chain_length_diff = 0
-        self.private_chain_head = self.chain_head
-        self.height_increased = False
-        self.events = []
+    # release policy of the attacker, called when the public chain has grown and the private chain is not empty
+    @abc.abstractmethod
+    def release_blocks(self):
+        pass
 
-    def update_bookkeeping(self, next_block):
-        self.hash_to_height_dict[next_block.get_id()] = self.chain_height
-        self.hash_to_block_dict[next_block.get_id()] = next_block
-        self.hash_to_time_dict[next_block.get_id()] = self.env.now
-        # update the amount list
-        for txn in next_block.block_txn_list:
-            if txn.sender is None:
-                self.amount_list[txn.receiver] += txn.amount
-                self.id_to_txn_dict.pop(txn.get_id(), None)
-                continue
-            self.amount_list[txn.sender] -= txn.amount
-            self.amount_list[txn.receiver] += txn.amount
-            self.id_to_txn_dict.pop(txn.get_id(), None)
-        self.blockchain_edgelist.append((next_block.prev_hash, next_block.get_id())) # add the block to the blockchain edgelist
-    # function to simulate the selfish-mining process and the PoW
-    def mine(self):
-        global TOTAL_BLOCKS_MINED
-        mean = AVG_INTER_ARRIVAL/self.fraction_hashing_power # mean of the exponential distribution for interarrival of blocks 
-        while True:
-            print("Malicious node mining")
-            self.mark_malicious_event()
-            if len(self.private_block_chain)>0:
-                if self.height_increased:
-                    next_block = self.private_block_chain[0]
-                    self.update_bookkeeping(next_block=next_block)
-                    self.send_block(self.node, next_block) # send the block to all peers'
-                    print("Releasing private block : ", self.chain_length_diff)
-                    print(f"Block {next_block.get_id()} mined by {self.node} with {len(next_block.block_txn_list)} transactions; money left  {self.amount_list[self.node]}; time {self.env.now}")
-                    print(f"Txns: {[str(elem) for elem in next_block.block_txn_list]}")
-                    self.private_block_chain.pop(0)
-
-            self.height_increased = False
-
-            assert self.chain_length_diff == len(self.private_block_chain), "Inconsistent chain length difference"
-
-            next_block = Block(self.private_chain_head, self.env)   # initialize a new block
-            curr_num_txns = 0                             # number of txns in the block
-            max_txn = random.randint(1, MAX_TRANSACTION)  # maximum number of txns in the block
-
-            # copy the amount list to the new block
-            next_block.amount_list = self.amount_list.copy()
-
-            # add txns to the block from the pool of the node
-            for key, val in self.id_to_txn_dict.items():
-                if curr_num_txns == max_txn:
-                    break
-                ret_val = next_block.add_txn(val)
-                if ret_val:
-                    curr_num_txns += 1
-            next_block.add_txn(Transaction(None, self.node, 50)) # add a coinbase txn to the block
-            try:
-                yield self.env.timeout(np.random.exponential(mean)) # wait for the next block to be mined (simulating PoW/Hashing)
-            except simpy.Interrupt:
-                print("Malicious Interrupted")
-                continue
-            self.private_chain_head = next_block.get_id() # update the chain head
-            next_block.set_gen_by(self.node)
-            
-            self.gen_block_hashes.append(next_block.get_id()) # add the block to the list of blocks mined by the node
-            self.num_blks_mined += 1 # update the number of blocks mined
-            global GLOBAL_BLOCK_HASHES
-            GLOBAL_BLOCK_HASHES.add(next_block.get_id())
-            
-            self.private_block_chain.append(next_block)
-            TOTAL_BLOCKS_MINED += 1
-            print("Mined private block")
-            self.chain_length_diff += 1
-
-            print(f"Block {next_block.get_id()} mined by {self.node} with {len(next_block.block_txn_list)} transactions; money left  {self.amount_list[self.node]}; time {self.env.now}")
-            print(f"Txns: {[str(elem) for elem in next_block.block_txn_list]}")
-    
-    def receive_blk(self, sender, blk):
-        print(f"Block {blk.get_id()} from {sender} received by {self.node}; time = {self.env.now};")
+    # the template extends the private chain head over the balances of the private branch
+    def mining_template(self):
+        balances, confirmed = self.balances_at(self.store.index(self.private_chain_head))
+        return self.build_template(self.private_chain_head, balances, confirmed)
+
+    # a won block is kept in the private chain
+    def block_mined(self, next_block):
+        next_block.seal() # the block is final once mined
+        self.private_chain_head = next_block.get_id() # update the chain head
+        next_block.set_gen_by(self.node)
         
-        # if already received the block, return
-        if blk.get_id() in self.hash_to_block_dict:
-            return
+        self.gen_block_hashes.append(next_block.get_id()) # add the block to the list of blocks mined by the node
+        self.num_blks_mined += 1 # update the number of blocks mined
+        idx = self.store.add(next_block) # registered in the shared store, but unknown to the peers until released
+        if self.trace.on:
+            self.trace.record(eventtrace.PRIVATE, self.env.now, self.node, idx, self.store.parent[idx], len(next_block.block_txn_list))
         
-        # process all the transaction in the block using a temporary amount list
-        tmp_amount_list = np.copy(self.amount_list)
-        for txn in blk.block_txn_list:
-            if txn.sender is None:
-                tmp_amount_list[txn.receiver] += txn.amount
-                continue
-            else:
-                tmp_amount_list[txn.sender] -= txn.amount
-                tmp_amount_list[txn.receiver] += txn.amount
-
-        # if any of the transactions are invalid, return
-        # for txn in blk.block_txn_list:
-                if tmp_amount_list[txn.sender] < 0:
-                    print("Invalid transaction")
-                    return
-
-        rewire = False # flag to check if the blockchain needs to be re-wired
-
-        # if the parent of the block is in the blockchain, add the block to the blockchain
-        if blk.prev_hash in self.hash_to_height_dict:
-            height = self.hash_to_height_dict[blk.prev_hash] + 1 # calculate height of the block
-
-            # if the parent is the chain head, it means block is getting added to the main chain, no rewire
-            if blk.prev_hash == self.chain_head:
-                self.chain_head = blk.get_id()
-                self.chain_height = height
-                rewire = False
-                self.height_increased = True
-
-            # if the parent is not the chain head, it means block is getting added to a side chain, rewire
-            if height > self.chain_height:
-                rewire = True
-                self.height_increased = True
-
-            # set the block attributes
-            self.hash_to_height_dict[blk.get_id()] = height
-            self.hash_to_block_dict[blk.get_id()] = blk
-            self.hash_to_time_dict[blk.get_id()] = self.env.now
-            self.blockchain_edgelist.append((blk.prev_hash, blk.get_id()))
+        self.private_block_chain.append(next_block)
+        self.chain_length_diff += 1
+        self.record_event(attackerlog.PRIVATE, idx)
+        if self.log.on[eventlog.ADV_PRIVATE]:
+            self.log.emit(eventlog.ADV_PRIVATE, self.env.now, next_block.get_id(), self.node, self.chain_length_diff,
+                     [txn.get_id() for txn in next_block.block_txn_list])
+    
+    def receive_blk(self, sender, blk):
+        if self.log.on[eventlog.BLK_RECV]:
+            self.log.emit(eventlog.BLK_RECV, self.env.now, blk.get_id(), sender, self.node)
         
-        else:
-            print("no parent")
+        # if already received the block or it cannot be added, return
+        if self.view.knows_hash(blk.get_id()) or not self.can_add(blk):
             return
-        
-        # deal with block getting added to the main chain
-        if not rewire:
-            if len(self.private_block_chain) == 0:
-                for txn in blk.block_txn_list:
-                    # adjust all the amounts with the transactions and remove the transaction from the transaction pool
-                    if txn.sender is None:
-                        self.amount_list[txn.receiver] += txn.amount
-                        self.id_to_txn_dict.pop(txn.get_id(), None)
-                        continue
-                    self.amount_list[txn.sender] -= txn.amount
-                    self.amount_list[txn.receiver] += txn.amount
-                    self.id_to_txn_dict.pop(txn.get_id(), None)
-        
-        # fork resolution
-        else:
-            print("Resolving fork")
-            parent_hash = None # hash of the block where fork was created 
-            curr_blk_id = self.chain_head # current block id
-            hash1 = blk.prev_hash # pointers to prev block while crawling up the chain
-            hash2 = self.chain_head # pointers to current block while crawling up the chain
-            self.chain_head = blk.get_id()
-            self.chain_height = self.hash_to_height_dict[blk.get_id()]
-
-            # crawl up the chain to find the block where fork was created
-            while parent_hash is None:
-                if hash1 == hash2:
-                    parent_hash = hash1
-                else:
-                    hash1 = self.hash_to_block_dict[hash1].prev_hash
-                    hash2 = self.hash_to_block_dict[hash2].prev_hash
-            
-            # now reverse all the main chain txns upto the forked block
-            while curr_blk_id != parent_hash:
-                curr_blk = self.hash_to_block_dict[curr_blk_id]
-                if len(self.private_block_chain) == 0:
-                    for txn in curr_blk.block_txn_list:
-                        if txn.sender is None:
-                            self.amount_list[txn.receiver] -= txn.amount
-                            self.id_to_txn_dict[txn.get_id()] = txn
-                            continue
-                        self.amount_list[txn.sender] += txn.amount
-                        self.amount_list[txn.receiver] -= txn.amount
-                        self.id_to_txn_dict[txn.get_id()] = txn
-                    curr_blk_id = curr_blk.prev_hash
-            
-            # and now add all the txns in the new sub chain that is part of the main chain 
-            curr_blk_id = blk.get_id()
-            while curr_blk_id != parent_hash:
-                if len(self.private_block_chain) == 0:
-                    curr_blk = self.hash_to_block_dict[curr_blk_id]
-                    for txn in curr_blk.block_txn_list:
-                        if txn.sender is None:
-                            self.amount_list[txn.receiver] += txn.amount
-                            self.id_to_txn_dict.pop(txn.get_id(), None)
-                            continue
-                        self.amount_list[txn.sender] -= txn.amount
-                        self.amount_list[txn.receiver] += txn.amount
-                        self.id_to_txn_dict.pop(txn.get_id(), None)
-                    curr_blk_id = curr_blk.prev_hash
+        moved = self.add_block(blk, sender)
+        if moved:
+            self.height_increased = True
 
         ### Mining for new block
-        print(f"Amount list for node {self.node} is {', '.join([f'{i}:{elem}' for i, elem in enumerate(self.amount_list)])}")
+        if self.log.on[eventlog.BALANCES]:
+            self.log.emit(eventlog.BALANCES, self.env.now, self.node, self.amount_list.tolist())
         
         if self.height_increased:
             if self.chain_length_diff > 0:
                 self.chain_length_diff -= 1
-                print("Decreasing chain length diff :", self.chain_length_diff)
+                self.log_lead()
             else:
                 self.private_chain_head = self.chain_head
-        self.mining_process.interrupt()
+        if moved:
+            self.record_event(attackerlog.PUBLIC, self.store.index(self.chain_head))
+        self.restart_mining()
     
     def find_mpu_adv(self):
         self.set_number_blocks_in_main()
         return self.total_num_in_main/self.num_blks_mined
     
     def find_mpu_overall(self):
-        global TOTAL_BLOCKS_MINED
-        return self.chain_height/TOTAL_BLOCKS_MINED
+        return self.chain_height/self.store.num_mined()
 
     def graph_private_chain(self, filename):
-        hash_to_idx_dict = {}
-        global GLOBAL_BLOCK_HASHES
-        for i , (hash, _) in enumerate(self.hash_to_block_dict.items()):
-            hash_to_idx_dict[hash] = list(GLOBAL_BLOCK_HASHES).index(hash)
+        labels = [self.store.index(blk.get_id()) for blk in self.private_block_chain] # store index of every private block
         with open(filename, 'w') as f:
             f.write("digraph unix {\nsize=\"7,5\"; \n node [color=goldenrod2, style=filled];\n")
-            f.write("\n".join([f'"{hash_to_idx_dict[self.private_block_chain[i]]}" -> "{hash_to_idx_dict[self.private_block_chain[i+1]]}";' 
-            for i in range(len(self.private_block_chain)-1)]))
+            f.write("\n".join([f'"{labels[i]}" -> "{labels[i+1]}";' 
+            for i in range(len(labels)-1)]))
             f.write("\n}")
 
-    def mark_malicious_event(self):
-        path = "malicious_events/"
-        isExist = os.path.exists(path)
-        if not isExist:
-            os.makedirs(path)
-        filename = path+str(self.env.now)
-        self.graph_print(filename)
+class SelfishMiner(Attacker):
+    # with a lead of one left the whole private chain is released, otherwise only its oldest block
+    def release_blocks(self):
+        if self.chain_length_diff == 1:
+            self.release_block()
+            self.release_block()
+            self.chain_length_diff -= 1
+            self.log_lead()
+            assert len(self.private_block_chain) == 0, "Private block chain length is non-empty"
+        else:
+            self.release_block()
+
+class StubMiner(Attacker):
+    # the oldest private block is released for every block added to the public chain
+    def release_blocks(self):
+        self.release_block()
@@ -0,0 +1,42 @@
+### drawing of the network topology, igraph and matplotlib are only imported when a plot is made
+
+import random
+import multiprocessing
+
+LAYOUT_SEED = 73 # seed of the python generator drawing the layouts
+
+# import igraph and set up its plotting configs
+def load_igraph():
+    import igraph as ig
+    import matplotlib
+    matplotlib.use("Agg") # plots are only written to files
+    ig.set_random_number_generator(random.Random(LAYOUT_SEED)) # make the layout draw from a seeded python generator
+    ig.config["plotting.backend"] = "matplotlib"
+    ig.config["plotting.layout"] = "fruchterman_reingold"
+    ig.config["plotting.palette"] = "rainbow"
+    return ig
+
+# build the igraph graph used for displaying the topology, the malicious node is the last one
+def topology_graph(n, edgelist, add_malicious=False):
+    ig = load_igraph()
+    # set all the parameters of the graph to display
+    p_graph = ig.Graph(n + 1 if add_malicious else n, edgelist)
+    p_graph.vs["label"] = range(n + 1 if add_malicious else n)
+    p_graph.vs["color"] = "blue" if not add_malicious else ["blue" if i < n else "red" for i in range(n+1)]
+    p_graph.vs["size"] = 0.6
+    p_graph.es["color"] = "black"
+    p_graph.es["width"] = 1
+    return p_graph
+
+# write the topology as svg and png
+def plot_topology(n, edgelist, add_malicious=False, svg="graph.svg", png="graph.png"):
+    ig = load_igraph()
+    p_graph = topology_graph(n, edgelist, add_malicious)
+    p_graph.write_svg(svg)
+    ig.plot(p_graph, png)
+
+# plot the topology in a separate worker process, returns the process to be joined
+def start_plot_worker(n, edgelist, add_malicious=False):
+    worker = multiprocessing.Process(target=plot_topology, args=(n, list(edgelist), add_malicious))
+    worker.start()
+    return worker
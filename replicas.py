@@ -0,0 +1,297 @@
+### replica-vectorized simulation of honest networks for Monte-Carlo statistics: K independent replicas of the same
+### topology advance together one mined block per step. The chains, heads and balances of every replica live in numpy
+### arrays indexed by replica, and the mining races, the transactions and the network delays are drawn as arrays
+### Limits: only honest networks are simulated (an attacker is rejected, its strategies need the event engine); a
+### transaction reaches the nodes along the shortest path of the mean link delays instead of hop by hop with sampled
+### delays, so its arrival times are an approximation; the arrival and balance tables are dense (replicas, blocks, n)
+### arrays, so the memory grows as K*B*n; a block spreads by relaxing every link up to n times (Bellman-Ford rounds
+### stopping early once the times settle), so a step costs up to K*n*E on long-diameter topologies
+
+import argparse
+import json
+import numpy as np
+import peer
+from streams import RandomStreams
+
+INITIAL_BLOCKS = 64 # initial number of block slots of every replica
+TXN_MEAN = 500 # mean interarrival time of the transactions of one node (simulator.EXPO_MEAN)
+COINBASE = 50 # coins created by every block
+
+# Class running K replicas of an honest network with the rules of the event engine: a node accepts a block whose
+# parent it knows and that is valid over the balances of that parent, follows the longest chain and forwards every
+# accepted block once to each neighbour. Blocks travel with per-hop delays drawn like peer.Delays; a transaction reaches
+# the nodes along the shortest path of mean link delays, and a template takes the oldest valid transactions of the pool.
+# Only honest networks are simulated, the attacker strategies need the event engine
+class ReplicaEngine:
+    def __init__(self, graph, replicas, simtime, seed=73, avg_inter_arrival=peer.AVG_INTER_ARRIVAL, add_malicious=False):
+        n = graph.n
+        if add_malicious or any(max(edge) >= n for edge in graph.edgelist):
+            raise Exception("The replica engine only simulates honest networks, run main.py for the attacker")
+        self.n, self.replicas, self.simtime = n, replicas, simtime
+        self.rng = RandomStreams(seed).stream("replicas").rng
+        self.rows = np.arange(replicas)
+
+        # directed edges grouped by receiver, every node has at least one link so each group is non empty
+        edges = np.asarray(graph.edgelist, dtype=np.int64).reshape(-1, 2)
+        keys = np.unique(np.concatenate((edges[:, 1]*n + edges[:, 0], edges[:, 0]*n + edges[:, 1])))
+        self.dst, self.src = keys//n, keys%n
+        self.groups = np.flatnonzero(np.r_[True, self.dst[1:] != self.dst[:-1]]) # first edge of every receiver
+        self.by_src = np.argsort(self.src, kind="stable") # the same edges grouped by sender
+        self.src_groups = np.flatnonzero(np.r_[True, np.diff(self.src[self.by_src]) != 0]) # first edge of every sender
+
+        # link parameters of peer.Delays, rho is drawn independently for every replica
+        is_fast = np.zeros(n, dtype=bool)
+        is_fast[np.asarray(graph.fast_nodes, dtype=np.int64)] = True
+        link_speed = np.where(is_fast[self.src] & is_fast[self.dst], 100.0, 5.0)
+        self.inv_link_speed = 1/link_speed
+        self.d_mean = peer.QUEUE_DELAY_FACTOR/link_speed
+        self.rho = self.rng.integers(peer.LOW_RHO, peer.HIGH_RHO, (replicas, len(keys)))
+        self.txn_weight = (self.rho + self.d_mean + self.inv_link_speed)[:, self.by_src] # mean delay of a txn, by sender
+
+        # hashing power of Simulator.set_all_fhp without an attacker, one network-wide race per block
+        power = np.ones(n)
+        power[np.asarray(graph.highcpu_nodes, dtype=np.int64)] = 10
+        self.mean = avg_inter_arrival # the fractions of the hashing power sum to one
+        self.cum_share = np.cumsum(power)/power.sum()
+        self.draw_txns()
+
+        # block tables, slot 0 is the genesis block known to every node at time 0
+        self.size = 1 # number of used slots (the same in every replica)
+        self.time = np.zeros(replicas) # time of the last block of every replica
+        self.active = np.ones(replicas, dtype=bool) # replicas that have not reached the end of the simulation
+        self.parent = np.full((replicas, INITIAL_BLOCKS), -1, dtype=np.int64)
+        self.height = np.zeros((replicas, INITIAL_BLOCKS), dtype=np.int64)
+        self.miner = np.full((replicas, INITIAL_BLOCKS), -1, dtype=np.int64) # -1 for the genesis block and unused slots
+        self.known = np.full((replicas, INITIAL_BLOCKS, n), np.inf) # time every node accepted the block
+        self.known[:, 0] = 0
+        self.balances = np.zeros((replicas, INITIAL_BLOCKS, n)) # balances at every block
+        self.blk_txns = np.full((replicas, INITIAL_BLOCKS, peer.MAX_TRANSACTION), -1, dtype=np.int64) # txns of every block
+        # chain heads: time every node first accepted a block of each height and that block, (replicas, nodes, heights).
+        # A node accepts a block after its parent, so the times grow with the height (inf above the tallest accepted)
+        self.first_at = np.full((replicas, n, INITIAL_BLOCKS), np.inf)
+        self.first_at[:, :, 0] = 0
+        self.first_blk = np.zeros((replicas, n, INITIAL_BLOCKS), dtype=np.int64)
+        self.top = 1 # number of heights in use
+
+    # shortest paths of the mean delay of a one unit message from every node to the target node of every replica,
+    # (replicas, node), relaxed over the edges grouped by sender
+    def txn_distances(self, targets):
+        dist = np.full((self.replicas, self.n), np.inf)
+        dist[self.rows, targets] = 0
+        dst = self.dst[self.by_src]
+        for _ in range(self.n):
+            new = np.minimum(dist, np.minimum.reduceat(self.txn_weight + dist[:, dst], self.src_groups, axis=1))
+            if np.array_equal(new, dist):
+                break
+            dist = new
+        return dist
+
+    # poisson transactions of every node up to the end of the simulation, as drawn by the transaction source
+    def draw_txns(self):
+        n, mean = self.n, TXN_MEAN/self.n
+        count = int(self.simtime/mean + 6*np.sqrt(self.simtime/mean)) + 16
+        tm = np.cumsum(self.rng.exponential(mean, (self.replicas, count)), axis=1)
+        while tm[:, -1].min() < self.simtime:
+            tm = np.concatenate((tm, tm[:, -1:] + np.cumsum(self.rng.exponential(mean, (self.replicas, count)), axis=1)), axis=1)
+        self.txn_tm = tm
+        self.txn_sender = self.rng.integers(0, n, tm.shape)
+        receiver = self.rng.integers(0, n-1, tm.shape)
+        self.txn_receiver = receiver + (receiver >= self.txn_sender)
+        self.txn_amount = self.rng.random(tm.shape)*peer.MAX_COIN
+
+    # double the block slots of every replica
+    def grow(self):
+        def double(arr, fill, axis=1):
+            return np.concatenate((arr, np.full_like(arr, fill)), axis=axis)
+        self.parent, self.height, self.miner = double(self.parent, -1), double(self.height, 0), double(self.miner, -1)
+        self.known, self.balances = double(self.known, np.inf), double(self.balances, 0)
+        self.blk_txns = double(self.blk_txns, -1)
+        self.first_at, self.first_blk = double(self.first_at, np.inf, 2), double(self.first_blk, 0, 2)
+
+    # record the accept times of the block in slot b: it becomes the head of height h of the nodes that got no other
+    # block of that height before it (the head only moves to a strictly taller block)
+    def update_heads(self, b):
+        h = self.height[:, b]
+        first = self.first_at[self.rows, :, h]
+        newer = self.known[:, b] < first
+        self.first_at[self.rows, :, h] = np.where(newer, self.known[:, b], first)
+        self.first_blk[self.rows, :, h] = np.where(newer, b, self.first_blk[self.rows, :, h])
+        self.top = max(self.top, int(h[np.isfinite(self.known[:, b]).any(axis=1)].max(initial=0)) + 1)
+
+    # chain heads of nodes (replicas, m) at times tm (replicas, m): the block of the largest height accepted by then,
+    # found by bisection over the heights (the genesis block is always accepted)
+    def heads_at(self, nodes, tm):
+        rows = self.rows[:, None]
+        lo = np.zeros(nodes.shape, dtype=np.int64)
+        hi = np.full(nodes.shape, self.top)
+        for _ in range(self.top.bit_length()):
+            mid = (lo + hi)//2
+            ok = self.first_at[rows, nodes, mid] <= tm
+            lo, hi = np.where(ok, mid, lo), np.where(ok, hi, mid)
+        return self.first_blk[rows, nodes, lo]
+
+    # blocks on the chains ending at the given heads as a (replicas, slots) mask
+    def main_chain(self, heads):
+        in_main = np.zeros((self.replicas, self.size), dtype=bool)
+        cur = heads.copy()
+        while (cur >= 0).any():
+            rows = self.rows[cur >= 0]
+            in_main[rows, cur[rows]] = True
+            cur[rows] = self.parent[rows, cur[rows]]
+        return in_main
+
+    # transactions of the templates of the winners on their heads: the oldest txns of the pool (received and not yet in
+    # the chain) that stay valid over the balances of the head, up to the drawn number of txns of every template
+    def templates(self, winners, heads, max_txn):
+        txns = np.full((self.replicas, peer.MAX_TRANSACTION), -1, dtype=np.int64)
+        in_chain = self.main_chain(heads)
+        distance = self.txn_distances(winners)
+        for r in self.rows[self.active]:
+            arrival = self.txn_tm[r] + distance[r, self.txn_sender[r]]
+            pool = np.flatnonzero(arrival <= self.time[r])
+            pool = pool[np.argsort(arrival[pool], kind="stable")]
+            confirmed = set(self.blk_txns[r, :self.size][in_chain[r]].ravel().tolist())
+            balances = self.balances[r, heads[r]]
+            deltas = {}
+            k = 0
+            for j in pool.tolist():
+                if k == max_txn[r]:
+                    break
+                if j in confirmed:
+                    continue
+                s, rc, amount = self.txn_sender[r, j], self.txn_receiver[r, j], self.txn_amount[r, j]
+                if balances[s] + deltas.get(s, 0) < amount:
+                    continue
+                deltas[s] = deltas.get(s, 0) - amount
+                deltas[rc] = deltas.get(rc, 0) + amount
+                txns[r, k] = j
+                k += 1
+        return txns
+
+    # check the blocks with the given txns over the balances at the blocks in heads (replicas, m) like ledger.is_valid
+    def valid_over(self, heads, txns):
+        valid = np.ones(heads.shape, dtype=bool)
+        rows = self.rows[:, None]
+        senders, receivers, amounts = [], [], []
+        for k in range(txns.shape[1]):
+            j = np.maximum(txns[:, k], 0)
+            used = txns[:, k] >= 0
+            s, rc = self.txn_sender[self.rows, j], self.txn_receiver[self.rows, j]
+            amount = np.where(used, self.txn_amount[self.rows, j], 0)
+            # balance of the sender after the earlier txns of the block
+            overlay = self.balances[rows, heads, s[:, None]]
+            for ps, prc, pa in zip(senders, receivers, amounts):
+                overlay = overlay + (pa*(prc == s) - pa*(ps == s))[:, None]
+            valid &= ~used[:, None] | (overlay - amount[:, None] >= 0)
+            senders.append(s)
+            receivers.append(rc)
+            amounts.append(amount)
+        return valid
+
+    # time every node accepts a block mined by the source nodes on top of the parents at time tm: a node forwards an
+    # accepted block once to each neighbour, which drops it if it arrives before the parent or is invalid over the
+    # balances of the parent, so the times are relaxed until they stop changing
+    def propagate(self, sources, parents, sizes, txns):
+        delay = self.rho + self.rng.exponential(1.0, self.rho.shape)*self.d_mean + sizes[:, None]*self.inv_link_speed
+        parent_known = self.known[self.rows, parents]
+        valid = self.valid_over(parents[:, None], txns)[:, 0] # the same for every receiver
+        accepted = np.full((self.replicas, self.n), np.inf)
+        accepted[self.rows, sources] = self.time
+        for _ in range(self.n):
+            arrival = accepted[:, self.src] + delay
+            ok = (arrival >= parent_known[:, self.dst]) & valid[:, None]
+            arrival[~ok] = np.inf
+            new = np.minimum.reduceat(arrival, self.groups, axis=1)
+            new[self.rows, sources] = self.time
+            new[~self.active] = np.inf
+            if np.array_equal(new, accepted):
+                break
+            accepted = new
+        return accepted
+
+    # mine the next block of every active replica
+    def step(self):
+        tm = self.time + self.rng.exponential(self.mean, self.replicas)
+        self.active &= tm < self.simtime
+        winners = np.minimum(np.searchsorted(self.cum_share, self.rng.random(self.replicas), side="right"), self.n-1)
+        max_txn = self.rng.integers(1, peer.MAX_TRANSACTION+1, self.replicas)
+        if not self.active.any():
+            return False
+        if self.size == self.parent.shape[1]:
+            self.grow()
+        self.time = np.where(self.active, tm, self.time)
+        heads = self.heads_at(winners[:, None], self.time[:, None])[:, 0]
+        txns = self.templates(winners, heads, max_txn)
+        b = self.size
+        self.parent[:, b] = np.where(self.active, heads, -1)
+        self.height[:, b] = self.height[self.rows, heads] + 1
+        self.miner[:, b] = np.where(self.active, winners, -1)
+        self.blk_txns[:, b] = txns
+
+        # balances of the new block: its txns and the coinbase over the balances of the parent
+        balances = self.balances[self.rows, heads].copy()
+        for k in range(txns.shape[1]):
+            used = self.rows[txns[:, k] >= 0]
+            j = txns[used, k]
+            np.subtract.at(balances, (used, self.txn_sender[used, j]), self.txn_amount[used, j])
+            np.add.at(balances, (used, self.txn_receiver[used, j]), self.txn_amount[used, j])
+        balances[self.rows, winners] += COINBASE
+        self.balances[:, b] = balances
+
+        sizes = 1 + (txns >= 0).sum(axis=1) # the coinbase does not count
+        self.known[:, b] = self.propagate(winners, heads, sizes, txns)
+        self.update_heads(b)
+        self.size += 1
+        return True
+
+    # run every replica to the end of the simulation
+    def run(self):
+        while self.step():
+            pass
+
+    # metrics of every replica measured on the main chain of the first node, as in Simulator.summary,
+    # plus the blocks mined by every node and how many of them ended in that main chain
+    def summary(self):
+        heads = self.heads_at(np.zeros((self.replicas, 1), dtype=np.int64), np.full((self.replicas, 1), float(self.simtime)))[:, 0]
+        in_main = self.main_chain(heads)
+        miner = self.miner[:, :self.size]
+        mined = miner >= 0
+        blocks_mined = mined.sum(axis=1)
+        chain_height = self.height[self.rows, heads]
+        mined_by = np.zeros((self.replicas, self.n), dtype=np.int64)
+        main_by = np.zeros((self.replicas, self.n), dtype=np.int64)
+        rows = np.broadcast_to(self.rows[:, None], miner.shape)
+        np.add.at(mined_by, (rows[mined], miner[mined]), 1)
+        np.add.at(main_by, (rows[mined & in_main], miner[mined & in_main]), 1)
+        return {"blocks_mined": blocks_mined, "main_chain_length": chain_height,
+                "mpu_overall": chain_height/np.maximum(1, blocks_mined), "mined_by": mined_by, "main_by": main_by}
+
+# function to get the input arguments
+def fetch_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--z0", type=float, default=0.5)
+    parser.add_argument("--z1", type=float, default=0.5)
+    parser.add_argument("--n", type=int, default=10)
+    parser.add_argument("--simtime", type=int, default=10000)
+    parser.add_argument("--replicas", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=73) # seed of the topology and of the replicas
+    parser.add_argument("--topology", choices=["regular", "ws", "geo", "degree"], default="regular")
+    parser.add_argument("--out", default="replica_results.jsonl") # one line per replica
+    parser.add_argument("--add_malicious", action="store_true") # rejected, the replicas are honest networks
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from graph import Graph
+    args = fetch_args()
+    peer.TOTAL_NODES = args.n
+    grph = Graph(args)
+    grph.create_graph()
+    engine = ReplicaEngine(grph, args.replicas, args.simtime, args.seed, add_malicious=args.add_malicious)
+    engine.run()
+    summary = engine.summary()
+    with open(args.out, "w") as f:
+        for r in range(args.replicas):
+            f.write(json.dumps({key: val[r].tolist() for key, val in summary.items()}, sort_keys=True) + "\n")
+    mpu = summary["mpu_overall"]
+    print(f"{args.replicas} replicas, mpu_overall {mpu.mean():.4f} +- {mpu.std(ddof=1)/np.sqrt(len(mpu)):.4f}; results in {args.out}")
@@ -1,40 +1,98 @@
 import simpy
 from peer import *
+import peer
+from blockstore import BlockStore
+from engine import ENGINES
+from mining import MiningScheduler
+from transactions import TransactionSource
+from streams import RandomStreams
+from checkpoint import save_checkpoint, load_checkpoint
+from output import peer_row, write_trees, OUTPUT_PATH
+from eventlog import EventLog
+from eventtrace import TraceWriter
+from attackerlog import EVENTS_PATH
 
 # mean interarrival time of transactions
 EXPO_MEAN = 500
+CHECKPOINT_PATH = "checkpoint_{time}.npz" # default file of the checkpoints, {time} is the simulated time
+ATTACKER_TYPES = {0: SelfishMiner, 1: StubMiner} # malicious type to the class of the attacker
 
 # class to simulate the blockchain
 class Simulator:
-    def __init__(self, args, graph, env=simpy.Environment(), name="htg", debug=False, add_malicious=False, malicious_power=0.3):
+    def __init__(self, args, graph, env=None, name="htg", debug=False, add_malicious=False, malicious_power=0.3, engine="callback", mining="process", seed=73, malicious_type=MALICIOUS_TYPE, log=None, trace=None, nodes=None, events_path=EVENTS_PATH):
         # initialize the simulator with the required parameters
-        self.env = env
+        self.env = env if env is not None else simpy.Environment() # every simulator gets its own environment by default
         self.name = name
         self.simtime = args.simtime
         self.graph = graph
         self.args = args
         self.debug = debug
-        self.delay = Delays(args.n+1 if add_malicious else args.n, graph.fast_nodes)
+        self.streams = RandomStreams(seed) # independent random substreams of the simulation
+        self.log = log if log is not None else EventLog() # event log of the simulation (info level on stdout by default)
+        self.trace = trace if trace is not None else TraceWriter() # event trace of the simulation, written once opened
+        self.serials = TxnSerials() # serial numbers of the transactions of the simulation
+        self.delay = Delays(args.n+1 if add_malicious else args.n, graph.fast_nodes, graph.edgelist, self.streams)
+        self.engine = ENGINES[engine](self.env, self.delay) # delivers the messages between the peers
         self.genesis_block = Block("0", self.env)
+        self.genesis_block.seal()
+        self.store = BlockStore() # blocks shared by all the peers
+        self.store.add(self.genesis_block)
         self.add_malicious = add_malicious
         self.malicious_power = malicious_power
-        # adjust the peer list for the malicious node
-        self.peer_list = [Peer(i, EXPO_MEAN, args.n+1 if add_malicious else args.n, env, self.delay, self.genesis_block) for i in range(args.n)]
-        # check for what type of malicious node to add
+        self.mining = mining # "process" for one mining process per node, "scheduler" for a single network-wide race
+        self.mining_scheduler = None
+        self.txn_source = None
+        # adjust the peer list for the malicious node, only the given nodes (all by default) are simulated here and
+        # the others are stubs (the parallel engine runs them in other workers)
+        total_nodes = args.n+1 if add_malicious else args.n
+        self.nodes = list(range(total_nodes)) if nodes is None else sorted(nodes)
+        simulated = set(self.nodes)
+        self.peer_list = [Peer(i, EXPO_MEAN, total_nodes, self.env, self.delay, self.genesis_block, self.store) if i in simulated else RemotePeer(i)
+                          for i in range(args.n)]
+        # check for what type of malicious node to add, its events go to the file events_path (only kept in memory if None)
         if add_malicious:
-            if MALICIOUS_TYPE == 0:
-                self.peer_list.append(SelfishMiner(args.n, EXPO_MEAN, args.n+1, env, self.delay, self.genesis_block))
-            elif MALICIOUS_TYPE == 1:
-                self.peer_list.append(StubMiner(args.n, EXPO_MEAN, args.n+1, env, self.delay, self.genesis_block))
+            self.peer_list.append(ATTACKER_TYPES[malicious_type](args.n, EXPO_MEAN, args.n+1, self.env, self.delay, self.genesis_block, self.store, events_path)
+                                  if args.n in simulated else RemotePeer(args.n))
+        for node in self.nodes:
+            self.peer_list[node].set_simulation(self.log, self.trace, self.serials)
 
         self.set_all_peer_list()
         self.set_all_fhp()
+        for node in self.nodes:
+            self.peer_list[node].set_engine(self.engine)
+            self.peer_list[node].set_streams(self.streams)
 
-    # call this function to start the simulation
-    def start_simulation(self):
-        for elem in self.peer_list:
-            self.env.process(elem.run())
+    # call this function to start the simulation, a checkpoint is written at every time in checkpoint_times
+    def start_simulation(self, checkpoint_times=(), checkpoint_path=CHECKPOINT_PATH):
+        self.start_processes()
+        self.run(checkpoint_times, checkpoint_path)
+
+    # continue a simulation from a checkpoint, the simulator must be built with the same configuration and not started
+    def resume(self, path, checkpoint_times=(), checkpoint_path=CHECKPOINT_PATH):
+        load_checkpoint(self, path)
+        self.run(checkpoint_times, checkpoint_path)
+
+    # start the mining and the transaction processes (resumed processes first wait for their restored wakeup events)
+    def start_processes(self, mining_wakeup=None, txn_wakeup=None):
+        if self.mining == "scheduler":
+            self.mining_scheduler = MiningScheduler(self.env, self.peer_list, peer.AVG_INTER_ARRIVAL, self.streams.stream("mining"))
+            self.env.process(self.mining_scheduler.run(mining_wakeup))
+        else:
+            for elem in self.peer_list:
+                elem.start_mining()
+        self.txn_source = TransactionSource(self.env, self.peer_list, EXPO_MEAN, MAX_COIN, self.streams.stream("txn").rng)
+        self.env.process(self.txn_source.run(txn_wakeup))
+
+    # run up to the end of the simulation, stopping at the checkpoint times (checkpoint_path may contain {time})
+    def run(self, checkpoint_times=(), checkpoint_path=CHECKPOINT_PATH):
+        for tm in sorted(checkpoint_times):
+            if self.env.now < tm < self.simtime:
+                self.env.run(until=tm)
+                save_checkpoint(self, checkpoint_path.format(time=tm))
         self.env.run(until=self.simtime)
+        if self.add_malicious:
+            self.peer_list[-1].recorder.flush()
+        self.log.flush()
         
     #function to set neighbour edge list in graph
     def set_all_peer_list(self):
@@ -47,20 +105,71 @@ class Simulator:
             peer_dict[elem[0]].append(self.peer_list[elem[1]])
             peer_dict[elem[1]].append(self.peer_list[elem[0]])
         
-        for elem in self.peer_list:
-            elem.set_peer_list(list(set(peer_dict[elem.node])))
+        for node in self.nodes:
+            self.peer_list[node].set_peer_list(list(dict.fromkeys(peer_dict[node]))) # dedup while keeping a reproducible order
     
     # set the fractional hashing power of node depending on high or low CPU
     def set_all_fhp(self):
         unit_hp = (1-(self.malicious_power if self.add_malicious else 0))/(10*len(self.graph.highcpu_nodes) + len(self.graph.lowcpu_nodes))
+        highcpu_nodes = set(self.graph.highcpu_nodes)
         for elem in self.peer_list:
-            if elem.node in self.graph.highcpu_nodes:
+            if elem.node in highcpu_nodes:
                 elem.set_fraction_hashing_power(10*unit_hp)
             else:
                 elem.set_fraction_hashing_power(unit_hp)
         if self.add_malicious:
             self.peer_list[-1].set_fraction_hashing_power(self.malicious_power)
     
+    # write the next events of the attacker to another file, the events written so far are copied there first
+    def set_events_path(self, path):
+        if self.add_malicious and isinstance(self.peer_list[-1], Attacker):
+            self.peer_list[-1].recorder.move_to(path)
+
+    # totals of the gossip duplicate suppression over all the peers (or the given ones)
+    def gossip_stats(self, peers=None):
+        stats = {"sent": 0, "suppressed": 0, "pruned": 0, "remembered": 0}
+        for elem in self.peer_list if peers is None else peers:
+            for fltr in (elem.sent_txns, elem.sent_blks):
+                stats["sent"] += fltr.sent
+                stats["suppressed"] += fltr.suppressed
+                stats["pruned"] += fltr.pruned
+                stats["remembered"] += len(fltr)
+        return stats
+
+    # change the strategy and/or the hashing power of the attacker, e.g. in a branch of a warmed-up simulation
+    def set_attacker(self, malicious_type=None, malicious_power=None):
+        if not self.add_malicious:
+            raise Exception("The simulation has no attacker")
+        if malicious_type is not None:
+            # both attacker classes keep the same state, so the strategy is switched in place and every
+            # reference to the node (peer lists, messages in flight) stays valid
+            self.peer_list[-1].__class__ = ATTACKER_TYPES[malicious_type]
+        if malicious_power is not None and malicious_power != self.malicious_power:
+            self.malicious_power = malicious_power
+            self.set_all_fhp()
+            if self.mining_scheduler is not None:
+                self.mining_scheduler.update_power()
+            else:
+                # restart the exponential clocks of the running mining processes with the new rates (memoryless)
+                for elem in self.peer_list:
+                    if elem.mining_process is not None:
+                        elem.mining_process.interrupt()
+
+    # summary metrics of the run, measured on the main chain of the first node (used by the sweeps)
+    def summary(self):
+        ref = self.peer_list[0]
+        summary = {"blocks_mined": self.store.num_mined(), "main_chain_length": int(ref.chain_height)}
+        summary["mpu_overall"] = ref.chain_height/max(1, self.store.num_mined()) # fraction of the mined blocks in the main chain
+        if self.add_malicious:
+            adv = self.peer_list[-1]
+            adv_in_main = int(adv.blocks_in_chain(ref.chain_head))
+            summary["adversary_mined"] = len(adv.gen_block_hashes)
+            summary["adversary_in_main"] = adv_in_main
+            summary["mpu_adv"] = adv_in_main/max(1, len(adv.gen_block_hashes)) # fraction of the attacker blocks in the main chain
+            summary["adversary_share"] = adv_in_main/max(1, ref.chain_height) # fraction of the main chain mined by the attacker
+        summary.update(self.gossip_stats())
+        return summary
+
     # print the output of all the peers
     def print_all_peer_output(self):
         for elem in self.peer_list:
@@ -70,3 +179,7 @@ class Simulator:
     def print_all_peer_graphs(self):
         for elem in self.peer_list:
             elem.graph_print(f"./peer_graphs/peer_{elem.node}.txt")
+
+    # write the block DAG once and the arrival times of all the peers into one .npz file
+    def write_outputs(self, path=OUTPUT_PATH):
+        write_trees(self.store, [peer_row(elem) for elem in self.peer_list], path)
@@ -0,0 +1,51 @@
+### buffered and seedable random streams, one independent substream per purpose
+
+import zlib
+import numpy as np
+
+MIN_BUFFER = 64    # size of the first buffer of a stream
+MAX_BUFFER = 8192  # buffers double on every refill up to this size
+
+# Class serving scalar draws from large pre-drawn buffers of one generator
+class RandomStream:
+    def __init__(self, seed_seq):
+        self.rng = np.random.Generator(np.random.PCG64(seed_seq)) # generator for vectorized draws
+        self.exp_buf, self.exp_pos, self.exp_size = [], 0, MIN_BUFFER # unit exponentials
+        self.uni_buf, self.uni_pos, self.uni_size = [], 0, MIN_BUFFER # uniforms in [0, 1)
+
+    # exponential with the given mean (unit exponential scaled by the mean)
+    def exponential(self, scale=1.0):
+        if self.exp_pos == len(self.exp_buf):
+            self.exp_buf = self.rng.standard_exponential(self.exp_size).tolist()
+            self.exp_pos, self.exp_size = 0, min(2*self.exp_size, MAX_BUFFER)
+        self.exp_pos += 1
+        return self.exp_buf[self.exp_pos-1]*scale
+
+    # uniform in [0, 1)
+    def random(self):
+        if self.uni_pos == len(self.uni_buf):
+            self.uni_buf = self.rng.random(self.uni_size).tolist()
+            self.uni_pos, self.uni_size = 0, min(2*self.uni_size, MAX_BUFFER)
+        self.uni_pos += 1
+        return self.uni_buf[self.uni_pos-1]
+
+    # integer in [low, high] (both inclusive, like random.randint)
+    def randint(self, low, high):
+        return low + int(self.random()*(high-low+1))
+
+# Class handing out the independent substreams of a simulation
+class RandomStreams:
+    def __init__(self, seed):
+        self.seed = seed
+        self.streams = {} # (purpose, index) to stream
+
+    # stream for a purpose ("delay", "mining", ...) and an optional index such as a node id
+    def stream(self, purpose, index=0):
+        key = (purpose, index)
+        stream = self.streams.get(key)
+        if stream is None:
+            # the substream only depends on the seed, the purpose and the index, so it is the same
+            # whatever order the streams are first used in
+            seed_seq = np.random.SeedSequence(self.seed, spawn_key=(zlib.crc32(purpose.encode()), index))
+            stream = self.streams[key] = RandomStream(seed_seq)
+        return stream
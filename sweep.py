@@ -0,0 +1,121 @@
+### parameter sweeps run over a process pool, with the results cached on disk by config hash
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import multiprocessing
+
+CACHE_DIR = "sweep_cache" # directory of the cached results
+CACHE_VERSION = 1 # part of every key, bump it when a change of the simulator makes old results stale
+
+# full configuration of one run, the grids override some of these
+DEFAULTS = {
+    "z0": 0.5, "z1": 0.5, "n": 10, "simtime": 10000,
+    "add_malicious": True, "malicious_power": 0.3, "zeta": 3, "malicious_type": 1,
+    "seed": 73, "topology": "regular", "engine": "callback", "mining": "process", "inter_arrival": 500,
+}
+GRID_KEYS = ("z0", "z1", "n", "malicious_power", "zeta", "malicious_type", "seed") # parameters that can be swept
+
+# hash of the full configuration used as the cache key
+def config_key(config):
+    blob = json.dumps({"version": CACHE_VERSION, **config}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+# all the configurations of the grid {parameter: [values]} over the base configuration
+def expand_grid(grid, base=None):
+    base = dict(DEFAULTS, **(base or {}))
+    names = [name for name in GRID_KEYS if name in grid]
+    return [dict(base, **dict(zip(names, values))) for values in itertools.product(*[grid[name] for name in names])]
+
+# run one configuration in a fresh worker process and return its summary
+def run_config(config):
+    # the simulator modules keep global state, so they are only imported inside the worker
+    import peer
+    from graph import Graph, Dict2Class
+    from simulator import Simulator
+    from eventlog import EventLog
+    peer.TOTAL_NODES = config["n"]
+    peer.AVG_INTER_ARRIVAL = config["inter_arrival"]
+    args = Dict2Class({key: config[key] for key in ("z0", "z1", "n", "simtime", "topology", "seed")})
+    grph = Graph(args)
+    grph.create_graph(add_malicious=config["add_malicious"], zeta=config["zeta"])
+    # the attacker events are not written
+    sim = Simulator(args, grph, add_malicious=config["add_malicious"], malicious_power=config["malicious_power"],
+                    engine=config["engine"], mining=config["mining"], seed=config["seed"], malicious_type=config["malicious_type"],
+                    log=EventLog("off"), events_path=None)
+    sim.start_simulation()
+    return sim.summary()
+
+# run one (cache key, configuration) pair of the pool, the key comes back with the summary
+def run_entry(entry):
+    key, config = entry
+    return key, run_config(config)
+
+# Class storing one json file per finished configuration
+class ResultCache:
+    def __init__(self, path=CACHE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    # cached result of the configuration or None
+    def get(self, key):
+        try:
+            with open(os.path.join(self.path, key + ".json")) as f:
+                return json.load(f)["result"]
+        except FileNotFoundError:
+            return None
+
+    # store the result, written to a temporary file first so a killed sweep never leaves a partial entry
+    def put(self, key, config, result):
+        tmp = os.path.join(self.path, key + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"config": config, "result": result}, f, sort_keys=True)
+        os.replace(tmp, os.path.join(self.path, key + ".json"))
+
+# run every configuration of the grid missing from the cache, returns [(config, result)] in grid order
+def run_sweep(grid, base=None, workers=None, cache_dir=CACHE_DIR):
+    cache = ResultCache(cache_dir)
+    configs = expand_grid(grid, base)
+    keys = [config_key(config) for config in configs]
+    results = {key: cache.get(key) for key in keys}
+    missing = {key: config for key, config in zip(keys, configs) if results[key] is None}
+    if missing:
+        # a fresh process per run, so no module state leaks from one configuration to the next
+        with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+            for key, result in pool.imap_unordered(run_entry, missing.items()):
+                results[key] = result
+                cache.put(key, missing[key], result)
+    return [(config, results[key]) for key, config in zip(keys, configs)], len(missing)
+
+# function to get the input arguments
+def fetch_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--z0", type=float, nargs="+", default=[DEFAULTS["z0"]])
+    parser.add_argument("--z1", type=float, nargs="+", default=[DEFAULTS["z1"]])
+    parser.add_argument("--n", type=int, nargs="+", default=[DEFAULTS["n"]])
+    parser.add_argument("--malicious_power", type=float, nargs="+", default=[DEFAULTS["malicious_power"]])
+    parser.add_argument("--zeta", type=int, nargs="+", default=[DEFAULTS["zeta"]])
+    parser.add_argument("--malicious_type", type=int, nargs="+", choices=[0, 1], default=[DEFAULTS["malicious_type"]]) # 0 selfish, 1 stubborn
+    parser.add_argument("--seed", type=int, nargs="+", default=[DEFAULTS["seed"]])
+    parser.add_argument("--simtime", type=int, default=DEFAULTS["simtime"])
+    parser.add_argument("--honest", action="store_true") # run without the attacker
+    parser.add_argument("--topology", choices=["regular", "ws", "geo", "degree"], default=DEFAULTS["topology"])
+    parser.add_argument("--engine", choices=["process", "callback", "flood"], default=DEFAULTS["engine"])
+    parser.add_argument("--mining", choices=["process", "scheduler"], default=DEFAULTS["mining"])
+    parser.add_argument("--workers", type=int, default=None) # size of the process pool (all cores by default)
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--out", default="sweep_results.jsonl") # one line per configuration
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = fetch_args()
+    grid = {name: getattr(args, name) for name in GRID_KEYS}
+    base = {"simtime": args.simtime, "add_malicious": not args.honest, "topology": args.topology, "engine": args.engine, "mining": args.mining}
+    rows, computed = run_sweep(grid, base, args.workers, args.cache)
+    with open(args.out, "w") as f:
+        for config, result in rows:
+            f.write(json.dumps({"config": config, "result": result}, sort_keys=True) + "\n")
+    print(f"{len(rows)} configurations, {computed} computed, {len(rows)-computed} from the cache; results in {args.out}")
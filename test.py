@@ -0,0 +1,787 @@
+### tests of the building blocks of the simulator, run with python -m pytest
+
+import numpy as np
+import pytest
+import simpy
+import ledger
+import topology
+from blockstore import BlockStore
+from mempool import Mempool
+import eventlog
+import eventtrace
+from eventlog import EventLog
+from eventtrace import TraceWriter, Trace
+from gossip import GossipFilter
+from peer import Block, Transaction
+
+# sealed block on top of parent, the coinbase serial makes every block unique
+def make_block(parent, env, serial, txns=()):
+    blk = Block(parent.get_id(), env, np.full(10, 1000.0))
+    for txn in txns:
+        blk.add_txn(txn)
+    blk.add_txn(Transaction(None, 0, 50, serial))
+    blk.seal()
+    return blk
+
+# store holding a random tree of size blocks, returns the store and the parent of every index, most blocks extend
+# one of the latest spread blocks and the forks start at most back blocks earlier (anywhere by default)
+def random_tree(size, seed=1, spread=3, back=None):
+    rng = np.random.default_rng(seed)
+    env = simpy.Environment()
+    store = BlockStore()
+    genesis = Block("0", env)
+    genesis.seal()
+    store.add(genesis)
+    parents = [-1]
+    for i in range(1, size):
+        # mostly extend one of the latest blocks so the tree gets deep, sometimes fork from anywhere
+        parent = int(rng.integers(max(0, i-spread), i)) if rng.random() < 0.9 else int(rng.integers(0 if back is None else max(0, i-back), i))
+        store.add(make_block(store.block(parent), env, i))
+        parents.append(parent)
+    return store, parents
+
+# chain from the genesis block to idx by walking the parents
+def naive_chain(parents, idx):
+    chain = []
+    while idx >= 0:
+        chain.append(idx)
+        idx = parents[idx]
+    return chain[::-1]
+
+### ids
+
+def test_txn_id_is_frozen_at_creation():
+    import hashlib
+    txn = Transaction(1, 2, 3.5, 7)
+    digest = hashlib.sha256(txn.serialize()).digest()
+    txn.amount = 100.0 # a later mutation does not change the memoized id
+    assert txn.get_id() == digest.hex() and txn.short_id == int.from_bytes(digest[:8], "little")
+
+def test_block_id_is_frozen_when_sealed():
+    env = simpy.Environment()
+    genesis = Block("0", env)
+    blk = Block(genesis.get_id(), env, np.full(10, 1000.0))
+    blk.add_txn(Transaction(1, 2, 5.0, 1))
+    first = blk.get_id() # seals the block
+    assert blk.seal() == first and blk.txn_ids == {blk.block_txn_list[0].get_id()}
+    assert not blk.add_txn(Transaction(3, 4, 5.0, 2))
+    blk.tm = 99.0
+    assert blk.get_id() == first and len(blk.block_txn_list) == 1
+
+def test_ids_are_the_same_across_runs():
+    import os
+    import subprocess
+    import sys
+    code = ("import simpy, numpy as np; from peer import Block, Transaction; env = simpy.Environment(); "
+            "blk = Block(Block('0', env).get_id(), env, np.full(4, 10.0)); blk.add_txn(Transaction(1, 2, 3.0, 4)); "
+            "blk.add_txn(Transaction(None, 0, 50, 5)); print(blk.get_id(), blk.short_id)")
+    outputs = {subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, "PYTHONHASHSEED": seed}).stdout for seed in ["1", "2"]}
+    assert len(outputs) == 1 and len(outputs.pop().split()[0]) == 64
+
+### ledger
+
+def test_txn_deltas_and_apply_deltas():
+    txns = [Transaction(None, 1, 50, 0), Transaction(1, 2, 20, 1), Transaction(2, 3, 5, 2), Transaction(1, 3, 10, 3)]
+    deltas = ledger.txn_deltas(txns)
+    assert deltas == {1: 20, 2: 15, 3: 15}
+    balances = np.array([7.0, 1.0, 2.0, 3.0])
+    ledger.apply_deltas(balances, deltas)
+    assert balances.tolist() == [7.0, 21.0, 17.0, 18.0]
+    ledger.apply_deltas(balances, deltas, -1)
+    assert balances.tolist() == [7.0, 1.0, 2.0, 3.0]
+
+def test_is_valid_checks_in_order():
+    balances = np.array([0.0, 10.0, 0.0])
+    assert ledger.is_valid(balances, [Transaction(1, 2, 10, 0), Transaction(2, 0, 10, 1)])
+    assert not ledger.is_valid(balances, [Transaction(2, 0, 10, 0), Transaction(1, 2, 10, 1)])
+
+def test_state_cache_evicts_least_recently_used():
+    cache = ledger.StateCache(capacity=3)
+    for idx in range(3):
+        cache.put(idx, np.full(2, float(idx)))
+    assert cache.lookup([5, 0]) == (1, cache.states[0]) # touching 0 makes 1 the oldest
+    cache.put(3, np.zeros(2))
+    assert list(cache.states) == [2, 0, 3]
+    cache.put(2, np.ones(2)) # an existing snapshot is only refreshed
+    assert list(cache.states) == [0, 3, 2] and cache.states[2].tolist() == [2.0, 2.0]
+    assert cache.lookup([7, 8]) == (None, None)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_state_cache_keeps_copies():
+    cache = ledger.StateCache()
+    balances = np.zeros(2)
+    cache.put(0, balances)
+    balances += 1
+    assert cache.states[0].tolist() == [0.0, 0.0]
+
+def test_confirmed_ids_and_remove_ids():
+    env = simpy.Environment()
+    genesis = Block("0", env)
+    genesis.seal()
+    txns = [Transaction(1, 2, 1, serial) for serial in range(4)]
+    a = make_block(genesis, env, 10, txns[:2])
+    b = make_block(a, env, 11, txns[1:3])
+    assert a.txn_ids == {txn.get_id() for txn in a.block_txn_list}
+    confirmed = ledger.confirmed_ids([a, b])
+    assert confirmed == a.txn_ids | b.txn_ids
+    pool = Mempool()
+    for txn in txns:
+        pool.add(txn, 0)
+    pool.remove_ids(confirmed)
+    assert [txn.serial for txn in pool.values()] == [3]
+
+### block store
+
+def test_ancestor_at_and_lca_match_parent_walk():
+    store, parents = random_tree(400)
+    rng = np.random.default_rng(2)
+    heights = [len(naive_chain(parents, idx)) - 1 for idx in range(len(parents))]
+    assert store.height[:store.size].tolist() == heights
+    for _ in range(500):
+        a, b = rng.integers(0, len(parents), 2).tolist()
+        chain_a, chain_b = naive_chain(parents, a), naive_chain(parents, b)
+        h = int(rng.integers(0, heights[a]+1))
+        assert store.ancestor_at(a, h) == chain_a[h]
+        common = [x for x, y in zip(chain_a, chain_b) if x == y]
+        assert store.lca(a, b) == common[-1]
+        assert store.path(common[-1], a) == chain_a[len(common):]
+
+def test_jump_pointers_match_parent_walk_when_slots_fill_out_of_order():
+    # past the initial capacity, with the blocks placed at their slots in a random order that keeps parents first
+    # like the blocks of the other workers in the parallel engine
+    tree, parents = random_tree(1500, seed=7, spread=2, back=40)
+    rng = np.random.default_rng(3)
+    children = [[] for _ in parents]
+    for idx, parent in enumerate(parents[1:], 1):
+        children[parent].append(idx)
+    store, ready = BlockStore(), [0]
+    while ready:
+        idx = ready.pop(int(rng.integers(len(ready))))
+        assert store.add(tree.block(idx), idx) == idx
+        ready += children[idx]
+    chains = [naive_chain(parents, idx) for idx in range(len(parents))]
+    assert store.height[:store.size].tolist() == [len(chain) - 1 for chain in chains]
+    for idx in rng.choice(len(parents), 200, replace=False).tolist():
+        assert [store.ancestor_at(idx, h) for h in range(len(chains[idx]))] == chains[idx]
+    for _ in range(2000):
+        a, b = rng.integers(0, len(parents), 2).tolist()
+        common = [x for x, y in zip(chains[a], chains[b]) if x == y]
+        assert store.lca(a, b) == common[-1]
+        assert store.in_chain(a, b) == (a in chains[b])
+
+def test_store_adds_a_block_once():
+    store, _ = random_tree(5)
+    assert store.add(store.block(3)) == 3
+    assert store.size == 5 and store.num_mined() == 4
+    assert store.index(store.block(4).get_id()) == 4 and store.index("unknown") is None
+
+### topology
+
+# degrees in [MIN_DEGREE, MAX_DEGREE], no self loops or duplicate edges and a single component
+def check_graph(n, edges):
+    deg = topology.degrees(n, edges)
+    assert topology.MIN_DEGREE <= deg.min() and deg.max() <= topology.MAX_DEGREE
+    assert (edges[:, 0] < edges[:, 1]).all() and len(np.unique(edges[:, 0]*n + edges[:, 1])) == len(edges)
+    assert (topology.components(n, edges) == 0).all()
+
+@pytest.mark.parametrize("kind", sorted(topology.GENERATORS))
+def test_generators_give_bounded_connected_graphs(kind):
+    for n in list(range(topology.MIN_DEGREE+1, 13)) + [50, 300]:
+        for seed in range(5):
+            check_graph(n, topology.generate(n, kind, np.random.default_rng(seed)))
+
+@pytest.mark.parametrize("kind", sorted(topology.GENERATORS))
+@pytest.mark.parametrize("n", [0, 1, 2, topology.MIN_DEGREE])
+def test_generators_reject_too_few_nodes(kind, n):
+    with pytest.raises(ValueError):
+        topology.generate(n, kind, np.random.default_rng(0))
+
+def test_repair_fails_when_no_node_has_room():
+    # the nodes of the clique are full, the last node has nobody left to link to
+    clique = [(a, b) for a in range(5) for b in range(a+1, 5)]
+    with pytest.raises(ValueError):
+        topology.repair(6, clique, np.random.default_rng(0), low=4, high=4)
+
+def test_repair_fails_when_a_component_cannot_be_joined():
+    # two full cliques: every degree is already the maximum
+    clique = [(a, b) for a in range(9) for b in range(a+1, 9)]
+    edges = clique + [(a+9, b+9) for a, b in clique]
+    with pytest.raises(ValueError):
+        topology.repair(18, edges, np.random.default_rng(0))
+
+def test_repair_joins_components():
+    clique = [(a, b) for a in range(6) for b in range(a+1, 6)]
+    edges = topology.repair(12, clique + [(a+6, b+6) for a, b in clique], np.random.default_rng(0))
+    check_graph(12, edges)
+
+### gossip
+
+def test_gossip_filter_announces_once_per_neighbour():
+    fltr = GossipFilter([4, 7, 9])
+    assert fltr.announce(1, 4, 0) and fltr.announce(1, 7, 0)
+    assert not fltr.announce(1, 4, 5)
+    assert fltr.announce(2, 4, 5)
+    assert (fltr.sent, fltr.suppressed, len(fltr)) == (3, 1, 2)
+    assert fltr.announced[1] == 0b11
+
+def test_gossip_filter_forgets_items_after_the_window():
+    fltr = GossipFilter([4, 7], window=100)
+    fltr.announce(1, 4, 0)
+    fltr.announce(2, 4, 50)
+    assert not fltr.announce(1, 4, 100) # exactly one window later it is still remembered
+    assert fltr.announce(1, 4, 101) # forgotten, so announced again as a new item
+    assert fltr.pruned == 1 and list(fltr.first_sent) == [(50, 2), (101, 1)]
+    fltr.prune(1000)
+    assert len(fltr) == 0 and fltr.pruned == 3
+
+### random streams
+
+def test_substreams_do_not_depend_on_the_order_of_use():
+    from streams import RandomStreams
+    first, second = RandomStreams(5), RandomStreams(5)
+    a = [first.stream("delay", 3).exponential() for _ in range(100)]
+    other = [second.stream(purpose, 3).exponential() for purpose in ["mining", "links"] for _ in range(100)]
+    assert [second.stream("delay", 3).exponential() for _ in range(100)] == a
+    assert other[:100] != a and other[100:] != a and other[:100] != other[100:]
+    assert [first.stream("delay", 4).exponential() for _ in range(100)] != a
+    assert [RandomStreams(6).stream("delay", 3).exponential() for _ in range(100)] != a
+
+def test_same_seed_gives_identical_runs():
+    import random
+    from simulator import Simulator
+    args, graph = make_network(simtime=6000)
+
+    def run(seed):
+        sim = Simulator(args, graph, mining="scheduler", seed=seed, log=EventLog("off"))
+        sim.start_simulation()
+        return sim.summary(), [sim.store.block(idx).get_id() for idx in range(sim.store.size)]
+
+    random.seed(1)
+    np.random.seed(1)
+    first = run(5)
+    random.seed(2) # the global generators are not used by the simulation
+    np.random.seed(2)
+    assert run(5) == first
+    assert run(6)[1] != first[1]
+
+### network delays
+
+# dense (total_nodes, total_nodes) parameters of the links like the lookup tables before the CSR arrays, the per
+# link values are laid out in (sender, receiver) order
+def dense_delays(total_nodes, fast_nodes, edgelist, rho):
+    links = sorted({(s, r) for a, b in edgelist for s, r in [(a, b), (b, a)]})
+    dense_rho = np.full((total_nodes, total_nodes), -1)
+    speed = np.full((total_nodes, total_nodes), 5.0)
+    for (s, r), value in zip(links, rho):
+        dense_rho[s, r] = value
+        if s in fast_nodes and r in fast_nodes:
+            speed[s, r] = 100.0
+    return links, dense_rho, speed
+
+def test_csr_delays_match_the_dense_lookup():
+    from peer import Delays, QUEUE_DELAY_FACTOR, LOW_RHO
+    from streams import RandomStreams
+    args, graph = make_network(n=12)
+    delays = Delays(12, graph.fast_nodes, graph.edgelist + [tuple(graph.edgelist[0])], RandomStreams(4)) # a duplicate link is kept once
+    links, rho, speed = dense_delays(12, set(graph.fast_nodes), graph.edgelist, delays.rho)
+    assert len(delays.rho) == len(links) and all(rho[link] >= LOW_RHO for link in links)
+    assert [delays.edge(s, r) for s, r in links] == list(range(len(links)))
+    with pytest.raises(AssertionError):
+        delays.edge(*next((s, r) for s in range(12) for r in range(12) if s != r and (s, r) not in set(links)))
+
+    # the delay of every hop and the delays of all the links for one message match the dense tables
+    reference = RandomStreams(4)
+    for s, r in links + links[::-1]:
+        expected = rho[s, r] + reference.stream("delay", s).exponential(QUEUE_DELAY_FACTOR/speed[s, r]) + 8*(1/speed[s, r])
+        assert delays.get_delay(s, r, 8) == expected
+    sampled = delays.sample_links(8)
+    unit = reference.stream("links").rng.exponential(QUEUE_DELAY_FACTOR/np.array([speed[link] for link in links]))
+    assert sampled == [rho[link] + draw + 8*(1/speed[link]) for link, draw in zip(links, unit)]
+
+### flood engine
+
+# fixed network for the flood engine: every peer relays the block to its neighbours on its first copy
+FLOOD_LINKS = {(0, 1): 10.0, (0, 2): 1.0, (2, 1): 2.0, (1, 3): 1.5, (2, 3): 7.0, (3, 4): 0.25, (1, 4): 3.0}
+
+class FloodDelays:
+    def __init__(self):
+        self.links = [(s, r) for s, r in FLOOD_LINKS] + [(r, s) for s, r in FLOOD_LINKS]
+        self.index = {link: i for i, link in enumerate(self.links)}
+
+    def edge(self, s, r):
+        return self.index[(s, r)]
+
+    def sample_links(self, size):
+        return np.array([FLOOD_LINKS.get(link, FLOOD_LINKS.get(link[::-1])) for link in self.links])
+
+class FloodPeer:
+    def __init__(self, node, engine):
+        self.node = node
+        self.engine = engine
+        self.neighbours = []
+        self.copies = []
+        self.view = self
+
+    def knows_hash(self, _):
+        return len(self.copies) > 0
+
+    def block_arrived(self, s, blk):
+        self.copies.append((s, self.engine.env.now))
+        if len(self.copies) == 1:
+            for peer in self.neighbours:
+                if peer.node != s:
+                    self.engine.deliver_block(self.node, peer, 1, blk)
+
+def test_flood_delivers_each_block_once_at_the_first_arrival():
+    from engine import FloodEngine
+    from types import SimpleNamespace
+    env = simpy.Environment()
+    engine = FloodEngine(env, FloodDelays())
+    peers = [FloodPeer(node, engine) for node in range(5)]
+    for s, r in FLOOD_LINKS:
+        peers[s].neighbours.append(peers[r])
+        peers[r].neighbours.append(peers[s])
+    blk = SimpleNamespace(short_id=1, get_id=lambda: "blk")
+    env.run(until=5)
+    peers[0].copies.append((None, env.now)) # the miner has the block and sends it to its neighbours
+    for peer in peers[0].neighbours:
+        engine.deliver_block(0, peer, 1, blk)
+    env.run()
+
+    # arrival of every other peer is the minimum over its neighbours of their arrival plus the link delay
+    arrival = [5.0] + [np.inf]*4
+    for _ in range(len(peers)):
+        for (s, r), delay in FLOOD_LINKS.items():
+            arrival[r] = min(arrival[r], arrival[s] + delay)
+            arrival[s] = min(arrival[s], arrival[r] + delay)
+    assert [len(peer.copies) for peer in peers] == [1]*5
+    assert [peer.copies[0][1] for peer in peers] == arrival
+    assert [peer.copies[0][0] for peer in peers[1:]] == [2, 0, 1, 3]
+    assert not engine.floods
+
+### mempool
+
+def test_mempool_evicts_the_oldest_when_full():
+    pool = Mempool(capacity=3)
+    for serial in range(5):
+        pool.add(Transaction(serial % 2, 2, 1, serial), serial)
+    assert [txn.serial for txn in pool.values()] == [2, 3, 4]
+    assert (pool.evicted, pool.expired) == (2, 0)
+    assert sorted(pool.by_sender) == [0, 1] and pool.time_of(next(iter(pool.values())).get_id()) == 2
+
+def test_mempool_drops_expired_transactions():
+    pool = Mempool(expiry=10)
+    pool.add(Transaction(0, 1, 1, 0), 0)
+    pool.add(Transaction(0, 1, 2, 1), 5)
+    pool.add(Transaction(1, 0, 3, 2), 12)
+    assert [txn.serial for txn in pool.values()] == [1, 2]
+    assert (pool.evicted, pool.expired) == (0, 1) and pool.min_amount[0] == 2
+
+def test_mempool_select_matches_an_arrival_order_scan():
+    rng = np.random.default_rng(5)
+    pool = Mempool()
+    for serial in range(300):
+        sender, receiver = rng.choice(8, 2, replace=False).tolist()
+        pool.add(Transaction(sender, receiver, float(rng.integers(1, 40)), serial), serial)
+    balances = rng.integers(0, 60, 8).astype(float)
+    exclude = {txn.get_id() for txn in list(pool.values())[::7]}
+    # the picks of Block.add_txn over the whole pool: one scan in arrival order over the running balances
+    expected, running = [], balances.copy()
+    for txn in pool.values():
+        if len(expected) < 20 and txn.get_id() not in exclude and running[txn.sender] >= txn.amount:
+            expected.append(txn)
+            running[txn.sender] -= txn.amount
+            running[txn.receiver] += txn.amount
+    assert pool.select(balances, 20, exclude) == expected
+    assert pool.select(balances, 3) == pool.select(balances, 20)[:3]
+
+### mining
+
+# node of the race recording the times of the blocks it wins
+class RaceNode:
+    def __init__(self, env, power):
+        self.env = env
+        self.fraction_hashing_power = power
+        self.wins = []
+
+    def win_block(self):
+        self.wins.append(self.env.now)
+
+def test_scheduler_matches_the_block_interval_and_the_hashing_power():
+    from mining import MiningScheduler
+    from streams import RandomStreams
+    env = simpy.Environment()
+    power = [0.05, 0.15, 0.3, 0.5]
+    nodes = [RaceNode(env, h) for h in power]
+    scheduler = MiningScheduler(env, nodes, 600, RandomStreams(11).stream("mining"))
+    env.process(scheduler.run())
+    env.run(until=600*20000)
+    times = np.sort(np.concatenate([node.wins for node in nodes]))
+    gaps = np.diff(np.concatenate(([0.0], times)))
+    # exponential gaps with the mean of the whole network, about 20000 of them so the mean is within 0.7% per sigma
+    assert abs(gaps.mean()/600 - 1) < 0.04 and abs(gaps.std()/gaps.mean() - 1) < 0.04
+    shares = np.array([len(node.wins) for node in nodes])/len(times)
+    assert np.abs(shares - power).max() < 0.015
+    assert scheduler.blocks_won.tolist() == [len(node.wins) for node in nodes]
+
+    # the shares follow a change of the hashing power once the scheduler reads it again
+    for node, h in zip(nodes, power[::-1]):
+        node.fraction_hashing_power, node.wins = 2*h, []
+    scheduler.update_power()
+    env.run(until=env.now + 300*20000)
+    shares = np.array([len(node.wins) for node in nodes])/sum(len(node.wins) for node in nodes)
+    assert np.abs(shares - power[::-1]).max() < 0.015
+    assert abs(scheduler.mean - 300) < 1e-9
+
+def test_only_the_attackers_with_a_release_policy_can_be_created():
+    from peer import Attacker, SelfishMiner, StubMiner
+    with pytest.raises(TypeError):
+        Attacker(0, 500, 1, simpy.Environment(), None, None, None)
+    assert not SelfishMiner.__abstractmethods__ and not StubMiner.__abstractmethods__
+
+### event log and trace
+
+def test_binary_event_log_reads_back(tmp_path):
+    path = str(tmp_path / "log.bin")
+    log = EventLog("debug", path, "binary")
+    blk, txn = "ab"*32, "cd"*32
+    log.emit(eventlog.PEERS, 0.0, 3, [1, 5])
+    log.emit(eventlog.MINED, 12.5, blk, 3, [txn, blk], 17.25)
+    log.emit(eventlog.BALANCES, 13.0, 3, [1.5, -2.0])
+    log.close()
+    assert list(eventlog.read_binary(path)) == [
+        ("peers", 0.0, {"node": 3, "peers": [1, 5]}),
+        ("mined", 12.5, {"blk": blk, "node": 3, "txns": [txn, blk], "money": 17.25}),
+        ("balances", 13.0, {"node": 3, "amounts": [1.5, -2.0]}),
+    ]
+
+def test_event_log_levels_filter_the_categories():
+    log = EventLog("info,txn=debug,attacker=off")
+    assert log.on[eventlog.TXN_CREATED] and log.on[eventlog.FORK]
+    assert not log.on[eventlog.BLK_RECV] and not log.on[eventlog.ADV_RELEASE]
+
+def test_trace_reads_back_the_records(tmp_path):
+    writer = TraceWriter()
+    writer.open(str(tmp_path / "tr"))
+    writer.record(eventtrace.TXN, 1.0, 2, 0, 3, 4.5)
+    writer.record(eventtrace.MINED, 2.0, 2, 1, 0, 1)
+    writer.record(eventtrace.RECEIVED, 3.0, 5, 1, 2, 1)
+    writer.record(eventtrace.MINED, 4.0, 5, 2, 0, 0)
+    writer.record(eventtrace.RECEIVED, 5.0, 5, 1, 4, 0) # a second copy, not added
+    writer.close()
+    trace = Trace(str(tmp_path / "tr"))
+    assert len(trace) == 5 and trace.counts()["mined"] == 2
+    assert trace.time.tolist() == [1.0, 2.0, 3.0, 4.0, 5.0] and trace.value[0] == 4.5
+    assert trace.parent.tolist() == [-1, 0, 0] and trace.height.tolist() == [0, 1, 1]
+    blocks, times = trace.arrivals(5)
+    assert blocks.tolist() == [0, 1, 2] and times.tolist() == [0.0, 3.0, 4.0]
+    assert trace.head(5) == 2 and trace.head(5, 3.5) == 1 and trace.tree(5) == [(0, 1), (0, 2)]
+
+### simulator
+
+# small network of n honest peers with a simulation time of simtime
+def make_network(n=10, simtime=5000, seed=3, add_malicious=False):
+    from graph import Graph, Dict2Class
+    import peer
+    args = Dict2Class({"z0": 0.5, "z1": 0.5, "n": n, "simtime": simtime, "topology": "regular", "seed": seed})
+    peer.TOTAL_NODES = n
+    graph = Graph(args)
+    graph.create_graph(add_malicious=add_malicious, zeta=3 if add_malicious else 0)
+    return args, graph
+
+def test_simulators_in_one_process_are_independent(tmp_path):
+    from simulator import Simulator
+    from eventlog import EventLog
+    args, graph = make_network()
+    sims = [Simulator(args, graph, mining="scheduler", log=EventLog("info", str(tmp_path / f"log{i}.txt"))) for i in range(2)]
+    for sim in sims:
+        sim.start_simulation()
+        sim.log.close()
+    first, second = sims
+    assert first.serials.next_serial == second.serials.next_serial > 0
+    assert [elem.chain_head for elem in first.peer_list] == [elem.chain_head for elem in second.peer_list]
+    logs = [(tmp_path / f"log{i}.txt").read_text() for i in range(2)]
+    assert logs[0] and logs[0] == logs[1]
+
+@pytest.mark.parametrize("mining", ["process", "scheduler"])
+@pytest.mark.parametrize("malicious_type", [None, 0, 1])
+def test_callback_engine_matches_the_process_engine(tmp_path, mining, malicious_type):
+    from simulator import Simulator
+    add_malicious = malicious_type is not None
+    args, graph = make_network(simtime=8000, add_malicious=add_malicious)
+    options = {"add_malicious": add_malicious, "mining": mining, "log": EventLog("off")}
+    if add_malicious:
+        options.update(malicious_type=malicious_type, malicious_power=0.3)
+    sims = [Simulator(args, graph, engine=engine, events_path=str(tmp_path / f"{engine}.bin"), **options) for engine in ["process", "callback"]]
+    for sim in sims:
+        sim.start_simulation()
+    process, callback = sims
+    assert callback.store.num_mined() == process.store.num_mined() > 0
+    assert callback.summary() == process.summary()
+    for a, b in zip(callback.peer_list, process.peer_list):
+        assert (a.chain_head, a.chain_height) == (b.chain_head, b.chain_height)
+        assert a.view.known_blocks().tolist() == b.view.known_blocks().tolist()
+        assert a.view.arrival[a.view.known_blocks()].tolist() == b.view.arrival[b.view.known_blocks()].tolist()
+
+def test_released_attacker_chain_is_accepted_by_the_honest_peers():
+    from simulator import Simulator
+    args, graph = make_network(add_malicious=True)
+    sim = Simulator(args, graph, add_malicious=True, mining="scheduler", malicious_type=0, log=EventLog("off"), events_path=None)
+    honest, adv = sim.peer_list[:-1], sim.peer_list[-1]
+    honest[0].win_block() # coins for node 0
+    sim.env.run(until=5000)
+    honest[0].generate_txn(1, 30)
+    sim.env.run(until=10000)
+
+    # the attacker confirms the txn in a private chain of two blocks and an honest block confirms it on the public
+    # chain, so the first private block spends the coins again over the balances of the honest chain head
+    adv.win_block()
+    adv.win_block()
+    private = [blk.get_id() for blk in adv.private_block_chain]
+    honest[2].win_block()
+    sim.env.run(until=15000) # the honest block reaches the attacker, which releases its lead of one
+    txn = honest[0].txn_list[0].get_id()
+    assert all(txn in sim.store.block(sim.store.index(blk)).txn_ids for blk in [private[0], honest[2].gen_block_hashes[0]])
+    assert not adv.private_block_chain and sim.peer_list[0].chain_height == 3
+    for elem in sim.peer_list:
+        assert elem.chain_head == adv.chain_head == private[-1]
+        assert elem.amount_list.tolist() == adv.amount_list.tolist()
+    assert adv.amount_list[[0, 1, adv.node]].tolist() == [20, 30, 100]
+    assert sim.summary()["adversary_in_main"] == 2
+
+def test_resumed_run_writes_the_attacker_events_of_an_uninterrupted_run(tmp_path):
+    from simulator import Simulator
+    from eventlog import EventLog
+    from attackerlog import AttackerRecorder, RECORD
+    args, graph = make_network(simtime=20000, add_malicious=True)
+
+    # attacker with a small ring, so the file is appended to several times before and after the checkpoint
+    def attacked_sim(events):
+        sim = Simulator(args, graph, add_malicious=True, malicious_power=0.4, mining="scheduler", log=EventLog("off"), events_path=str(events))
+        sim.peer_list[-1].recorder = AttackerRecorder(str(events), size=8)
+        return sim
+
+    attacked_sim(tmp_path / "whole.bin").start_simulation()
+    expected = (tmp_path / "whole.bin").read_bytes()
+    checkpoint = str(tmp_path / "checkpoint.npz")
+    attacked_sim(tmp_path / "resumed.bin").start_simulation([8000], checkpoint)
+    attacked_sim(tmp_path / "resumed.bin").resume(checkpoint) # the file holds the whole first run at this point
+    assert len(expected) > 16*RECORD.itemsize
+    assert (tmp_path / "resumed.bin").read_bytes() == expected
+
+def test_resumed_run_matches_an_uninterrupted_run(tmp_path):
+    from simulator import Simulator
+    args, graph = make_network(simtime=15000, add_malicious=True)
+
+    def attacked_sim(name):
+        return Simulator(args, graph, add_malicious=True, malicious_power=0.3, mining="scheduler", malicious_type=0,
+                         log=EventLog("off"), events_path=str(tmp_path / f"{name}.bin"))
+
+    whole = attacked_sim("whole")
+    whole.start_simulation()
+    checkpoint = str(tmp_path / "checkpoint_{time}.npz")
+    attacked_sim("first").start_simulation([6000], checkpoint) # runs on to the end after the checkpoint
+    resumed = attacked_sim("resumed")
+    resumed.resume(checkpoint.format(time=6000))
+    assert resumed.serials.next_serial == whole.serials.next_serial
+    assert resumed.summary() == whole.summary()
+    assert resumed.store.size == whole.store.size
+    assert [resumed.store.block(idx).get_id() for idx in range(resumed.store.size)] == [whole.store.block(idx).get_id() for idx in range(whole.store.size)]
+    for a, b in zip(resumed.peer_list, whole.peer_list):
+        assert (a.chain_head, a.chain_height) == (b.chain_head, b.chain_height)
+        assert a.view.known_blocks().tolist() == b.view.known_blocks().tolist()
+        assert a.view.arrival[a.view.known_blocks()].tolist() == b.view.arrival[b.view.known_blocks()].tolist()
+        assert a.amount_list.tolist() == b.amount_list.tolist()
+        assert [txn.serial for txn in a.mempool.values()] == [txn.serial for txn in b.mempool.values()]
+    adv, ref = resumed.peer_list[-1], whole.peer_list[-1]
+    assert [blk.get_id() for blk in adv.private_block_chain] == [blk.get_id() for blk in ref.private_block_chain]
+    assert adv.gen_block_hashes == ref.gen_block_hashes
+
+def test_checkpoints_without_the_scheduler_fail_at_parsing(monkeypatch, capsys):
+    import main
+    monkeypatch.setattr("sys.argv", ["main.py", "--checkpoint_every", "1000"])
+    with pytest.raises(SystemExit):
+        main.fetch_args()
+    assert "--mining scheduler" in capsys.readouterr().err
+    monkeypatch.setattr("sys.argv", ["main.py", "--checkpoint_every", "1000", "--mining", "scheduler"])
+    assert main.fetch_args().checkpoint_every == 1000
+
+def test_branches_continue_the_attacker_events_of_the_warm_up(tmp_path):
+    from simulator import Simulator
+    from branch import run_branches, checkpoint_branches, branch_events
+    from attackerlog import AttackerRecorder
+    args, graph = make_network(simtime=12000, add_malicious=True)
+
+    def attacked_sim(events):
+        sim = Simulator(args, graph, add_malicious=True, malicious_power=0.4, mining="scheduler", malicious_type=0,
+                        log=EventLog("off"), events_path=str(events))
+        sim.peer_list[-1].recorder = AttackerRecorder(str(events), size=8)
+        return sim
+
+    attacked_sim(tmp_path / "whole.bin").start_simulation()
+    expected = (tmp_path / "whole.bin").read_bytes()
+    # the variant keeps the attacker of the warm-up, so every branch is the uninterrupted run
+    variants = [{"malicious_type": 0, "malicious_power": 0.4}]*2
+    workdir = str(tmp_path / "fork_{index}")
+    run_branches(attacked_sim(tmp_path / "warmup.bin"), 5000, variants, workdir=workdir)
+    assert all(open(branch_events(workdir, index), "rb").read() == expected for index in range(2))
+    warm = attacked_sim(tmp_path / "warmup2.bin")
+    warm.start_processes()
+    warm.env.run(until=5000)
+    workdir = str(tmp_path / "resume_{index}")
+    checkpoint_branches(warm, variants, lambda sim: None, workdir, lambda: attacked_sim(tmp_path / "unused.bin"))
+    assert all(open(branch_events(workdir, index), "rb").read() == expected for index in range(2))
+
+def test_forked_branches_match_the_checkpoint_branches(tmp_path):
+    from simulator import Simulator
+    from branch import fork_branches, checkpoint_branches, branch_events
+    args, graph = make_network(simtime=12000, add_malicious=True)
+
+    def attacked_sim():
+        return Simulator(args, graph, add_malicious=True, malicious_power=0.3, mining="scheduler", malicious_type=0,
+                         log=EventLog("off"), events_path=str(tmp_path / "warmup.bin"))
+
+    def result(sim):
+        return {"summary": sim.summary(), "serial": sim.serials.next_serial, "heads": [elem.chain_head for elem in sim.peer_list],
+                "blocks": [sim.store.block(idx).get_id() for idx in range(sim.store.size)]}
+
+    def warm_up():
+        sim = attacked_sim()
+        sim.start_processes()
+        sim.env.run(until=5000)
+        return sim
+
+    # the variants switch the strategy and the hashing power of the attacker
+    variants = [{"malicious_type": 1, "malicious_power": 0.2}, {"malicious_type": 0, "malicious_power": 0.45}]
+    forked = fork_branches(warm_up(), variants, result, str(tmp_path / "fork_{index}"), 2)
+    resumed = checkpoint_branches(warm_up(), variants, result, str(tmp_path / "resume_{index}"), attacked_sim)
+    assert forked == resumed and forked[0] != forked[1]
+    for index in range(2):
+        fork_events = open(branch_events(str(tmp_path / "fork_{index}"), index), "rb").read()
+        assert fork_events and fork_events == open(branch_events(str(tmp_path / "resume_{index}"), index), "rb").read()
+
+def test_trace_replays_the_trees_of_the_peers(tmp_path):
+    from simulator import Simulator
+    args, graph = make_network()
+    trace = TraceWriter()
+    trace.open(str(tmp_path / "tr"))
+    sim = Simulator(args, graph, mining="scheduler", log=EventLog("off"), trace=trace)
+    sim.start_simulation()
+    trace.close()
+    replay = Trace(str(tmp_path / "tr"))
+    for elem in sim.peer_list:
+        blocks, times = replay.arrivals(elem.node)
+        known = elem.view.known_blocks()
+        assert blocks.tolist() == known.tolist() and times.tolist() == elem.view.arrival[known].tolist()
+        assert replay.head(elem.node) == sim.store.index(elem.chain_head)
+
+def test_npz_trees_match_the_text_output(tmp_path, monkeypatch):
+    from simulator import Simulator
+    from output import TreeOutput
+    args, graph = make_network()
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "peer_outputs").mkdir()
+    sim = Simulator(args, graph, mining="scheduler", log=EventLog("off"))
+    sim.start_simulation()
+    sim.print_all_peer_output()
+    sim.write_outputs("trees.npz")
+    trees = TreeOutput("trees.npz")
+    for elem in sim.peer_list:
+        assert trees.tree(elem.node) == (tmp_path / "peer_outputs" / f"peer_{elem.node}.txt").read_text()
+
+def test_sweep_reuses_the_cached_results_until_a_parameter_changes(tmp_path):
+    from sweep import run_sweep
+    base = {"n": 10, "simtime": 2000, "mining": "scheduler"}
+    cache = str(tmp_path / "cache")
+    rows, computed = run_sweep({"seed": [1, 2]}, base, 2, cache)
+    assert computed == 2 and all(result["blocks_mined"] > 0 for _, result in rows)
+    again, computed = run_sweep({"seed": [2, 1]}, base, 2, cache)
+    assert computed == 0 and again == rows[::-1]
+    changed, computed = run_sweep({"seed": [1, 2]}, dict(base, simtime=3000), 2, cache)
+    assert computed == 2 and [config["simtime"] for config, _ in changed] == [3000, 3000]
+    rows, computed = run_sweep({"seed": [1, 2, 3]}, base, 2, cache)
+    assert computed == 1 and rows[2][0]["seed"] == 3
+
+### replicas
+
+def test_replica_txn_distances_match_floyd_warshall():
+    from replicas import ReplicaEngine
+    args, graph = make_network(n=12)
+    engine = ReplicaEngine(graph, 3, 1000, seed=4)
+    targets = np.array([0, 5, 11])
+    dist = engine.txn_distances(targets)
+    weight = engine.rho + engine.d_mean + engine.inv_link_speed
+    for r, target in enumerate(targets.tolist()):
+        full = np.full((12, 12), np.inf)
+        np.fill_diagonal(full, 0)
+        full[engine.src, engine.dst] = weight[r]
+        for k in range(12):
+            full = np.minimum(full, full[:, k:k+1] + full[k:k+1, :])
+        assert np.allclose(dist[r], full[:, target])
+
+def test_replica_engine_rejects_the_attacker():
+    from replicas import ReplicaEngine
+    args, graph = make_network(add_malicious=True)
+    with pytest.raises(Exception, match="honest"):
+        ReplicaEngine(graph, 2, 1000)
+    with pytest.raises(Exception, match="honest"):
+        ReplicaEngine(make_network()[1], 2, 1000, add_malicious=True)
+
+def test_replica_heads_match_the_accept_order():
+    from replicas import ReplicaEngine
+    args, graph = make_network(n=12)
+    engine = ReplicaEngine(graph, 4, 8000, seed=6)
+    engine.run()
+    rng = np.random.default_rng(0)
+    nodes = rng.integers(0, 12, (4, 30))
+    times = rng.random((4, 30))*8000
+    heads = engine.heads_at(nodes, times)
+    for r in range(4):
+        for node, tm, head in zip(nodes[r].tolist(), times[r].tolist(), heads[r].tolist()):
+            # scan the accepted blocks in accept order, the head moves to a strictly taller block
+            best = 0
+            for b in np.argsort(engine.known[r, :engine.size, node], kind="stable").tolist():
+                if engine.known[r, b, node] <= tm and engine.height[r, b] > engine.height[r, best]:
+                    best = b
+            assert head == best
+
+### parallel
+
+def test_cut_distances_match_a_path_search():
+    from partition import cut_distances
+    rng = np.random.default_rng(5)
+    n = 30
+    src, dst = rng.integers(0, n, 120), rng.integers(0, n, 120)
+    order = np.argsort(src, kind="stable")
+    src, dst, weight = src[order], dst[order], rng.random(120)*10
+    indptr = np.searchsorted(src, np.arange(n+1))
+    part = rng.integers(0, 3, n)
+    dist = cut_distances(indptr, dst, weight, part)
+    full = np.full((n, n), np.inf)
+    np.fill_diagonal(full, 0)
+    np.minimum.at(full, (src, dst), weight)
+    for k in range(n):
+        full = np.minimum(full, full[:, k:k+1] + full[k:k+1, :])
+    cross = part[src] != part[dst]
+    for v in range(n):
+        # shortest path to the sender of a link leaving the part of v, plus that link
+        paths = full[v, src[cross]] + weight[cross]
+        best = np.inf if not len(paths) else paths[part[src[cross]] == part[v]].min(initial=np.inf)
+        assert np.isclose(dist[v], best) or dist[v] == best == np.inf
+
+def test_parallel_run_matches_the_sequential_run(tmp_path):
+    from simulator import Simulator
+    from parallel import ParallelSimulator
+    args, graph = make_network(n=16, simtime=4000, add_malicious=True)
+    options = {"add_malicious": True, "malicious_power": 0.3, "seed": 2}
+    seq = Simulator(args, graph, mining="scheduler", log=EventLog("off"), events_path=str(tmp_path / "seq.bin"), **options)
+    seq.start_simulation()
+    par = ParallelSimulator(args, graph, 2, log=EventLog("off"), events_path=str(tmp_path / "par.bin"), **options)
+    try:
+        par.start_simulation()
+        assert par.summary() == seq.summary()
+        assert par.store.num_mined() == seq.store.num_mined() > 0
+    finally:
+        par.close()
+    assert (tmp_path / "par.bin").read_bytes() == (tmp_path / "seq.bin").read_bytes()
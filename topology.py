@@ -0,0 +1,177 @@
+### vectorized generators of connected network topologies with bounded node degrees
+
+import numpy as np
+
+MIN_DEGREE = 4 # minimum number of neighbours of a node
+MAX_DEGREE = 8 # maximum number of neighbours of a node
+TARGET_DEGREE = 6 # average degree the generators aim for before the repair
+WS_REWIRE = 0.1 # probability of rewiring an edge in the Watts-Strogatz generator
+GEO_NEIGHBOURS = 4 # nearest neighbours linked by every node in the geographic generator
+
+# canonical undirected edges (u < v) without self loops and duplicates, as an (m, 2) array
+def normalize(n, edges):
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    edges = np.sort(edges[edges[:, 0] != edges[:, 1]], axis=1)
+    keys = np.unique(edges[:, 0]*n + edges[:, 1])
+    return np.stack((keys//n, keys%n), axis=1)
+
+# number of neighbours of every node
+def degrees(n, edges):
+    return np.bincount(edges.ravel(), minlength=n)
+
+# component label of every node (the smallest node id of its component)
+def components(n, edges):
+    labels = np.arange(n)
+    u, v = edges[:, 0], edges[:, 1]
+    while True:
+        new = labels.copy()
+        np.minimum.at(new, u, labels[v])
+        np.minimum.at(new, v, labels[u])
+        new = new[new] # pointer jumping to shorten the chains
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+# ring lattice where every node is linked to its k next nodes
+def ring_lattice(n, k):
+    nodes = np.arange(n)
+    return np.concatenate([np.stack((nodes, (nodes+j)%n), axis=1) for j in range(1, k+1)])
+
+# ring plus random perfect matchings, close to a random regular graph of the target degree
+def random_regular(n, rng, degree=TARGET_DEGREE):
+    edges = [ring_lattice(n, 1)] # the ring keeps the graph connected
+    for _ in range(degree-2):
+        perm = rng.permutation(n)
+        edges.append(perm[:n - n%2].reshape(-1, 2))
+    return np.concatenate(edges)
+
+# ring lattice with the far endpoint of the non ring edges rewired with probability beta
+def watts_strogatz(n, rng, degree=TARGET_DEGREE, beta=WS_REWIRE):
+    edges = ring_lattice(n, degree//2)
+    rewire = (rng.random(len(edges)) < beta) & (np.arange(len(edges)) >= n) # the first n edges are the ring
+    edges[rewire, 1] = rng.integers(0, n, int(rewire.sum()))
+    return edges
+
+# nodes placed uniformly on the unit torus, each linked to its k nearest neighbours
+def geographic(n, rng, k=GEO_NEIGHBOURS):
+    pos = rng.random((n, 2))
+    side = max(1, int(np.sqrt(n/2))) # about two nodes per grid cell
+    cell_xy = np.minimum((pos*side).astype(np.int64), side-1)
+    cell = cell_xy[:, 0]*side + cell_xy[:, 1]
+    order = np.argsort(cell, kind="stable")
+    counts = np.bincount(cell, minlength=side*side)
+    start = np.concatenate(([0], np.cumsum(counts)))
+    width = int(counts.max())
+    # members of every cell padded with -1 to the largest occupancy
+    slots = np.arange(n) - start[cell[order]]
+    members = np.full((side*side, width), -1, dtype=np.int64)
+    members[cell[order], slots] = order
+    # candidates are the nodes of the 3x3 block of cells around the node
+    cand = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            other = ((cell_xy[:, 0]+dx)%side)*side + (cell_xy[:, 1]+dy)%side
+            cand.append(members[other])
+    cand = np.concatenate(cand, axis=1)
+    diff = np.abs(pos[:, None, :] - pos[np.maximum(cand, 0)])
+    diff = np.minimum(diff, 1-diff) # distance on the torus
+    dist = (diff**2).sum(axis=2)
+    dist[(cand < 0) | (cand == np.arange(n)[:, None])] = np.inf
+    k = min(k, cand.shape[1]-1)
+    nearest = np.argpartition(dist, k, axis=1)[:, :k]
+    near = np.take_along_axis(cand, nearest, axis=1)
+    valid = np.take_along_axis(dist, nearest, axis=1) < np.inf
+    src = np.repeat(np.arange(n), k).reshape(n, k)
+    return np.stack((src[valid], near[valid]), axis=1)
+
+GENERATORS = {"regular": random_regular, "ws": watts_strogatz, "geo": geographic}
+
+# a simple graph of n nodes can only have every degree in [low, high] if there are more than low nodes
+def check_size(n, low=MIN_DEGREE, high=MAX_DEGREE):
+    if n <= low or high < low:
+        raise ValueError(f"{n} nodes cannot all have between {low} and {high} neighbours")
+
+# bring every degree into [low, high] and join the components, the generators leave only a few nodes to fix
+def repair(n, edges, rng, low=MIN_DEGREE, high=MAX_DEGREE):
+    check_size(n, low, high)
+    edges = normalize(n, edges)
+    deg = degrees(n, edges)
+
+    # drop random edges of the nodes above the maximum whose other endpoint can spare one
+    if (deg > high).any():
+        keep = np.ones(len(edges), dtype=bool)
+        for node in np.flatnonzero(deg > high):
+            incident = np.flatnonzero(((edges[:, 0] == node) | (edges[:, 1] == node)) & keep)
+            for e in rng.permutation(incident):
+                if deg[node] <= high:
+                    break
+                other = edges[e, 0] + edges[e, 1] - node
+                if deg[other] > low:
+                    keep[e] = False
+                    deg[node] -= 1
+                    deg[other] -= 1
+        edges = edges[keep]
+
+    # link the nodes below the minimum to random nodes that still have room
+    extra = []
+    linked = set((edges[:, 0]*n + edges[:, 1]).tolist()) if (deg < low).any() else set()
+    room = np.flatnonzero(deg < high) # candidates, checked again when drawn since their degree grows
+    for node in np.flatnonzero(deg < low):
+        misses = 0 # draws in a row that could not be linked
+        while deg[node] < low:
+            if misses < len(room):
+                other = int(room[rng.integers(len(room))])
+            else:
+                # the draws keep missing, pick among the candidates that can still take the link
+                free = room[(room != node) & (deg[room] < high)]
+                free = free[[min(node, o)*n + max(node, o) not in linked for o in free.tolist()]]
+                if not len(free):
+                    raise ValueError(f"Node {node} cannot get {low} neighbours, every other node is full or already linked to it")
+                other = int(free[rng.integers(len(free))])
+            key = min(node, other)*n + max(node, other)
+            if other == node or deg[other] >= high or key in linked:
+                misses += 1
+                continue
+            misses = 0
+            linked.add(key)
+            extra.append((node, other))
+            deg[node] += 1
+            deg[other] += 1
+    if extra:
+        edges = np.concatenate((edges, np.array(extra, dtype=np.int64)))
+
+    # join every smaller component to the largest one through nodes that have room
+    labels = components(n, edges)
+    roots, sizes = np.unique(labels, return_counts=True)
+    if len(roots) > 1:
+        main = roots[np.argmax(sizes)]
+        extra = []
+        for root in roots[roots != main]:
+            inside = np.flatnonzero((labels == root) & (deg < high))
+            outside = np.flatnonzero((labels == main) & (deg < high))
+            if not len(inside) or not len(outside):
+                raise ValueError(f"Cannot join the component of node {root}, every node on one side has {high} neighbours")
+            a, b = int(rng.choice(inside)), int(rng.choice(outside))
+            extra.append((a, b))
+            deg[a] += 1
+            deg[b] += 1
+            labels[labels == root] = main
+        edges = np.concatenate((edges, np.array(extra, dtype=np.int64)))
+    return normalize(n, edges)
+
+# check that the graph is connected, simple and every degree is in [low, high]
+def validate(n, edges, low=MIN_DEGREE, high=MAX_DEGREE):
+    deg = degrees(n, edges)
+    if deg.min() < low or deg.max() > high:
+        raise Exception(f"Node degrees in [{deg.min()}, {deg.max()}] outside [{low}, {high}]")
+    if (edges[:, 0] >= edges[:, 1]).any() or len(np.unique(edges[:, 0]*n + edges[:, 1])) != len(edges):
+        raise Exception("Graph has self loops or duplicate edges")
+    if (components(n, edges) != 0).any():
+        raise Exception("Graph is not connected")
+
+# connected graph of n nodes with degrees in [MIN_DEGREE, MAX_DEGREE] drawn by the named generator
+def generate(n, kind, rng):
+    check_size(n)
+    edges = repair(n, GENERATORS[kind](n, rng), rng)
+    validate(n, edges)
+    return edges
@@ -0,0 +1,48 @@
+### single poisson source generating the transactions of all the nodes
+
+TXN_BATCH = 1024 # number of transactions drawn at once
+
+# Class generating the transactions of every node from one superposed arrival process
+class TransactionSource:
+    def __init__(self, env, peers, mean, max_coin, rng, batch=TXN_BATCH):
+        self.env = env
+        self.rng = rng # numpy generator of the transaction stream
+        self.peers = peers
+        self.mean = mean/len(peers) # N independent poisson sources of mean `mean` merge into one with N times the rate
+        self.max_coin = max_coin
+        self.batch = batch
+        self.created = 0 # number of transactions created so far
+        self.gaps, self.senders, self.receivers, self.amounts = [], [], [], [] # current batch
+        self.pos = 0 # position of the next transaction in the batch
+        self.wakeup = None # pending event of the next transaction
+
+    # draw the gaps, senders, receivers and amounts of the next batch of transactions
+    def draw_batch(self):
+        n = len(self.peers)
+        gaps = self.rng.exponential(self.mean, self.batch)
+        senders = self.rng.integers(0, n, self.batch)
+        receivers = self.rng.integers(0, n-1, self.batch)
+        receivers += receivers >= senders # uniform over every node except the sender
+        amounts = self.rng.random(self.batch)*self.max_coin
+        return gaps.tolist(), senders.tolist(), receivers.tolist(), amounts.tolist()
+
+    # process emitting the transactions, a resumed source first waits for the restored wakeup event
+    def run(self, wakeup=None):
+        if wakeup is not None:
+            self.wakeup = wakeup
+            yield wakeup
+            self.emit()
+        while True:
+            if self.pos == len(self.gaps):
+                self.gaps, self.senders, self.receivers, self.amounts = self.draw_batch()
+                self.pos = 0
+            self.wakeup = self.env.timeout(self.gaps[self.pos])
+            yield self.wakeup
+            self.emit()
+
+    # create the next transaction of the batch
+    def emit(self):
+        pos = self.pos
+        self.pos += 1
+        self.peers[self.senders[pos]].generate_txn(self.receivers[pos], self.amounts[pos])
+        self.created += 1